@@ -0,0 +1,305 @@
+#!/usr/bin/env python
+"""
+Compares two installs of the same codecs (e.g. the current PyAMF release and
+a candidate) on the AMFBench matrix.
+
+An interpreter can only import one C{pyamf}, so each side runs C{mark.py} in
+its own subprocess, either under a different interpreter (e.g. a virtualenv)
+or with a directory put at the front of C{sys.path}. The sides alternate over
+C{--rounds} rounds (A B, B A, A B, ...) so that drift in the machine affects
+both equally, and the samples of every round are pooled for each cell.
+
+The speed-up of a cell is C{median(A) / median(B)}, so above 1 means B is
+faster. Its confidence interval comes from L{store.bootstrap_ratio} and its
+p-value from L{store.mann_whitney}.
+"""
+
+import os
+import os.path
+import sys
+import subprocess
+import tempfile
+import cPickle as pickle
+from optparse import OptionParser
+
+from amfbench import codec, builder, timer, store
+
+
+mark_script = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+    'mark.py')
+
+
+def get_side(spec):
+    """
+    Works out how to run one side of the comparison.
+
+    @param spec: A Python interpreter, a virtualenv (a directory containing
+        C{bin/python}) or a directory to put at the front of C{sys.path}.
+    @return: A tuple of the interpreter and the directory to add to
+        C{PYTHONPATH} (or C{None}).
+    @raise ValueError: C{spec} is none of these.
+    """
+    if os.path.isfile(spec) and os.access(spec, os.X_OK):
+        return os.path.abspath(spec), None
+
+    if os.path.isdir(spec):
+        python = os.path.join(spec, 'bin', 'python')
+
+        if os.path.isfile(python) and os.access(python, os.X_OK):
+            return os.path.abspath(python), None
+
+        return sys.executable, os.path.abspath(spec)
+
+    raise ValueError('%r is not an interpreter or a directory' % (spec,))
+
+
+def run_side(side, args):
+    """
+    Runs C{mark.py} with C{args} for C{side} (see L{get_side}).
+
+    @return: The unpickled results.
+    @raise RuntimeError: C{mark.py} failed.
+    """
+    python, path = side
+    env = os.environ.copy()
+
+    if path:
+        env['PYTHONPATH'] = os.pathsep.join([path] + [p for p in
+            env.get('PYTHONPATH', '').split(os.pathsep) if p])
+
+    fd, output = tempfile.mkstemp(suffix='.pickle')
+    os.close(fd)
+
+    try:
+        ret = subprocess.call([python, mark_script, '-o', output] + args,
+            env=env)
+
+        if ret != 0:
+            raise RuntimeError('mark.py exited with status %d' % (ret,))
+
+        f = open(output, 'rb')
+
+        try:
+            return pickle.load(f)
+        finally:
+            f.close()
+    finally:
+        os.remove(output)
+
+
+def collect(results, cells):
+    """
+    Adds the samples and version of every cell in the C{mark.py} C{results}
+    to C{cells}, a C{dict} of C{(type, builder, encoding, size, package)} ->
+    C{{'samples': [...], 'versions': set(...)}}.
+    """
+    for type in ('decode', 'encode'):
+        for b, encodings in results.get(type, {}).iteritems():
+            for encoding, sizes in encodings.iteritems():
+                for size, packages in sizes.iteritems():
+                    for package, result in packages.iteritems():
+                        if result is None:
+                            continue
+
+                        c = cells.setdefault((type, b, encoding, size,
+                            package), {'samples': [], 'versions': set()})
+
+                        c['samples'].extend(result['samples'])
+                        c['versions'].add(result.get('version'))
+
+
+def compare(a, b, confidence=0.95, alpha=0.05, seed=None):
+    """
+    Compares the cells collected (see L{collect}) for each side.
+
+    @return: A list of C{dict}s, one per cell present on both sides.
+    """
+    ret = []
+
+    for key in sorted(set(a) & set(b)):
+        x, y = a[key]['samples'], b[key]['samples']
+
+        r = store.bootstrap_ratio(x, y, confidence, seed=seed)
+        p = store.mann_whitney(x, y)
+
+        if r is None:
+            continue
+
+        speedup, low, high = r
+
+        ret.append({
+            'cell': key,
+            'a': {
+                'median': timer.percentile(sorted(x), 50),
+                'samples': len(x),
+                'versions': sorted(a[key]['versions']),
+            },
+            'b': {
+                'median': timer.percentile(sorted(y), 50),
+                'samples': len(y),
+                'versions': sorted(b[key]['versions']),
+            },
+            'speedup': speedup,
+            'low': low,
+            'high': high,
+            'p_value': p,
+            'significant': (low > 1 or high < 1) and p is not None and
+                p < alpha,
+        })
+
+    return ret
+
+
+def parse_args(*args):
+    """
+    Parse and validate command line arguments.
+    """
+    parser = OptionParser(usage='%prog [options] --a A --b B [builder ...]',
+        description='Runs the benchmark matrix against two installs of the '
+        'codecs, A and B, in alternating subprocesses and reports the '
+        'speed-up of B over A for every cell. A and B are Python '
+        'interpreters, virtualenvs or directories to put at the front of '
+        'sys.path. Defaults to all builders.')
+
+    impl = codec.get_available_implementations()
+    amf_encodings = ('0', '3')
+
+    parser.add_option('--a', dest='a', metavar='A', help='The baseline')
+    parser.add_option('--b', dest='b', metavar='B', help='The candidate')
+    parser.add_option('-i', '--implementation', action='append', dest='impl',
+        help='Codec (or NAME:VARIANT) to compare. Choices are %r. Defaults '
+        'to all.' % (impl,))
+    parser.add_option('-e', '--encoding', action='append', dest='encodings',
+        choices=amf_encodings, help='AMF version/s. Choices are %r. Defaults '
+        'to all.' % (amf_encodings,))
+    parser.add_option('-r', '--rounds', dest='rounds', type='int', default=4,
+        help='Number of times each side is run. Default is %default')
+    parser.add_option('-n', '--iterations', dest='iterations', type='int',
+        default=5, help='Minimum number of timed calls per cell in each '
+        'round. Default is %default')
+    parser.add_option('-w', '--warmup', dest='warmup', type='int', default=1,
+        help='Number of untimed calls first. Default is %default')
+    parser.add_option('--only-decode', dest='only_decode',
+        action='store_true', help='Only compare decoding')
+    parser.add_option('--only-encode', dest='only_encode',
+        action='store_true', help='Only compare encoding')
+    parser.add_option('--mark-option', dest='mark_options', action='append',
+        default=[], metavar='OPTION', help='Pass OPTION on to mark.py, e.g. '
+        '--mark-option=--gc=disabled. May be supplied multiple times')
+    parser.add_option('-c', '--confidence', dest='confidence', type='float',
+        default=0.95, help='Confidence level of the speed-up intervals. '
+        'Default is %default')
+    parser.add_option('-a', '--alpha', dest='alpha', type='float',
+        default=0.05, help='Significance level of the Mann-Whitney U test. '
+        'Default is %default')
+    parser.add_option('--seed', dest='seed', type='int', default=None,
+        help='Seed for the bootstrap, to reproduce the intervals')
+    parser.add_option('-o', '--out', action='store', dest='output',
+        default=None, help='Also write a pickle of the comparison here')
+
+    options, args = parser.parse_args()
+
+    if not options.a or not options.b:
+        parser.error('Both --a and --b are required')
+
+    try:
+        options.sides = {
+            'a': get_side(options.a),
+            'b': get_side(options.b),
+        }
+    except ValueError, e:
+        parser.error(str(e))
+
+    for a in args:
+        if a not in builder.builders:
+            parser.error("%s is not a valid builder, choose from %r" % (
+                a, builder.builders))
+
+    if options.rounds < 1:
+        parser.error('rounds must be >= 1 (got %r)' % (options.rounds,))
+
+    if not 0 < options.confidence < 1:
+        parser.error('confidence must be between 0 and 1 (got %r)' % (
+            options.confidence,))
+
+    if options.only_decode and options.only_encode:
+        parser.error('Conflicting values: only-decode and only-encode. Please '
+            'choose one (or neither)')
+
+    mark_args = ['-n', str(options.iterations), '-w', str(options.warmup)]
+
+    for i in options.impl or []:
+        mark_args.extend(['-i', i])
+
+    for e in options.encodings or []:
+        mark_args.extend(['-e', e])
+
+    if options.only_decode:
+        mark_args.append('--only-decode')
+
+    if options.only_encode:
+        mark_args.append('--only-encode')
+
+    options.mark_args = mark_args + options.mark_options + list(args)
+
+    return options, args
+
+
+def main(*args):
+    options, args = parse_args(*args)
+
+    cells = {'a': {}, 'b': {}}
+
+    for i in xrange(options.rounds):
+        order = ('a', 'b') if i % 2 == 0 else ('b', 'a')
+
+        for side in order:
+            sys.stderr.write('round %d/%d: %s\n' % (i + 1, options.rounds,
+                side.upper()))
+
+            try:
+                results = run_side(options.sides[side], options.mark_args)
+            except RuntimeError, e:
+                sys.stderr.write('%s failed: %s\n' % (side.upper(), e))
+
+                return 2
+
+            collect(results, cells[side])
+
+    results = compare(cells['a'], cells['b'], options.confidence,
+        options.alpha, options.seed)
+
+    print 'A: %s\nB: %s' % (options.a, options.b)
+    print '%-6s %-10s %3s %8s  %-12s %-15s %10s %10s %8s %19s %8s' % ('type',
+        'builder', 'amf', 'size', 'package', 'versions', 'A(ms)', 'B(ms)',
+        'speedup', '%d%% interval' % (round(options.confidence * 100),), 'p')
+
+    for r in results:
+        type, b, encoding, size, package = r['cell']
+
+        print '%-6s %-10s %3d %8d  %-12s %-15s %10.4f %10.4f %7.3fx ' \
+            '[%7.3f, %7.3f] %8.4f%s' % (type, b, encoding, size, package,
+            '%s/%s' % (','.join(map(str, r['a']['versions'])),
+                ','.join(map(str, r['b']['versions']))),
+            r['a']['median'] * 1e3, r['b']['median'] * 1e3, r['speedup'],
+            r['low'], r['high'], r['p_value'] if r['p_value'] is not None
+            else 1, ' *' if r['significant'] else '')
+
+    print '(speedup = A / B, above 1 means B is faster; * = significant)'
+
+    if options.output:
+        f = open(options.output, 'wb')
+        pickle.dump({
+            'a': options.a,
+            'b': options.b,
+            'rounds': options.rounds,
+            'confidence': options.confidence,
+            'cells': results,
+        }, f, pickle.HIGHEST_PROTOCOL)
+        f.close()
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(*sys.argv[1:]))
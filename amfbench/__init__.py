@@ -1,19 +1,25 @@
 """
 """
 
+import os
 import os.path
 import time
 
-from amfbench import builder
+from amfbench import builder, timer, memory, amf, gcstats
+from amfbench import codec as _codec
+from amfbench import archive as _archive
 
 binaries = None
 base_path = os.path.abspath(os.path.join(
     os.path.dirname(__file__), '..', 'var'))
 
-__all__ = ['encode', 'decode', 'get_blob_filename', 'get_blobs']
+__all__ = ['encode', 'decode', 'get_stream', 'get_blob_filename',
+    'write_blob', 'pack_blob', 'get_blobs']
 
 
-def encode(codec, name, size, encoding):
+def encode(codec, name, size, encoding, policy=None, measure_memory=False,
+        cache=None, profile=None, gc_policy=None, compression=None,
+        params=None):
     """
     Uses C{name} to first generate an object graph of C{size} and then uses
     L{codec<amfbench.codec.ICodec} to generate an AMF blob for the given
@@ -22,81 +28,350 @@ def encode(codec, name, size, encoding):
     @param name: One of L{builder.builders}
     @param size: The number of objects for the builder to generate.
     @param encoding: The AMF encoding value.
-    @return: A tuple containing: the time it took C{codec} to encode the payload
-        and the number of bytes that was generated.
+    @param policy: The L{timer.Policy} that determines how many times the
+        payload is encoded.
+    @param measure_memory: If set, an additional untimed encode is made to
+        record memory usage (see L{memory.measure}) under the C{memory} key.
+    @param cache: A L{cache.PayloadCache} to take the payload from, rather
+        than building it.
+    @param profile: A L{profiler.Profiler}. If supplied, an additional
+        untimed pass profiles the encode and the result is stored under the
+        C{profile} key.
+    @param gc_policy: The L{gcstats.Policy} to time under. The collections
+        made while timing are recorded under the C{gc} key (see
+        L{gcstats.run}).
+    @param compression: A L{wire.Compression}. If supplied, the encoded blob
+        is also compressed with each of its schemes and the results are
+        stored under the C{compression} key, and the median time to decode it
+        again under C{decode_time}.
+    @param params: The builder parameters (see L{builder.build}).
+    @return: A C{dict} of timing statistics (see L{timer.summarise}) including
+        the number of bytes that was generated and the C{bytes_per_object}.
+        If an error occurred whilst
+        encoding the payload then C{None} will be the result.
     """
     if name not in builder.builders:
         raise NameError('Unknown builder %r' % (name,))
 
-    build_func = getattr(builder, name)
-    payload = build_func(size)
+    params = params or {}
+
+    if cache is not None:
+        payload = cache.get(name, size, **params)
+    else:
+        payload = builder.build(name, size, **params)
 
     amf3 = False if encoding == 0 else True
-    start = time.time()
 
     try:
-        bytes = codec.encode(payload, amf3)
-    except Exception, bytes:
-        result = None
-    else:
-        result = time.time() - start
+        (samples, bytes, warmups), gc_stats = gcstats.run(gc_policy, policy,
+            codec.encode, payload, amf3)
+
+        if measure_memory:
+            del bytes
+            bytes, mem = memory.measure(size, codec.encode, payload, amf3)
+
+        if profile is not None:
+            prof = profile.run(codec.encode, payload, amf3)
+    except Exception:
+        return None
+
+    result = timer.summarise(samples, size, len(bytes), warmups)
+    result['gc'] = gc_stats
+    result['bytes_per_object'] = float(len(bytes)) / size if size else None
+
+    if compression is not None:
+        try:
+            result['decode_time'] = compression.time(codec.decode, bytes,
+                amf3)
+        except Exception:
+            result['decode_time'] = None
+
+        result['compression'] = compression.run(bytes, size)
+
+    if measure_memory:
+        result['memory'] = mem
+
+    if profile is not None:
+        result['profile'] = prof
 
     return result
 
 
-def decode(codec, name, size, encoding):
+def iter_chunks(bytes, chunk_size, bandwidth=None):
+    """
+    Yields C{bytes} in chunks of C{chunk_size}.
+
+    @param bandwidth: If supplied, the chunks are paced to simulate arriving
+        over a link of this many bytes per second.
+    """
+    if bandwidth:
+        start = timer.clock()
+
+    for offset in xrange(0, len(bytes), chunk_size):
+        chunk = bytes[offset:offset + chunk_size]
+
+        if bandwidth:
+            wait = start + (offset + len(chunk)) / float(bandwidth) - \
+                timer.clock()
+
+            if wait > 0:
+                time.sleep(wait)
+
+        yield chunk
+
+
+def get_stream(name, size, encoding, params=None):
+    """
+    Returns the payload of C{name} and C{size} encoded (see L{amf.dumps}) as
+    consecutive top-level values, one for each element of the list, rather
+    than as a single list. Each value has its own reference tables, as if it
+    was sent as a message of its own.
+
+    The streaming decode benchmarks use this (see L{decode}): a decoder can
+    only hand over the first object of a single list once the whole list has
+    been decoded.
     """
-    Reads the Flash generated AMF blob from C{base_path} and then uses
-    L{codec<amfbench.codec.ICodec} to decode the result.
+    payload = builder.build(name, size, **(params or {}))
+    amf3 = encoding == 3
+
+    return ''.join([amf.dumps(obj, amf3) for obj in payload])
+
+
+def _stream_decoder(codec, bytes, amf3, chunk_size, bandwidth, first):
+    """
+    Returns a function that decodes C{bytes} through
+    L{amfbench.codec.decode_stream}, appending the time taken to produce the
+    first top-level object to C{first}.
+    """
+    def func():
+        start = timer.clock()
+
+        ret = []
+
+        for obj in _codec.decode_stream(codec,
+                iter_chunks(bytes, chunk_size, bandwidth), amf3):
+            if not ret:
+                first.append(timer.clock() - start)
+
+            ret.append(obj)
+
+        return ret
+
+    return func
+
+
+def _time_stream(codec, bytes, size, amf3, chunk_size, bandwidth, policy,
+        gc_policy):
+    """
+    Times decoding the separate top-level values of C{bytes} (see
+    L{get_stream}) with C{codec.decode_stream}.
+
+    @return: A C{dict} of timing statistics with the C{first_object} and
+        C{gc} keys, or C{None} if an error occurred.
+    """
+    first = []
+    func = _stream_decoder(codec, bytes, amf3, chunk_size, bandwidth, first)
+
+    try:
+        (samples, payload, warmups), gc_stats = gcstats.run(gc_policy,
+            policy, func)
+    except Exception:
+        return None
+
+    del payload
+
+    result = timer.summarise(samples, size, len(bytes), warmups)
+    result['gc'] = gc_stats
+    # drop the warmup calls
+    result['first_object'] = timer.summarise(first[-len(samples):])
+
+    return result
+
+
+def decode(codec, name, size, encoding, policy=None, measure_memory=False,
+        chunk_size=None, bandwidth=None, archive=None, profile=None,
+        gc_policy=None, params=None):
+    """
+    Reads the Flash generated AMF blob from C{base_path} (or C{archive}) and
+    then uses L{codec<amfbench.codec.ICodec} to decode the result.
 
     @param name: One of L{builder.builders}
     @param size: The number of objects that the builder generated.
     @param encoding: The AMF encoding value.
-    @return: The time it took C{codec} to decode the blob. If an error occurred
-        whilst decoding the blob then C{None} will be the result.
+    @param policy: The L{timer.Policy} that determines how many times the
+        blob is decoded.
+    @param measure_memory: If set, an additional untimed decode is made to
+        record memory usage (see L{memory.measure}) under the C{memory} key.
+    @param chunk_size: If supplied, the blob is fed to the codec in chunks of
+        this many bytes (see L{codec.decode_stream}) and the time taken to
+        produce the first top-level object (the whole payload, as the blob
+        holds a single list) is recorded under the C{first_object} key.
+        Codecs that implement C{decode_stream} are also timed on the elements
+        of the payload as separate top-level values (see L{get_stream}), with
+        the results under the C{stream} key. The timings of the blob are
+        comparable across every codec, those under C{stream} across the
+        codecs that have it.
+    @param bandwidth: Paces the chunks to simulate a link of this many bytes
+        per second. Only used with C{chunk_size}.
+    @param archive: The path of a L{corpus archive<archive.Archive>} to take
+        the blob from. The blob is handed to L{codec.ICodec.decode_buffer}
+        without being copied if the codec provides it (only cPickle). The
+        AMF codecs are given a copy as a C{str}, which is what AmFast and
+        PyAMF decode fastest.
+    @param profile: See L{encode}.
+    @param gc_policy: See L{encode}.
+    @param params: The builder parameters the blob was built with (see
+        L{builder.label}).
+    @return: A C{dict} of timing statistics (see L{timer.summarise}). If an
+        error occurred whilst decoding the blob then C{None} will be the
+        result.
     """
     if name not in builder.builders:
         raise NameError('Unknown builder %r' % (name,))
 
-    file_name = get_blob_filename(name, size, encoding)
+    amf3 = False if encoding == 0 else True
+    decode_func = codec.decode
 
-    f = open(file_name, 'rb')
-    bytes = f.read()
-    f.close()
+    if archive:
+        a = _archive.open_archive(archive)
+        key = builder.label(name, params)
 
-    amf3 = False if encoding == 0 else True
+        if hasattr(codec, 'decode_buffer') and not chunk_size:
+            bytes = a.get_buffer(key, size, encoding)
+            decode_func = codec.decode_buffer
+        else:
+            bytes = a.get_bytes(key, size, encoding)
+    else:
+        file_name = get_blob_filename(name, size, encoding, params)
+
+        f = open(file_name, 'rb')
+        bytes = f.read()
+        f.close()
 
-    start = time.time()
+    if chunk_size:
+        first = []
+        func = _stream_decoder(codec, bytes, amf3, chunk_size, bandwidth,
+            first)
+        args = ()
+    else:
+        func = decode_func
+        args = (bytes, amf3)
 
     try:
-        payload = codec.decode(bytes, amf3)
+        (samples, payload, warmups), gc_stats = gcstats.run(gc_policy,
+            policy, func, *args)
+
+        del payload
+
+        if chunk_size:
+            # drop the warmup calls
+            first = first[-len(samples):]
+
+        if measure_memory:
+            payload, mem = memory.measure(size, func, *args)
+
+            del payload
+
+        if profile is not None:
+            prof = profile.run(func, *args)
     except Exception:
-        result = None
-    else:
-        result = time.time() - start
+        return None
+
+    result = timer.summarise(samples, size, len(bytes), warmups)
+    result['gc'] = gc_stats
+
+    if chunk_size:
+        result['first_object'] = timer.summarise(first)
+        result['chunk_size'] = chunk_size
+        result['bandwidth'] = bandwidth
+
+        if hasattr(codec, 'decode_stream'):
+            result['stream'] = _time_stream(codec, get_stream(name, size,
+                encoding, params), size, amf3, chunk_size, bandwidth, policy,
+                gc_policy)
+
+    if measure_memory:
+        result['memory'] = mem
+
+    if profile is not None:
+        result['profile'] = prof
 
     return result
 
 
-def get_blob_filename(builder_name, size, encoding):
+def get_blob_filename(builder_name, size, encoding, params=None):
     """
     Builds and returns the file name of the amf blob.
 
     @param builder_name: One of L{builder.builders}
     @param size: The number of objects for the builder
     @param encoding: The AMF encoding value.
+    @param params: The builder parameters, which are part of the name if they
+        are not the defaults (see L{builder.label}).
     """
-    fn = '%s-%d.amf%d' % (builder_name, size, encoding)
+    fn = '%s-%d.amf%d' % (builder.label(builder_name, params), size, encoding)
 
     full_path = os.path.abspath(os.path.join(base_path, fn))
 
     return full_path
 
 
+def write_blob(name, size, encoding, params=None):
+    """
+    Builds the payload for C{name} and C{size} and streams the encoded blob
+    (see L{amf.encode}) to L{get_blob_filename}.
+
+    The blob is written to a temporary file first so that a half written blob
+    is never picked up by L{get_blobs}.
+
+    @return: The name of the file that was written.
+    """
+    payload = builder.build(name, size, **(params or {}))
+
+    fn = get_blob_filename(name, size, encoding, params)
+    tmp = fn + '.tmp'
+
+    dn = os.path.dirname(fn)
+
+    try:
+        os.makedirs(dn)
+    except OSError:
+        pass
+
+    f = open(tmp, 'wb', 1 << 20)
+
+    try:
+        amf.encode(payload, f, encoding == 3)
+    finally:
+        f.close()
+
+    os.rename(tmp, fn)
+
+    return fn
+
+
+def pack_blob(writer, name, size, encoding, params=None):
+    """
+    Like L{write_blob} but streams the blob into a corpus archive, filed under
+    L{builder.label}.
+
+    @param writer: An L{archive.ArchiveWriter}.
+    @return: The manifest entry of the blob.
+    """
+    payload = builder.build(name, size, **(params or {}))
+    key = builder.label(name, params)
+
+    writer.add(key, size, encoding,
+        lambda stream: amf.encode(payload, stream, encoding == 3))
+
+    return writer.entries[(key, size, encoding)]
+
+
 def get_blobs():
     """
     Builds a list of available amf blobs in L{base_path}. Each blob has a
-    specific name: C{[builder]-[size].amf[version]}
+    specific name: C{[builder]-[size].amf[version]}, where C{[builder]} is a
+    L{builder.label}.
     """
     global binaries
 
@@ -114,7 +389,7 @@ def get_blobs():
             continue
 
         try:
-            t, n = name.split('-')
+            t, n = name.rsplit('-', 1)
         except ValueError:
             continue
 
@@ -0,0 +1,438 @@
+"""
+A minimal, streaming AMF0/AMF3 encoder.
+
+This is not a general purpose codec; it understands exactly the types that
+L{amfbench.builder} produces and writes them straight to a file-like object so
+that large payloads never need the whole encoded buffer in memory. It is used
+to generate the decoding corpus without a Flash Player.
+"""
+
+import struct
+import datetime
+import calendar
+
+from amfbench import builder
+
+__all__ = ['ClassDefinition', 'class_definitions', 'AMF0Encoder',
+    'AMF3Encoder', 'encode', 'dumps']
+
+
+class ClassDefinition(object):
+    """
+    Describes how instances of a class are encoded.
+
+    @ivar alias: The alias that the class is typed as on the wire.
+    @ivar static_attrs: The attributes that are always encoded, in order.
+    @ivar dynamic: Whether any other attributes in C{__dict__} are encoded.
+    """
+
+    def __init__(self, alias, static_attrs=(), dynamic=True):
+        self.alias = alias
+        self.static_attrs = tuple(static_attrs)
+        self.dynamic = dynamic
+
+
+#: The class definitions for the builder classes. These match what the codec
+#: implementations register in their C{setUp}.
+class_definitions = {
+    builder.SomeClass: ClassDefinition(builder.aliases[builder.SomeClass]),
+    builder.SomeStaticClass: ClassDefinition(
+        builder.aliases[builder.SomeStaticClass],
+        ('name', 'score', 'rank'), dynamic=False),
+}
+
+
+def _to_ms(d):
+    """
+    Returns the number of milliseconds since the epoch for C{d}.
+    """
+    if not isinstance(d, datetime.datetime):
+        d = datetime.datetime.combine(d, datetime.time(0))
+
+    return calendar.timegm(d.utctimetuple()) * 1000.0 + \
+        d.microsecond / 1000.0
+
+
+class BaseEncoder(object):
+    """
+    @ivar stream: The file-like object that the encoded bytes are written to.
+    @ivar class_defs: A C{dict} of class -> L{ClassDefinition}.
+    """
+
+    def __init__(self, stream, class_defs=None):
+        self.stream = stream
+        self.write = stream.write
+
+        if class_defs is None:
+            class_defs = class_definitions
+
+        self.class_defs = class_defs
+        self.objects = {}
+        self.object_count = 0
+
+        self.type_map = {
+            type(None): self.writeNull,
+            bool: self.writeBoolean,
+            int: self.writeInteger,
+            long: self.writeInteger,
+            float: self.writeNumber,
+            str: self.writeString,
+            unicode: self.writeUnicode,
+            list: self.writeList,
+            tuple: self.writeList,
+            dict: self.writeDict,
+            datetime.datetime: self.writeDate,
+            datetime.date: self.writeDate,
+            bytearray: self.writeByteArray,
+        }
+
+    def writeElement(self, obj):
+        """
+        Writes C{obj} to the stream.
+        """
+        func = self.type_map.get(type(obj), None)
+
+        if func is None:
+            if not hasattr(obj, '__dict__'):
+                raise TypeError('Unable to encode %r' % (obj,))
+
+            func = self.writeInstance
+
+        func(obj)
+
+    def getAttributes(self, obj, class_def):
+        """
+        Returns a tuple of the static and dynamic attributes (a list of
+        C{(key, value)} pairs) to encode for C{obj}.
+        """
+        d = obj.__dict__
+
+        if class_def is None:
+            return [], sorted(d.iteritems())
+
+        static = [(k, d.get(k, None)) for k in class_def.static_attrs]
+
+        if not class_def.dynamic:
+            return static, []
+
+        dynamic = [(k, v) for k, v in sorted(d.iteritems())
+            if k not in class_def.static_attrs]
+
+        return static, dynamic
+
+
+class AMF0Encoder(BaseEncoder):
+    """
+    Encodes AMF0. Object references are limited to 16 bits, so objects that
+    fall outside that range are written inline again.
+    """
+
+    def writeReference(self, obj):
+        """
+        Writes a reference to C{obj} if it has already been encoded.
+
+        @return: Whether a reference was written.
+        """
+        idx = self.objects.get(id(obj), None)
+
+        if idx is None or idx > 0xffff:
+            self.objects[id(obj)] = self.object_count
+            self.object_count += 1
+
+            return False
+
+        self.write('\x07' + struct.pack('!H', idx))
+
+        return True
+
+    def writeNull(self, n):
+        self.write('\x05')
+
+    def writeBoolean(self, b):
+        self.write('\x01\x01' if b else '\x01\x00')
+
+    def writeInteger(self, n):
+        self.writeNumber(float(n))
+
+    def writeNumber(self, n):
+        self.write('\x00' + struct.pack('!d', n))
+
+    def writeUTF8(self, s):
+        self.write(struct.pack('!H', len(s)) + s)
+
+    def writeString(self, s):
+        l = len(s)
+
+        if l > 0xffff:
+            self.write('\x0c' + struct.pack('!L', l) + s)
+        else:
+            self.write('\x02' + struct.pack('!H', l) + s)
+
+    def writeUnicode(self, u):
+        self.writeString(u.encode('utf-8'))
+
+    def writeDate(self, d):
+        self.write('\x0b' + struct.pack('!dh', _to_ms(d), 0))
+
+    def writeByteArray(self, b):
+        # AMF0 has no ByteArray, so do what the Flash Player does and switch
+        # to AMF3 for it
+        self.write('\x11')
+
+        AMF3Encoder(self.stream, self.class_defs).writeByteArray(b)
+
+    def writeList(self, l):
+        if self.writeReference(l):
+            return
+
+        self.write('\x0a' + struct.pack('!L', len(l)))
+
+        for x in l:
+            self.writeElement(x)
+
+    def writeProperties(self, attrs):
+        for k, v in attrs:
+            if isinstance(k, unicode):
+                k = k.encode('utf-8')
+
+            self.writeUTF8(str(k))
+            self.writeElement(v)
+
+        self.write('\x00\x00\x09')
+
+    def writeDict(self, d):
+        if self.writeReference(d):
+            return
+
+        self.write('\x03')
+        self.writeProperties(sorted(d.iteritems()))
+
+    def writeInstance(self, obj):
+        if self.writeReference(obj):
+            return
+
+        class_def = self.class_defs.get(obj.__class__, None)
+        static, dynamic = self.getAttributes(obj, class_def)
+
+        if class_def is None:
+            self.write('\x03')
+        else:
+            self.write('\x10')
+            self.writeUTF8(class_def.alias)
+
+        self.writeProperties(static + dynamic)
+
+
+class AMF3Encoder(BaseEncoder):
+    """
+    Encodes AMF3, including string, object and trait references.
+    """
+
+    MIN_INT = -0x10000000
+    MAX_INT = 0x0fffffff
+
+    def __init__(self, stream, class_defs=None):
+        BaseEncoder.__init__(self, stream, class_defs)
+
+        self.strings = {}
+        self.traits = {}
+
+    def writeU29(self, n):
+        """
+        Writes the variable length unsigned 29 bit integer C{n}.
+
+        @raise OverflowError: C{n} is more than C{0x1fffffff}.
+        """
+        if n < 0x80:
+            self.write(chr(n))
+        elif n < 0x4000:
+            self.write(chr((n >> 7) | 0x80) + chr(n & 0x7f))
+        elif n < 0x200000:
+            self.write(chr((n >> 14) | 0x80) + chr((n >> 7 & 0x7f) | 0x80) +
+                chr(n & 0x7f))
+        elif n <= 0x1fffffff:
+            self.write(chr((n >> 22) | 0x80) + chr((n >> 15 & 0x7f) | 0x80) +
+                chr((n >> 8 & 0x7f) | 0x80) + chr(n & 0xff))
+        else:
+            raise OverflowError('%r is out of range for U29' % (n,))
+
+    def writeReference(self, obj):
+        """
+        Writes a reference to C{obj} if it has already been encoded.
+
+        @return: Whether a reference was written.
+        """
+        idx = self.objects.get(id(obj), None)
+
+        if idx is None:
+            self.objects[id(obj)] = self.object_count
+            self.object_count += 1
+
+            return False
+
+        self.writeU29(idx << 1)
+
+        return True
+
+    def writeUTF8(self, s):
+        """
+        Writes the (utf-8 encoded) string C{s} without a type marker, using the
+        string reference table.
+        """
+        if not s:
+            self.write('\x01')
+
+            return
+
+        idx = self.strings.get(s, None)
+
+        if idx is not None:
+            self.writeU29(idx << 1)
+
+            return
+
+        self.strings[s] = len(self.strings)
+
+        self.writeU29((len(s) << 1) | 1)
+        self.write(s)
+
+    def writeNull(self, n):
+        self.write('\x01')
+
+    def writeBoolean(self, b):
+        self.write('\x03' if b else '\x02')
+
+    def writeInteger(self, n):
+        if n < self.MIN_INT or n > self.MAX_INT:
+            self.writeNumber(float(n))
+
+            return
+
+        self.write('\x04')
+        self.writeU29(n & 0x1fffffff)
+
+    def writeNumber(self, n):
+        self.write('\x05' + struct.pack('!d', n))
+
+    def writeString(self, s):
+        self.write('\x06')
+        self.writeUTF8(s)
+
+    def writeUnicode(self, u):
+        self.writeString(u.encode('utf-8'))
+
+    def writeDate(self, d):
+        self.write('\x08')
+
+        if self.writeReference(d):
+            return
+
+        self.write('\x01' + struct.pack('!d', _to_ms(d)))
+
+    def writeByteArray(self, b):
+        self.write('\x0c')
+
+        if self.writeReference(b):
+            return
+
+        self.writeU29((len(b) << 1) | 1)
+        self.write(str(b))
+
+    def writeList(self, l):
+        self.write('\x09')
+
+        if self.writeReference(l):
+            return
+
+        self.writeU29((len(l) << 1) | 1)
+        # no associative portion
+        self.write('\x01')
+
+        for x in l:
+            self.writeElement(x)
+
+    def writeTraits(self, class_def):
+        """
+        Writes the traits for C{class_def} (C{None} meaning an anonymous
+        dynamic object), or a reference to them.
+        """
+        idx = self.traits.get(class_def, None)
+
+        if idx is not None:
+            self.writeU29((idx << 2) | 0x01)
+
+            return
+
+        self.traits[class_def] = len(self.traits)
+
+        if class_def is None:
+            self.write('\x0b\x01')
+
+            return
+
+        self.writeU29((len(class_def.static_attrs) << 4) |
+            (0x08 if class_def.dynamic else 0) | 0x03)
+        self.writeUTF8(class_def.alias)
+
+        for attr in class_def.static_attrs:
+            self.writeUTF8(attr)
+
+    def writeDynamic(self, attrs):
+        for k, v in attrs:
+            if isinstance(k, unicode):
+                k = k.encode('utf-8')
+
+            self.writeUTF8(str(k))
+            self.writeElement(v)
+
+        self.write('\x01')
+
+    def writeDict(self, d):
+        self.write('\x0a')
+
+        if self.writeReference(d):
+            return
+
+        self.writeTraits(None)
+        self.writeDynamic(sorted(d.iteritems()))
+
+    def writeInstance(self, obj):
+        self.write('\x0a')
+
+        if self.writeReference(obj):
+            return
+
+        class_def = self.class_defs.get(obj.__class__, None)
+        static, dynamic = self.getAttributes(obj, class_def)
+
+        self.writeTraits(class_def)
+
+        for k, v in static:
+            self.writeElement(v)
+
+        if class_def is None or class_def.dynamic:
+            self.writeDynamic(dynamic)
+
+
+def encode(obj, stream, amf3, class_defs=None):
+    """
+    Encodes C{obj} to C{stream}.
+
+    @param amf3: Whether to encode AMF3 (C{True}) or AMF0 (C{False}).
+    """
+    kls = AMF3Encoder if amf3 else AMF0Encoder
+
+    kls(stream, class_defs).writeElement(obj)
+
+
+def dumps(obj, amf3, class_defs=None):
+    """
+    Returns the encoded bytes for C{obj}.
+    """
+    from cStringIO import StringIO
+
+    s = StringIO()
+
+    encode(obj, s, amf3, class_defs)
+
+    return s.getvalue()
@@ -0,0 +1,245 @@
+"""
+A packed, memory-mapped corpus of AMF blobs.
+
+All of the blobs live in one file (the pack) with a JSON manifest alongside
+it (C{[pack].idx}) recording the builder, size, encoding, offset, length and
+CRC32 of each one. Blobs are handed out as zero-copy buffers onto the mapped
+file, so there is no per-call C{listdir} or C{read}.
+"""
+
+import os
+import os.path
+import mmap
+import zlib
+
+try:
+    import json
+except ImportError:
+    import simplejson as json
+
+__all__ = ['Archive', 'ArchiveWriter', 'open_archive']
+
+
+#: Blobs start on a multiple of this many bytes.
+alignment = 8
+
+
+def _key(name, size, encoding):
+    return (str(name), int(size), int(encoding))
+
+
+def _buffer(obj, offset, length):
+    try:
+        return buffer(obj, offset, length)
+    except NameError:
+        return memoryview(obj)[offset:offset + length]
+
+
+def _manifest_name(path):
+    return path + '.idx'
+
+
+def _read_manifest(path):
+    fn = _manifest_name(path)
+
+    if not os.path.exists(fn):
+        return {}
+
+    f = open(fn, 'rb')
+
+    try:
+        data = json.loads(f.read())
+    finally:
+        f.close()
+
+    ret = {}
+
+    for e in data['entries']:
+        ret[_key(e['builder'], e['size'], e['encoding'])] = e
+
+    return ret
+
+
+class Archive(object):
+    """
+    A read only view of a pack file.
+
+    @ivar entries: A C{dict} of C{(builder, size, encoding)} -> manifest
+        entry.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.entries = _read_manifest(path)
+
+        self.file = open(path, 'rb')
+
+        if os.path.getsize(path):
+            self.map = mmap.mmap(self.file.fileno(), 0,
+                access=mmap.ACCESS_READ)
+        else:
+            self.map = ''
+
+    def close(self):
+        if self.map:
+            self.map.close()
+
+        self.file.close()
+
+    def _get_entry(self, name, size, encoding):
+        try:
+            return self.entries[_key(name, size, encoding)]
+        except KeyError:
+            raise KeyError('%s-%d.amf%d is not in %s' % (name, size, encoding,
+                self.path))
+
+    def get_buffer(self, name, size, encoding):
+        """
+        Returns a read only, zero-copy buffer of the blob.
+        """
+        e = self._get_entry(name, size, encoding)
+
+        return _buffer(self.map, e['offset'], e['length'])
+
+    def get_bytes(self, name, size, encoding):
+        """
+        Returns a copy of the blob as a C{str}, for codecs that need one.
+        """
+        e = self._get_entry(name, size, encoding)
+
+        return self.map[e['offset']:e['offset'] + e['length']]
+
+    def verify(self):
+        """
+        Checks every blob against its manifest checksum.
+
+        @return: A list of the keys of blobs that failed.
+        """
+        bad = []
+
+        for key, e in sorted(self.entries.iteritems()):
+            crc = zlib.crc32(self.get_buffer(*key)) & 0xffffffff
+
+            if crc != e['crc32']:
+                bad.append(key)
+
+        return bad
+
+    def get_blobs(self):
+        """
+        Returns the available blobs in the same structure as
+        L{amfbench.get_blobs}.
+        """
+        ret = {}
+
+        for name, size, encoding in self.entries:
+            ret.setdefault(name, {}).setdefault(encoding, []).append(size)
+
+        for d in ret.itervalues():
+            for sizes in d.itervalues():
+                sizes.sort()
+
+        return ret
+
+
+class _ChecksumStream(object):
+    """
+    Writes to C{stream}, keeping a count and running CRC32 of the bytes.
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.length = 0
+        self.crc32 = 0
+
+    def write(self, data):
+        self.stream.write(data)
+        self.length += len(data)
+        self.crc32 = zlib.crc32(data, self.crc32)
+
+
+class ArchiveWriter(object):
+    """
+    Appends blobs to a pack file, rewriting the manifest on L{close}. Blobs
+    that are added again replace the earlier entry (the old bytes are left
+    in the pack).
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.entries = _read_manifest(path)
+
+        dn = os.path.dirname(os.path.abspath(path))
+
+        if not os.path.isdir(dn):
+            os.makedirs(dn)
+
+        self.file = open(path, 'ab', 1 << 20)
+        self.file.seek(0, 2)
+
+    def __contains__(self, key):
+        return _key(*key) in self.entries
+
+    def add(self, name, size, encoding, func):
+        """
+        Adds a blob, calling C{func(stream)} to stream its bytes into the
+        pack.
+        """
+        offset = self.file.tell()
+        pad = -offset % alignment
+
+        if pad:
+            self.file.write('\x00' * pad)
+            offset += pad
+
+        stream = _ChecksumStream(self.file)
+
+        func(stream)
+
+        self.entries[_key(name, size, encoding)] = {
+            'builder': name,
+            'size': size,
+            'encoding': encoding,
+            'offset': offset,
+            'length': stream.length,
+            'crc32': stream.crc32 & 0xffffffff,
+        }
+
+    def close(self):
+        self.file.close()
+
+        fn = _manifest_name(self.path)
+        tmp = fn + '.tmp'
+
+        f = open(tmp, 'wb')
+
+        try:
+            f.write(json.dumps({
+                'version': 1,
+                'entries': sorted(self.entries.values(),
+                    key=lambda e: (e['builder'], e['size'], e['encoding'])),
+            }, indent=1))
+        finally:
+            f.close()
+
+        os.rename(tmp, fn)
+
+
+_open = {}
+
+
+def open_archive(path):
+    """
+    Returns the (cached) L{Archive} for C{path}, so that each process maps
+    the pack once.
+    """
+    path = os.path.abspath(path)
+
+    try:
+        return _open[path]
+    except KeyError:
+        pass
+
+    ret = _open[path] = Archive(path)
+
+    return ret
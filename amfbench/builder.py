@@ -3,11 +3,34 @@
 """
 Contains a list of functions that will build object graphs for the codec to
 encode.
+
+Each builder is mirrored by a function in C{flex/amfbench/Builder.as} that
+produces the same graph, so that blobs generated by the Flash Player decode
+to exactly what the builder returns.
 """
 
-builders = ['simple', 'complex', 'static', 'reference']
+import struct
+import datetime
+
+builders = ['simple', 'complex', 'static', 'reference', 'dates', 'binary',
+    'text', 'vectors', 'sparse', 'nested']
+
+#: The keyword parameters (and their defaults) that each builder accepts on
+#: top of the number of objects.
+parameters = {
+    'binary': {'length': 1024},
+    'text': {'length': 1000},
+    'vectors': {'length': 100},
+    'sparse': {'width': 1000, 'fanout': 50},
+    'nested': {'depth': 50, 'fanout': 1},
+}
+
+#: The smallest value of each parameter that L{parse_params} accepts, 0 if
+#: not listed. A payload cannot be zero objects wide or deep.
+minimums = {'width': 1, 'depth': 1, 'fanout': 1}
 
-__all__ = builders + ['SomeClass', 'SomeStaticClass']
+__all__ = builders + ['SomeClass', 'SomeStaticClass', 'build', 'label',
+    'parse_params']
 
 
 class BaseObject(object):
@@ -150,3 +173,259 @@ def reference(num, obj=None):
         obj = {'foo': 'bar'}
 
     return [obj] * num
+
+
+def build(name, num, **params):
+    """
+    Calls the builder C{name}, with the defaults from L{parameters} for any
+    parameters that are not supplied.
+
+    @raise NameError: C{name} is not one of L{builders}.
+    @raise TypeError: A parameter is not understood by the builder.
+    """
+    if name not in builders:
+        raise NameError('Unknown builder %r' % (name,))
+
+    kwargs = dict(parameters.get(name, {}))
+
+    for k in params:
+        if k not in kwargs:
+            raise TypeError('%s does not take a %r parameter' % (name, k))
+
+    kwargs.update(params)
+
+    return globals()[name](num, **kwargs)
+
+
+def label(name, params=None):
+    """
+    Returns the name that the payload of C{name} built with C{params} is
+    filed under (in blob file names, corpus archives and results). This is
+    C{name} itself unless a parameter differs from its default, e.g.
+    C{nested[depth=10,fanout=2]}.
+    """
+    defaults = parameters.get(name, {})
+    changed = sorted([(k, v) for k, v in (params or {}).iteritems()
+        if defaults.get(k) != v])
+
+    if not changed:
+        return name
+
+    return '%s[%s]' % (name, ','.join(['%s=%s' % kv for kv in changed]))
+
+
+def parse_params(values):
+    """
+    Parses C{BUILDER.KEY=VALUE} strings (the C{--param} command line option)
+    into a C{dict} of builder -> C{dict} of parameters for L{build}.
+
+    @raise ValueError: A value is malformed or names an unknown builder or
+        parameter.
+    """
+    ret = {}
+
+    for value in values or ():
+        try:
+            key, v = value.split('=', 1)
+            name, key = key.split('.', 1)
+        except ValueError:
+            raise ValueError('%r is not a valid parameter, use '
+                'BUILDER.KEY=VALUE' % (value,))
+
+        if key not in parameters.get(name, {}):
+            raise ValueError('%s does not take a %r parameter, choose from '
+                '%r' % (name, key, sorted(parameters.get(name, {}))))
+
+        try:
+            v = type(parameters[name][key])(v)
+        except ValueError:
+            raise ValueError('%r is not a valid value for %s.%s' % (v, name,
+                key))
+
+        least = minimums.get(key, 0)
+
+        if v < least:
+            raise ValueError('%s.%s must be >= %d (got %r)' % (name, key,
+                least, v))
+
+        ret.setdefault(name, {})[key] = v
+
+    return ret
+
+
+def _xorshift(seed, count):
+    """
+    Returns C{count} pseudo random 32 bit words. The generator (xorshift32)
+    is trivial to reproduce in ActionScript, which keeps the Flash and Python
+    builders in step.
+    """
+    x = (seed * 2654435761 + 1) & 0xffffffff or 1
+    ret = []
+
+    for i in xrange(count):
+        x ^= (x << 13) & 0xffffffff
+        x ^= x >> 17
+        x ^= (x << 5) & 0xffffffff
+
+        ret.append(x)
+
+    return ret
+
+
+#: Midnight on the 1st of January 2011 (UTC).
+epoch = datetime.datetime(2011, 1, 1)
+
+
+def dates(num):
+    """
+    Returns a list of records with C{datetime} fields.
+
+    Some notes:
+     * AMF only has millisecond precision, so the dates never have more.
+     * No two dates are the same object (AMF0 cannot reference a date).
+    """
+    ret = []
+
+    for i in xrange(0, num):
+        created = epoch + datetime.timedelta(minutes=i * 7,
+            milliseconds=i % 1000)
+
+        ret.append({
+            'id': i,
+            'created': created,
+            'modified': created + datetime.timedelta(days=1, seconds=i % 60),
+            'expires': epoch + datetime.timedelta(days=365 + i % 365),
+        })
+
+    return ret
+
+
+def binary(num, length=1024):
+    """
+    Returns a list of attachments, each with a C{bytearray} (an AMF3
+    ByteArray) of C{length} incompressible bytes.
+
+    Some notes:
+     * AMF0 has no ByteArray type; Flash switches to AMF3 for each one.
+    """
+    ret = []
+    words = (length + 3) // 4
+
+    for i in xrange(0, num):
+        data = struct.pack('!%dL' % (words,), *_xorshift(i, words))
+
+        ret.append({
+            'name': 'attachment-%d.bin' % (i,),
+            'size': length,
+            'data': bytearray(data[:length]),
+        })
+
+    return ret
+
+
+#: The text that L{text} is cut from.
+paragraph = (u'Lorem ipsum dolor sit amet, ƒøø bår bäz. Ελληνικά, Русский '
+    u'и 日本語のテキスト — “quoted” text… ')
+
+
+def text(num, length=1000):
+    """
+    Returns a list of documents, each with a unicode C{body} of C{length}
+    characters (mostly multi-byte in UTF-8).
+
+    Some notes:
+     * Every body is different, so there are no string references.
+    """
+    ret = []
+    repeat = paragraph * (length // len(paragraph) + 1)
+
+    for i in xrange(0, num):
+        ret.append({
+            'id': i,
+            'title': u'Document %d' % (i,),
+            'body': (u'%d: ' % (i,) + repeat)[:length],
+        })
+
+    return ret
+
+
+def vectors(num, length=100):
+    """
+    Returns a list of samples, each holding a list of C{length} integers and
+    a list of C{length} floats.
+
+    Some notes:
+     * The integers fit in 29 bits so AMF3 can write them as integers.
+     * The floats are exact in binary so that every codec round trips them.
+     * These are plain lists (Arrays in Flash), not AMF3 typed vectors,
+       which none of the codecs support.
+    """
+    ret = []
+
+    for i in xrange(0, num):
+        ret.append({
+            'id': i,
+            'ints': [(i * 31 + j * 17) % 2000000 - 1000000
+                for j in xrange(length)],
+            'floats': [i * 0.5 + j * 0.25 for j in xrange(length)],
+        })
+
+    return ret
+
+
+def sparse(num, width=1000, fanout=50):
+    """
+    Returns a list of wide, sparse dicts. Each has up to C{fanout} keys taken
+    from C{width} possible keys (C{field0} .. C{field[width - 1]}).
+
+    Some notes:
+     * Values are integers, strings or booleans depending on the key.
+     * Keys are shared between dicts so AMF3 will use string references.
+    """
+    ret = []
+
+    for i in xrange(0, num):
+        d = {}
+
+        for x in _xorshift(i, fanout):
+            k = x % width
+
+            if k % 3 == 0:
+                v = x & 0xffff
+            elif k % 3 == 1:
+                v = 'value %d' % (x & 0xff,)
+            else:
+                v = bool(x & 1)
+
+            d['field%d' % (k,)] = v
+
+        ret.append(d)
+
+    return ret
+
+
+def _node(level, depth, fanout):
+    obj = SomeClass()
+
+    obj.level = level
+    obj.name = 'node'
+
+    if level + 1 < depth:
+        obj.children = [_node(level + 1, depth, fanout)
+            for i in xrange(fanout)]
+    else:
+        obj.children = []
+
+    return obj
+
+
+def nested(num, depth=50, fanout=1):
+    """
+    Returns a list of C{num} trees of C{SomeClass} nodes, C{depth} levels
+    deep with C{fanout} children per node.
+
+    Some notes:
+     * A tree has C{fanout ** depth} leaves, so keep one of them small.
+     * Decoders that recurse may hit the recursion limit for large depths.
+    """
+    return [_node(0, depth, fanout) for i in xrange(0, num)]
@@ -0,0 +1,116 @@
+"""
+A cache of built payloads, so that an object graph is built once per run
+rather than once per codec and encoding.
+
+Building a large graph inside every benchmark is slow and leaves the garbage
+collector in a different state for each codec. The cache keeps the most
+recently used graphs up to a memory limit.
+"""
+
+import gc
+from collections import OrderedDict
+
+from amfbench import builder, memory
+
+__all__ = ['sizeof', 'freeze', 'PayloadCache']
+
+
+def sizeof(obj):
+    """
+    Returns the approximate number of bytes used by the object graph C{obj}
+    (see L{memory.graph_size}).
+    """
+    return memory.graph_size(obj)[0]
+
+
+def freeze():
+    """
+    Takes everything that currently exists out of the way of the cyclic
+    garbage collector.
+
+    Python >= 3.7 has C{gc.freeze}. Elsewhere the best we can do is a full
+    collection, which moves the survivors into the oldest generation; that is
+    only collected again once the number of new long lived objects exceeds a
+    quarter of it.
+    """
+    if hasattr(gc, 'freeze'):
+        gc.collect()
+        gc.freeze()
+    else:
+        gc.collect()
+
+
+class PayloadCache(object):
+    """
+    An LRU cache of builder payloads keyed by C{(builder, size, params)}.
+
+    @ivar limit: The maximum number of bytes (see L{sizeof}) to hold, or
+        C{None} for no limit. A payload bigger than this is never cached.
+    @ivar freeze: Whether to call L{freeze} after building a payload.
+    @ivar size: The number of bytes held.
+    """
+
+    def __init__(self, limit=None, freeze=False):
+        self.limit = limit
+        self.freeze = freeze
+        self.size = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._entries = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __getstate__(self):
+        # the payloads are not worth pickling (e.g. to a worker process)
+        d = self.__dict__.copy()
+        d['_entries'] = OrderedDict()
+        d['size'] = 0
+
+        return d
+
+    def clear(self):
+        self._entries.clear()
+        self.size = 0
+
+    def get(self, name, size, **params):
+        """
+        Returns the payload from L{builder.build}C{(name, size, **params)},
+        building it if it is not already cached.
+        """
+        key = (name, size, tuple(sorted(params.iteritems())))
+
+        try:
+            payload, nbytes = self._entries.pop(key)
+        except KeyError:
+            pass
+        else:
+            self._entries[key] = (payload, nbytes)
+            self.hits += 1
+
+            return payload
+
+        self.misses += 1
+
+        payload = builder.build(name, size, **params)
+        nbytes = sizeof(payload)
+
+        if self.limit is None or nbytes <= self.limit:
+            while self._entries and self.limit is not None and \
+                    self.size + nbytes > self.limit:
+                k, (p, n) = self._entries.popitem(last=False)
+                self.size -= n
+                self.evictions += 1
+
+                del p
+
+            self._entries[key] = (payload, nbytes)
+            self.size += nbytes
+
+        if self.freeze:
+            freeze()
+
+        return payload
@@ -10,6 +10,9 @@ class ICodec(object):
     @ivar name: The printable name of the codec (e.g. PyAMF)
     @ivar package: The package name for the project (e.g. amfast)
     @ivar version: The stringified version of the codec (e.g. 0.4.2)
+    @ivar variants: Optional. A C{dict} of variant name -> keyword arguments
+        for the constructor, for codecs that can be configured in ways worth
+        comparing (see L{get_implementation}).
     """
 
     def setUp(self):
@@ -44,15 +47,146 @@ class ICodec(object):
         @return: The decoded object graph.
         """
 
+    def decode_stream(self, chunks, amf3):
+        """
+        Optional. Decodes the bytes yielded by C{chunks} as they arrive rather
+        than waiting for the whole body. Codecs that do not provide this are
+        handled by L{buffered_decode_stream} (see L{decode_stream}).
 
-def get_available_implementations():
+        @param chunks: An iterable of C{str} chunks. L{ChunkReader} turns this
+            into a file-like object.
+        @param amf3: A boolean determining whether or not to encode in AMF3.
+            If this value is C{False} then AMF0 should be used.
+        @return: An iterable of the top-level objects, each produced as soon
+            as it has been decoded.
+        """
+
+    def decode_buffer(self, buf, amf3):
+        """
+        Optional. Decodes a read only C{buffer} (or C{memoryview}) without
+        copying it to a C{str} first. Blobs from a
+        L{corpus archive<amfbench.archive>} are handed to this if it exists,
+        otherwise they are copied (outside of the timed region) and passed to
+        L{decode}.
+
+        @param buf: A zero-copy view of the raw bytes.
+        @param amf3: A boolean determining whether or not to encode in AMF3.
+            If this value is C{False} then AMF0 should be used.
+        @return: The decoded object graph.
+        """
+
+
+class ChunkReader(object):
     """
-    Returns a list of available codec implementations. Globs for
-    C{amfbench/codec/_(.*).py}
+    A read only file-like object that pulls its data from an iterable of
+    chunks as it is needed.
+    """
+
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._buf = ''
+        self._pos = 0
+
+    def _fill(self, n):
+        """
+        Pulls chunks until at least C{n} bytes are buffered or the chunks are
+        exhausted. C{n} of C{None} means all remaining chunks.
+        """
+        parts = [self._buf[self._pos:]]
+        have = len(parts[0])
+
+        for chunk in self._chunks:
+            parts.append(chunk)
+            have += len(chunk)
+
+            if n is not None and have >= n:
+                break
+
+        self._buf = ''.join(parts)
+        self._pos = 0
+
+    def read(self, n=-1):
+        if n is None or n < 0:
+            self._fill(None)
+            n = len(self._buf)
+        elif len(self._buf) - self._pos < n:
+            self._fill(n)
+
+        ret = self._buf[self._pos:self._pos + n]
+        self._pos += len(ret)
+
+        return ret
+
+    def readline(self):
+        while True:
+            idx = self._buf.find('\n', self._pos)
+
+            if idx != -1:
+                return self.read(idx - self._pos + 1)
+
+            l = len(self._buf) - self._pos
+            self._fill(l + 1)
+
+            if len(self._buf) == l:
+                return self.read()
+
+    def at_eof(self):
+        """
+        Whether all of the data has been consumed.
+        """
+        if self._pos < len(self._buf):
+            return False
+
+        self._fill(1)
+
+        return not self._buf
+
+
+def buffered_decode_stream(codec, chunks, amf3):
+    """
+    The fallback for codecs that cannot decode incrementally; waits for all of
+    C{chunks} and then decodes the result in one go.
+    """
+    yield codec.decode(''.join(chunks), amf3)
+
+
+def decode_stream(codec, chunks, amf3):
+    """
+    Returns an iterable of the top-level objects decoded from C{chunks},
+    using L{ICodec.decode_stream} if C{codec} provides it.
+    """
+    func = getattr(codec, 'decode_stream', None)
+
+    if func is None:
+        return buffered_decode_stream(codec, chunks, amf3)
+
+    return func(chunks, amf3)
+
+
+#: The entry point group that third party codecs are registered under, e.g.
+#: in their C{setup.py}::
+#:
+#:     entry_points={'amfbench.codecs': ['mycodec = mypackage.bench:Codec']}
+entry_point_group = 'amfbench.codecs'
+
+#: Separates the name of a codec from the name of one of its variants, e.g.
+#: C{cpickle:highest}.
+variant_separator = ':'
+
+_sources = None
+_classes = {}
+_instances = {}
+
+
+def _get_builtins():
+    """
+    Globs for C{amfbench/codec/_(.*).py}.
+
+    @return: A C{dict} of codec name -> module name.
     """
     import os.path
 
-    ret = []
+    ret = {}
 
     for f in os.listdir(os.path.dirname(__file__)):
         filename, ext = os.path.splitext(f)
@@ -66,27 +200,190 @@ def get_available_implementations():
         if filename == '__init__':
             continue
 
-        ret.append(filename[1:])
+        ret[filename[1:]] = '%s.%s' % (__name__, filename)
 
     return ret
 
 
-def get_implementation(name):
+def _get_entry_points():
     """
-    Returns a ICodec instance for C{name}.
+    @return: A C{dict} of codec name -> entry point in L{entry_point_group}.
+    """
+    try:
+        import pkg_resources
+    except ImportError:
+        return {}
 
-    @raise NameError: C{name} is not a valid codec implementation
+    ret = {}
+
+    for ep in pkg_resources.iter_entry_points(entry_point_group):
+        ret.setdefault(ep.name, ep)
+
+    return ret
+
+
+def _get_sources():
+    global _sources
+
+    if _sources is None:
+        _sources = _get_entry_points()
+        # the built-in codecs cannot be replaced
+        _sources.update(_get_builtins())
+
+    return _sources
+
+
+def get_available_implementations():
+    """
+    Returns a sorted list of the names of the available codec implementations:
+    the built-in C{amfbench/codec/_(.*).py} modules plus any codecs registered
+    under the L{entry_point_group}.
+
+    Nothing is imported, so a codec whose dependencies are missing is still
+    listed; L{get_implementation} raises C{NameError} for it.
+    """
+    return sorted(_get_sources())
+
+
+def get_codec_module(name):
+    """
+    Returns the name of the module that defines the codec C{name} and the
+    (dotted) attribute of its L{ICodec} class, without importing anything.
+
+    @raise NameError: C{name} is not a valid codec implementation.
+    """
+    source = _get_sources().get(name)
+
+    if source is None:
+        raise NameError('%r not an available codec' % (name,))
+
+    if isinstance(source, basestring):
+        return source, 'Codec'
+
+    return source.module_name, '.'.join(source.attrs)
+
+
+def get_codec_class(name):
     """
-    full_name = '%s._%s' % (__name__, name)
+    Imports (once) and returns the L{ICodec} class of the codec C{name}.
 
+    @raise NameError: C{name} is not a valid codec implementation or it could
+        not be imported.
+    """
     try:
-        mod = __import__(full_name)
-    except ImportError:
+        return _classes[name]
+    except KeyError:
+        pass
+
+    source = _get_sources().get(name)
+
+    if source is None:
         raise NameError('%r not an available codec' % (name,))
 
-    for part in full_name.split('.')[1:]:
-        mod = getattr(mod, part)
+    try:
+        if isinstance(source, basestring):
+            kls = __import__(source, None, None, ['Codec']).Codec
+        else:
+            kls = source.load()
+    except Exception, e:
+        raise NameError('%r could not be loaded (%s: %s)' % (name,
+            e.__class__.__name__, e))
+
+    _classes[name] = kls
+
+    return kls
+
+
+def get_variants(name):
+    """
+    Returns C{name} followed by a sorted list of the variants of the codec,
+    each prefixed with the codec name (e.g. C{cpickle:highest}) ready for
+    L{get_implementation}.
+
+    @raise NameError: See L{get_codec_class}, or the codec has no variants.
+    """
+    variants = getattr(get_codec_class(name), 'variants', None) or {}
+
+    if not variants:
+        raise NameError('%r has no variants' % (name,))
+
+    return [name] + ['%s%s%s' % (name, variant_separator, v)
+        for v in sorted(variants)]
+
+
+def get_implementation(name):
+    """
+    Returns the ICodec instance for C{name}. Instances are created once and
+    then reused.
+
+    C{name} is either a codec name or C{codec:variant}, where C{variant} is a
+    key of the codec's C{variants}. A variant is created with the keyword
+    arguments in C{variants} and its C{package} is labelled
+    C{package:variant} so that its results are kept apart from the codec's.
+
+    @raise NameError: C{name} is not a valid codec implementation
+    """
+    try:
+        return _instances[name]
+    except KeyError:
+        pass
+
+    base, sep, variant = name.partition(variant_separator)
+    kls = get_codec_class(base)
+
+    if variant:
+        variants = getattr(kls, 'variants', None) or {}
+
+        try:
+            kwargs = variants[variant]
+        except KeyError:
+            raise NameError('%r has no variant %r (choose from %r)' % (base,
+                variant, sorted(variants)))
+
+        obj = kls(**kwargs)
+        obj.package = '%s%s%s' % (kls.package, variant_separator, variant)
+    else:
+        obj = kls()
+
+    _instances[name] = obj
+
+    return obj
+
+
+def resolve_implementations(names=None):
+    """
+    Expands the codec names given on a command line (C{-i}), where
+    C{NAME:all} stands for the L{variants<get_variants>} of a codec, and
+    checks that each can be loaded. Names given twice are only returned once.
+
+    @param names: The names, or C{None} for every codec that can be loaded.
+    @return: A tuple of the list of names and a list of the reasons that
+        codecs were skipped (only when C{names} is C{None}).
+    @raise NameError: One of C{names} is not a valid codec implementation.
+    """
+    ret = []
+    skipped = []
+
+    if names is None:
+        for a in get_available_implementations():
+            try:
+                get_implementation(a)
+            except NameError, e:
+                skipped.append(str(e))
+            else:
+                ret.append(a)
+
+        return ret, skipped
+
+    for a in names:
+        base, sep, variant = a.partition(variant_separator)
+
+        if variant == 'all':
+            found = get_variants(base)
+        else:
+            get_implementation(a)
+            found = [a]
 
-    kls = mod.Codec
+        ret.extend([x for x in found if x not in ret])
 
-    return kls()
+    return ret, skipped
@@ -7,6 +7,7 @@ from amfast.context import DecoderContext, EncoderContext
 from amfast import encode, decode, class_def
 
 from amfbench import builder
+from amfbench.codec import ChunkReader
 
 
 def get_version():
@@ -29,6 +30,13 @@ class Codec(object):
     package = amfast.__name__
     version = get_version()
 
+    variants = {
+        'nocollections': {'use_collections': False},
+    }
+
+    def __init__(self, use_collections=True):
+        self.use_collections = use_collections
+
     def setUp(self):
         self.class_mapper = class_def.ClassDefMapper()
 
@@ -49,8 +57,8 @@ class Codec(object):
         self.class_mapper.unmapClass(builder.SomeStaticClass)
 
     def encode(self, obj, amf3):
-        context = EncoderContext(use_collections=True, amf3=amf3,
-            use_proxies=False, class_def_mapper=self.class_mapper)
+        context = EncoderContext(use_collections=self.use_collections,
+            amf3=amf3, use_proxies=False, class_def_mapper=self.class_mapper)
 
         return encode.encode(obj, context)
 
@@ -59,3 +67,12 @@ class Codec(object):
             amf3=amf3)
 
         return decode.decode(context)
+
+    def decode_stream(self, chunks, amf3):
+        stream = ChunkReader(chunks)
+
+        while not stream.at_eof():
+            context = DecoderContext(stream,
+                class_def_mapper=self.class_mapper, amf3=amf3)
+
+            yield decode.decode(context)
@@ -3,8 +3,10 @@ AMFBench codec for U{cPickle<http://docs.python.org/library/pickle.html>}
 """
 
 import cPickle
+import cStringIO
 
 from amfbench import builder
+from amfbench.codec import ChunkReader
 
 
 class Codec(object):
@@ -16,6 +18,14 @@ class Codec(object):
     package = cPickle.__name__
     version = str(cPickle.__version__)
 
+    variants = {
+        'protocol2': {'protocol': 2},
+        'highest': {'protocol': cPickle.HIGHEST_PROTOCOL},
+    }
+
+    def __init__(self, protocol=0):
+        self.protocol = protocol
+
     def setUp(self):
         pass
 
@@ -23,7 +33,18 @@ class Codec(object):
         pass
 
     def encode(self, payload, amf3):
-        return cPickle.dumps(payload)
+        return cPickle.dumps(payload, self.protocol)
 
     def decode(self, bytes, amf3):
         return cPickle.loads(bytes)
+
+    def decode_buffer(self, buf, amf3):
+        # cStringIO reads straight out of the buffer rather than copying it
+        return cPickle.load(cStringIO.StringIO(buf))
+
+    def decode_stream(self, chunks, amf3):
+        stream = ChunkReader(chunks)
+        unpickler = cPickle.Unpickler(stream)
+
+        while not stream.at_eof():
+            yield unpickler.load()
@@ -3,10 +3,15 @@ AMFBench codec for U{PyAMF<http://pyamf.org/>}
 """
 
 import pyamf
+import pyamf.amf3
 
 from amfbench import builder
 
 
+def to_byte_array(obj, encoder):
+    return pyamf.amf3.ByteArray(str(obj))
+
+
 class Codec(object):
     """
     @implements: L{amfbench.codec.ICodec}
@@ -32,9 +37,13 @@ class Codec(object):
 
         a.compile()
 
+        # builders use bytearray for binary data, which PyAMF doesn't know
+        pyamf.add_type(bytearray, to_byte_array)
+
     def tearDown(self):
         pyamf.unregister_class(builder.SomeClass)
         pyamf.unregister_class(builder.SomeStaticClass)
+        pyamf.remove_type(bytearray)
 
         del builder.SomeStaticClass.__amf__
 
@@ -46,4 +55,4 @@ class Codec(object):
     def decode(self, bytes, amf3):
         encoding = pyamf.AMF3 if amf3 else pyamf.AMF0
 
-        return list(pyamf.decode(bytes, encoding=encoding))
+        return pyamf.decode(bytes, encoding=encoding).next()
@@ -0,0 +1,246 @@
+"""
+Garbage collector instrumentation and policies for the timed region.
+
+Decoding large graphs creates millions of container objects, so cyclic GC
+passes land inside the timed calls. L{Monitor} counts the collections (and,
+where the interpreter allows, their pause times) for each generation and a
+L{Policy} decides whether the collector runs at all while timing.
+"""
+
+import gc
+import weakref
+
+from amfbench import timer
+
+__all__ = ['Monitor', 'Policy', 'policies', 'get_policy', 'run']
+
+
+class _Sentinel(object):
+    """
+    Garbage that only the cyclic collector can free.
+    """
+
+
+class Monitor(object):
+    """
+    Records the cyclic garbage collections made between L{start} and L{stop}.
+
+    C{gc.callbacks} (Python >= 3.3) reports every collection with its
+    generation, which is timed. Older interpreters have no hook, so a
+    reference cycle is kept alive only by the collector: each collection
+    frees it and fires a weakref callback, and C{gc.get_count} tells us which
+    generation was collected (the counts of the collected generations have
+    just been reset). No pause times are available this way.
+
+    @ivar collections: The number of collections of each generation.
+    @ivar pauses: The total seconds spent in collections of each generation,
+        or C{None} if they cannot be measured.
+    @ivar collected: The number of unreachable objects found in each
+        generation, or C{None} if not known.
+    """
+
+    def __init__(self):
+        self.collections = [0, 0, 0]
+        self.callbacks = hasattr(gc, 'callbacks')
+
+        if self.callbacks:
+            self.pauses = [0.0, 0.0, 0.0]
+            self.collected = [0, 0, 0]
+        else:
+            self.pauses = None
+            self.collected = None
+
+        self._running = False
+        self._start = None
+        self._ref = None
+
+    def _callback(self, phase, info):
+        if phase == 'start':
+            self._start = timer.clock()
+
+            return
+
+        gen = info['generation']
+
+        self.collections[gen] += 1
+        self.collected[gen] += info['collected']
+
+        if self._start is not None:
+            self.pauses[gen] += timer.clock() - self._start
+            self._start = None
+
+    def _arm(self):
+        s = _Sentinel()
+        s.cycle = s
+
+        self._ref = weakref.ref(s, self._fired)
+
+    def _fired(self, ref):
+        if not self._running:
+            return
+
+        count = gc.get_count()
+
+        if count[1]:
+            gen = 0
+        elif count[2]:
+            gen = 1
+        else:
+            gen = 2
+
+        self.collections[gen] += 1
+        self._arm()
+
+    def start(self):
+        self._running = True
+
+        if self.callbacks:
+            gc.callbacks.append(self._callback)
+        else:
+            self._arm()
+
+    def stop(self):
+        self._running = False
+
+        if self.callbacks:
+            gc.callbacks.remove(self._callback)
+
+        self._ref = None
+
+    def get_stats(self, calls=None):
+        """
+        Returns the recorded C{collections}, C{pauses} and C{collected} as a
+        C{dict}. If C{calls} is supplied, C{collections_per_call} and
+        C{pause_per_call} (the total pause) are included.
+        """
+        ret = {
+            'collections': list(self.collections),
+            'pauses': self.pauses and list(self.pauses),
+            'collected': self.collected and list(self.collected),
+        }
+
+        if calls:
+            ret['collections_per_call'] = sum(self.collections) / float(calls)
+            ret['pause_per_call'] = sum(self.pauses) / calls \
+                if self.pauses is not None else None
+
+        return ret
+
+
+class Policy(object):
+    """
+    How the cyclic garbage collector is configured while a codec is timed.
+
+    @ivar name: C{enabled} (leave the collector alone), C{disabled} (switched
+        off for the timed calls, with a full collection afterwards) or
+        C{tuned} (run with C{thresholds}).
+    @ivar thresholds: The C{gc.set_threshold} arguments for C{tuned}.
+    """
+
+    def __init__(self, name='enabled', thresholds=None):
+        if name not in policies:
+            raise ValueError('Unknown GC policy %r (choose from %r)' % (name,
+                policies))
+
+        if name == 'tuned':
+            if not thresholds or len(thresholds) > 3 or \
+                    [t for t in thresholds if t < 0]:
+                raise ValueError('tuned needs 1-3 thresholds >= 0 (got %r)' %
+                    (thresholds,))
+        elif thresholds:
+            raise ValueError('Only the tuned policy takes thresholds')
+
+        self.name = name
+        self.thresholds = tuple(thresholds or ())
+        self._saved = None
+
+    def __repr__(self):
+        if self.thresholds:
+            return '<%s %s %r>' % (self.__class__.__name__, self.name,
+                self.thresholds)
+
+        return '<%s %s>' % (self.__class__.__name__, self.name)
+
+    def __str__(self):
+        if self.thresholds:
+            return '%s:%s' % (self.name, ','.join(map(str, self.thresholds)))
+
+        return self.name
+
+    def apply(self):
+        """
+        Configures the collector. Call L{restore} afterwards.
+        """
+        self._saved = (gc.isenabled(), gc.get_threshold())
+
+        if self.name == 'disabled':
+            gc.disable()
+        elif self.name == 'tuned':
+            gc.set_threshold(*self.thresholds)
+
+    def restore(self):
+        enabled, thresholds = self._saved
+
+        gc.set_threshold(*thresholds)
+
+        if self.name == 'disabled':
+            # pay for the garbage now, outside of the timed region
+            gc.collect()
+
+        if enabled:
+            gc.enable()
+        else:
+            gc.disable()
+
+        self._saved = None
+
+
+#: The policy names understood by L{Policy}.
+policies = ('enabled', 'disabled', 'tuned')
+
+
+def get_policy(spec):
+    """
+    Returns a L{Policy} from a string such as C{disabled} or
+    C{tuned:10000,20,20}.
+
+    @raise ValueError: C{spec} is not valid.
+    """
+    name, sep, thresholds = spec.partition(':')
+
+    try:
+        thresholds = [int(t) for t in thresholds.split(',') if t]
+    except ValueError:
+        raise ValueError('%r is not a valid list of thresholds' % (
+            thresholds,))
+
+    return Policy(name, thresholds)
+
+
+def run(policy, timer_policy, func, *args):
+    """
+    Calls L{timer.run} under the GC C{policy} (if any), monitoring the
+    collector.
+
+    @return: The L{timer.run} result and the L{Monitor.get_stats} C{dict}
+        (which includes the C{policy}).
+    """
+    monitor = Monitor()
+
+    if policy is not None:
+        policy.apply()
+
+    monitor.start()
+
+    try:
+        samples, ret, warmups = timer.run(timer_policy, func, *args)
+    finally:
+        monitor.stop()
+
+        if policy is not None:
+            policy.restore()
+
+    stats = monitor.get_stats(len(samples) + len(warmups))
+    stats['policy'] = str(policy or 'enabled')
+
+    return (samples, ret, warmups), stats
@@ -0,0 +1,140 @@
+"""
+A latency histogram in the style of HdrHistogram.
+
+Values are recorded in integer units (microseconds by default) into
+log-linear buckets: every power of two range is split into C{2**precision}
+linear sub-buckets, so the relative error of any reported value is bounded
+by C{2**-precision} regardless of magnitude.
+"""
+
+__all__ = ['Histogram']
+
+
+class Histogram(object):
+    """
+    @ivar precision: The number of bits of sub-bucket precision.
+    @ivar unit: The size of one recorded unit in seconds.
+    @ivar counts: A C{dict} of the highest equivalent value of a bucket ->
+        number of values recorded in that bucket.
+    """
+
+    def __init__(self, precision=7, unit=1e-6):
+        self.precision = precision
+        self.unit = unit
+        self.counts = {}
+        self.total = 0
+        self.sum = 0
+        self.min = None
+        self.max = None
+
+    def _bucket(self, v):
+        shift = v.bit_length() - self.precision - 1
+
+        if shift <= 0:
+            return v
+
+        return (((v >> shift) + 1) << shift) - 1
+
+    def record(self, seconds, count=1):
+        """
+        Records a value of C{seconds}, C{count} times.
+        """
+        v = max(int(round(seconds / self.unit)), 0)
+        key = self._bucket(v)
+
+        self.counts[key] = self.counts.get(key, 0) + count
+        self.total += count
+        self.sum += v * count
+
+        if self.min is None or v < self.min:
+            self.min = v
+
+        if self.max is None or v > self.max:
+            self.max = v
+
+    def merge(self, other):
+        """
+        Adds all of the values recorded in C{other} to this histogram.
+        """
+        if (other.precision, other.unit) != (self.precision, self.unit):
+            raise ValueError('Cannot merge histograms with different '
+                'precision/unit')
+
+        for k, c in other.counts.iteritems():
+            self.counts[k] = self.counts.get(k, 0) + c
+
+        self.total += other.total
+        self.sum += other.sum
+
+        for attr, func in (('min', min), ('max', max)):
+            values = [x for x in (getattr(self, attr), getattr(other, attr))
+                if x is not None]
+
+            if values:
+                setattr(self, attr, func(values))
+
+    def percentile(self, pct):
+        """
+        Returns the value (in seconds) below which C{pct} percent of the
+        recorded values fall, or C{None} if nothing has been recorded.
+        """
+        if not self.total:
+            return None
+
+        target = max(self.total * pct / 100.0, 1)
+        seen = 0
+
+        for k in sorted(self.counts):
+            seen += self.counts[k]
+
+            if seen >= target:
+                return min(k, self.max) * self.unit
+
+        return self.max * self.unit
+
+    def mean(self):
+        if not self.total:
+            return None
+
+        return float(self.sum) / self.total * self.unit
+
+    def summary(self, percentiles=(50, 90, 99, 99.9, 99.99)):
+        """
+        Returns a C{dict} of the count, min, mean, max and C{percentiles}
+        (keyed as C{p50}, C{p99.9} etc) in seconds.
+        """
+        ret = {
+            'count': self.total,
+            'min': self.min * self.unit if self.min is not None else None,
+            'max': self.max * self.unit if self.max is not None else None,
+            'mean': self.mean(),
+        }
+
+        for p in percentiles:
+            ret['p%s' % (p,)] = self.percentile(p)
+
+        return ret
+
+    def format(self, scale=1e3, ticks=(0, 50, 75, 90, 99, 99.9, 99.99, 100)):
+        """
+        Returns a printable percentile distribution with values multiplied by
+        C{scale} (milliseconds by default).
+        """
+        lines = ['%12s %12s %12s' % ('Value', 'Percentile', 'TotalCount')]
+
+        for p in ticks:
+            v = self.percentile(p)
+
+            if v is None:
+                continue
+
+            lines.append('%12.3f %12.6f %12d' % (v * scale, p / 100.0,
+                int(round(self.total * p / 100.0))))
+
+        m = self.mean()
+
+        if m is not None:
+            lines.append('#[Mean = %.3f, Max = %.3f, Total count = %d]' % (
+                m * scale, self.max * self.unit * scale, self.total))
+
+        return '\n'.join(lines)
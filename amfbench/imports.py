@@ -0,0 +1,253 @@
+"""
+Measures the cost of importing each codec implementation.
+
+Every measurement is made in a fresh interpreter so that nothing is already
+in C{sys.modules}. The child wraps C{__import__} to attribute the time to the
+modules that each import statement loads (much like C{python -X importtime})
+and reports the resident memory the import added.
+"""
+
+import os.path
+import sys
+import subprocess
+
+try:
+    import json
+except ImportError:
+    import simplejson as json
+
+from amfbench import timer, codec
+
+__all__ = ['measure_startup', 'measure_import', 'measure']
+
+
+root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+#: Imports one codec module and reports the cost as JSON. Nothing but the
+#: codec is imported before the timed region (not even C{amfbench}, see
+#: L{measure_import}), so the modules it shares with the rest of AMFBench
+#: are not already in C{sys.modules}.
+child_script = r"""
+import sys
+import time
+
+try:
+    import __builtin__ as builtins
+except ImportError:
+    import builtins
+
+root, module, attr, stub = sys.argv[1:5]
+
+sys.path.insert(0, root)
+
+if stub:
+    # an empty amfbench package, so that importing amfbench.codec._foo does
+    # not run amfbench/__init__ and everything that it imports
+    pkg = type(sys)('amfbench')
+    pkg.__path__ = [stub]
+    sys.modules['amfbench'] = pkg
+
+clock = getattr(time, 'perf_counter', time.time)
+page_size = 4096
+
+if hasattr(sys.modules.get('os'), 'sysconf'):
+    try:
+        page_size = sys.modules['os'].sysconf('SC_PAGE_SIZE')
+    except (ValueError, OSError):
+        pass
+
+
+def get_rss():
+    try:
+        f = open('/proc/self/statm', 'rb')
+    except IOError:
+        return None
+
+    try:
+        return int(f.read().split()[1]) * page_size
+    finally:
+        f.close()
+
+
+modules = {}
+stack = []
+real_import = builtins.__import__
+
+
+def find_loaded(name, new):
+    for m in sorted(new, key=len):
+        if m == name or m.endswith('.' + name):
+            return m
+
+    return None
+
+
+def hook(name, *args, **kwargs):
+    before = set(sys.modules)
+    stack.append(0.0)
+    start = clock()
+
+    try:
+        return real_import(name, *args, **kwargs)
+    finally:
+        elapsed = clock() - start
+        children = stack.pop()
+        # python 2 records failed implicit relative imports as None
+        new = [m for m in set(sys.modules) - before
+            if sys.modules[m] is not None]
+        key = new and find_loaded(name, new)
+
+        if key:
+            modules[key] = {'cumulative': elapsed, 'self': elapsed - children}
+
+            if stack:
+                stack[-1] += elapsed
+        elif stack:
+            stack[-1] += children
+
+
+rss = get_rss()
+builtins.__import__ = hook
+start = clock()
+
+try:
+    kls = __import__(module, None, None, [attr.split('.')[0]])
+
+    for a in attr.split('.'):
+        kls = getattr(kls, a)
+finally:
+    total = clock() - start
+    builtins.__import__ = real_import
+
+after = get_rss()
+
+import json
+
+sys.stdout.write(json.dumps({
+    'package': kls.package,
+    'version': kls.version,
+    'total': total,
+    'rss_delta': after - rss if None not in (rss, after) else None,
+    'modules': modules,
+}))
+"""
+
+
+def _run(args, python=None):
+    p = subprocess.Popen([python or sys.executable] + args,
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    out, err = p.communicate()
+
+    if p.returncode != 0:
+        raise RuntimeError(err.strip().splitlines()[-1] if err.strip() else
+            'exit status %d' % (p.returncode,))
+
+    return out
+
+
+def measure_startup(repeat=10, python=None):
+    """
+    Returns L{timer.summarise} statistics for the wall time of starting (and
+    stopping) a bare interpreter.
+    """
+    samples = []
+
+    for i in xrange(repeat):
+        start = timer.clock()
+        _run(['-c', ''], python)
+        samples.append(timer.clock() - start)
+
+    return timer.summarise(samples)
+
+
+def measure_import(name, repeat=10, python=None):
+    """
+    Imports the codec implementation C{name} in C{repeat} fresh interpreters.
+
+    The module of the codec is located here (see L{codec.get_codec_module})
+    and the child imports only that. The built-in codecs live in
+    C{amfbench.codec}, so the child gives them an empty C{amfbench} package
+    rather than running C{amfbench/__init__}.
+
+    @raise NameError: C{name} is not a valid codec implementation.
+    @raise RuntimeError: The import failed.
+
+    @return: A C{dict} containing the codec C{package} and C{version},
+        L{timer.summarise} statistics of the C{total} import time and the
+        C{wall} time of the child process, the median C{rss_delta} and a
+        C{modules} C{dict} of module name -> median C{cumulative}/C{self}
+        time.
+    """
+    module, attr = codec.get_codec_module(name)
+    stub = ''
+
+    if module.startswith('amfbench.'):
+        stub = os.path.join(root, 'amfbench')
+
+    totals = []
+    walls = []
+    rss = []
+    modules = {}
+    info = None
+
+    for i in xrange(repeat):
+        start = timer.clock()
+        info = json.loads(_run(['-c', child_script, root, module, attr,
+            stub], python))
+        walls.append(timer.clock() - start)
+
+        totals.append(info['total'])
+
+        if info['rss_delta'] is not None:
+            rss.append(info['rss_delta'])
+
+        for m, t in info['modules'].iteritems():
+            d = modules.setdefault(m, {'cumulative': [], 'self': []})
+
+            d['cumulative'].append(t['cumulative'])
+            d['self'].append(t['self'])
+
+    for m, d in modules.iteritems():
+        for k in ('cumulative', 'self'):
+            d[k] = timer.percentile(sorted(d[k]), 50)
+
+    return {
+        'package': info['package'],
+        'version': info['version'],
+        'total': timer.summarise(totals),
+        'wall': timer.summarise(walls),
+        'rss_delta': timer.percentile(sorted(rss), 50),
+        'modules': modules,
+    }
+
+
+def measure(names, repeat=10, python=None):
+    """
+    Measures interpreter startup and the import of each codec in C{names}.
+    Variants (e.g. C{cpickle:highest}) share the import of their codec.
+
+    @return: A C{dict} with the C{startup} statistics and a C{codecs} C{dict}
+        of codec name -> L{measure_import} result (or C{None} if the import
+        failed).
+    """
+    ret = {
+        'startup': measure_startup(repeat, python),
+        'codecs': {},
+    }
+
+    seen = set()
+
+    for name in names:
+        name = name.partition(codec.variant_separator)[0]
+
+        if name in seen:
+            continue
+
+        seen.add(name)
+
+        try:
+            ret['codecs'][name] = measure_import(name, repeat, python)
+        except (NameError, RuntimeError):
+            ret['codecs'][name] = None
+
+    return ret
@@ -0,0 +1,181 @@
+"""
+Memory instrumentation of codec operations.
+
+Heap statistics come from C{tracemalloc} when the interpreter provides it
+(Python 3.4+ or a patched 2.7). Elsewhere the heap cannot be measured, and
+the size and number of objects of the graph (or bytes) that the call
+returned are recorded instead (see L{graph_size}). The process RSS is read
+from C{/proc} where available and falls back to the peak RSS reported by
+C{getrusage}.
+"""
+
+import os
+import sys
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+__all__ = ['get_rss', 'graph_size', 'measure']
+
+
+def _get_page_size():
+    try:
+        return os.sysconf('SC_PAGE_SIZE')
+    except (AttributeError, ValueError, OSError):
+        return 4096
+
+
+page_size = _get_page_size()
+
+
+def get_rss():
+    """
+    Returns the resident set size of this process in bytes, or C{None} if it
+    cannot be determined.
+    """
+    try:
+        f = open('/proc/self/statm', 'rb')
+    except IOError:
+        pass
+    else:
+        try:
+            return int(f.read().split()[1]) * page_size
+        finally:
+            f.close()
+
+    try:
+        import resource
+    except ImportError:
+        return None
+
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    # linux reports kilobytes, darwin bytes
+    if sys.platform == 'darwin':
+        return rss
+
+    return rss * 1024
+
+
+def graph_size(obj):
+    """
+    Returns the approximate number of bytes used by the object graph C{obj}
+    (following C{dict}s, C{list}s, C{tuple}s and instance C{__dict__}s) and
+    the number of objects in it. Shared objects are counted once.
+    """
+    seen = set()
+    stack = [obj]
+    total = 0
+
+    while stack:
+        o = stack.pop()
+
+        if id(o) in seen:
+            continue
+
+        seen.add(id(o))
+        total += sys.getsizeof(o)
+
+        if isinstance(o, dict):
+            stack.extend(o.iterkeys())
+            stack.extend(o.itervalues())
+        elif isinstance(o, (list, tuple)):
+            stack.extend(o)
+        elif hasattr(o, '__dict__'):
+            stack.append(o.__dict__)
+
+    return total, len(seen)
+
+
+def _per_object(value, objects):
+    if value is None or not objects:
+        return None
+
+    return float(value) / objects
+
+
+def _snapshot_totals(snapshot):
+    size = count = 0
+
+    for stat in snapshot.statistics('filename'):
+        size += stat.size
+        count += stat.count
+
+    return size, count
+
+
+def measure(objects, func, *args):
+    """
+    Calls C{func(*args)} once, recording the memory it uses.
+
+    The return value of C{func} is kept alive until the measurements have been
+    taken so that the retained figures include the produced object graph (or
+    bytes).
+
+    @param objects: The number of objects being encoded/decoded. Used to
+        produce the per object figures.
+    @return: A tuple containing the return value of C{func} and a C{dict} of
+        statistics. C{heap} says what was measured: C{tracemalloc} (the
+        C{peak_bytes} and C{allocated_bytes}/C{blocks}) or, if that is not
+        available, C{graph} (the L{graph_size} of the return value as
+        C{retained_bytes}/C{objects}, which is not a heap figure).
+    """
+    stats = {
+        'heap': 'tracemalloc' if tracemalloc is not None else 'graph',
+        'peak_bytes': None,
+        'allocated_bytes': None,
+        'allocated_blocks': None,
+        'retained_bytes': None,
+        'retained_objects': None,
+        'rss_before': None,
+        'rss_after': None,
+        'rss_delta': None,
+    }
+
+    started = False
+
+    if tracemalloc is not None:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            started = True
+
+        before_size, before_count = _snapshot_totals(
+            tracemalloc.take_snapshot())
+
+        if hasattr(tracemalloc, 'reset_peak'):
+            tracemalloc.reset_peak()
+
+        base = tracemalloc.get_traced_memory()[0]
+
+    stats['rss_before'] = get_rss()
+
+    try:
+        ret = func(*args)
+
+        stats['rss_after'] = get_rss()
+
+        if tracemalloc is not None:
+            peak = tracemalloc.get_traced_memory()[1]
+            after_size, after_count = _snapshot_totals(
+                tracemalloc.take_snapshot())
+
+            stats['peak_bytes'] = max(peak - base, 0)
+            stats['allocated_bytes'] = after_size - before_size
+            stats['allocated_blocks'] = after_count - before_count
+        else:
+            stats['retained_bytes'], stats['retained_objects'] = \
+                graph_size(ret)
+    finally:
+        if started:
+            tracemalloc.stop()
+
+    if None not in (stats['rss_before'], stats['rss_after']):
+        stats['rss_delta'] = stats['rss_after'] - stats['rss_before']
+
+    for key in ('peak_bytes', 'allocated_bytes', 'allocated_blocks',
+            'retained_bytes', 'rss_delta'):
+        stats[key + '_per_object'] = _per_object(stats[key], objects)
+
+    return ret, stats
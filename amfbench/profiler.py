@@ -0,0 +1,216 @@
+"""
+Profiles codec calls to find out where the time goes.
+
+Each profile is taken in its own untimed pass (like L{memory.measure}) so the
+timings are unaffected. C{cProfile} produces a table of the hottest functions
+and, optionally, a statistical sampler produces stacks in the collapsed
+format that flamegraph tools (e.g. C{flamegraph.pl}) read.
+"""
+
+import os.path
+import sys
+import signal
+import threading
+import cProfile
+import pstats
+
+from amfbench import timer
+
+__all__ = ['Sampler', 'Profiler', 'format_table', 'format_collapsed']
+
+
+def _label(code):
+    return '%s (%s:%d)' % (code.co_name, os.path.basename(code.co_filename),
+        code.co_firstlineno)
+
+
+class Sampler(object):
+    """
+    A pure Python statistical profiler. Every C{interval} seconds of CPU time
+    the Python stack is recorded.
+
+    C{SIGPROF} is used where it is available. Otherwise a thread inspects
+    C{sys._current_frames} every C{interval} seconds of wall time. Time spent
+    in C code (e.g. the AmFast extension) is charged to the Python function
+    that called it.
+
+    @ivar stacks: A C{dict} of stack (a tuple of frame labels, outermost
+        first) -> number of samples.
+    """
+
+    def __init__(self, interval=0.001):
+        self.interval = interval
+        self.stacks = {}
+        self._root = None
+
+    def _record(self, frame):
+        stack = []
+
+        while frame is not None and frame is not self._root:
+            stack.append(_label(frame.f_code))
+            frame = frame.f_back
+
+        if frame is None:
+            # not inside the profiled call
+            return
+
+        stack.reverse()
+        stack = tuple(stack)
+
+        if stack:
+            self.stacks[stack] = self.stacks.get(stack, 0) + 1
+
+    def _handler(self, signum, frame):
+        self._record(frame)
+
+    def _run_signal(self, func, args):
+        old = signal.signal(signal.SIGPROF, self._handler)
+        signal.setitimer(signal.ITIMER_PROF, self.interval, self.interval)
+
+        try:
+            return self._call(func, args)
+        finally:
+            signal.setitimer(signal.ITIMER_PROF, 0, 0)
+            signal.signal(signal.SIGPROF, old)
+
+    def _run_thread(self, func, args):
+        done = threading.Event()
+        ident = threading.current_thread().ident
+
+        def sample():
+            while not done.wait(self.interval):
+                frame = sys._current_frames().get(ident)
+
+                if frame is not None:
+                    self._record(frame)
+
+        t = threading.Thread(target=sample)
+        t.daemon = True
+        t.start()
+
+        try:
+            return self._call(func, args)
+        finally:
+            done.set()
+            t.join()
+
+    def _call(self, func, args):
+        self._root = sys._getframe()
+
+        try:
+            return func(*args)
+        finally:
+            self._root = None
+
+    def run(self, func, *args):
+        """
+        Calls C{func(*args)}, sampling its stack.
+        """
+        if hasattr(signal, 'setitimer') and \
+                threading.current_thread().name == 'MainThread':
+            return self._run_signal(func, args)
+
+        return self._run_thread(func, args)
+
+
+class Profiler(object):
+    """
+    Profiles a codec call with C{cProfile} and, if C{interval} is set, a
+    L{Sampler}.
+
+    @ivar top: The number of functions to report.
+    @ivar interval: The L{Sampler} interval in seconds, or C{None} to skip
+        sampling.
+    @ivar min_time: The call is repeated until it has been profiled for at
+        least this many seconds, so that short calls produce enough samples.
+    """
+
+    def __init__(self, top=25, interval=None, min_time=0.5):
+        self.top = top
+        self.interval = interval
+        self.min_time = min_time
+
+    def _repeat(self, func, args):
+        calls = 0
+        start = timer.clock()
+
+        while True:
+            func(*args)
+            calls += 1
+
+            if timer.clock() - start >= self.min_time:
+                return calls
+
+    def run(self, func, *args):
+        """
+        Profiles C{func(*args)}.
+
+        @return: A C{dict} containing the number of C{calls} profiled, the
+            C{functions} with the most internal time (each a C{dict} of
+            C{function}, C{ncalls}, C{tottime} and C{cumtime}, all per call)
+            and, if sampling, the C{collapsed} stacks (stack string -> number
+            of samples) and the C{interval}.
+        """
+        prof = cProfile.Profile()
+        calls = prof.runcall(self._repeat, func, args)
+
+        stats = pstats.Stats(prof).stats
+        functions = []
+
+        code = self._repeat.im_func.func_code
+        ignore = (code.co_filename, code.co_firstlineno, code.co_name)
+
+        for (filename, line, name), (cc, nc, tt, ct, callers) in \
+                stats.iteritems():
+            if (filename, line, name) == ignore or '_lsprof.Profiler' in name:
+                continue
+
+            functions.append({
+                'function': '%s (%s:%d)' % (name, os.path.basename(filename),
+                    line),
+                'ncalls': float(nc) / calls,
+                'tottime': tt / calls,
+                'cumtime': ct / calls,
+            })
+
+        functions.sort(key=lambda f: f['tottime'], reverse=True)
+
+        ret = {
+            'calls': calls,
+            'functions': functions[:self.top],
+        }
+
+        if self.interval:
+            sampler = Sampler(self.interval)
+            sampler.run(self._repeat, func, args)
+
+            ret['interval'] = self.interval
+            ret['collapsed'] = dict([(';'.join(stack[1:]), n)
+                for stack, n in sampler.stacks.iteritems() if stack[1:]])
+
+        return ret
+
+
+def format_table(profile):
+    """
+    Returns the C{functions} of a L{Profiler.run} result as a text table.
+    """
+    lines = ['%d calls profiled, ncalls and times are per call' % (
+            profile['calls'],),
+        '%10s %12s %12s  %s' % ('ncalls', 'tottime(ms)', 'cumtime(ms)',
+            'function')]
+
+    for f in profile['functions']:
+        lines.append('%10.1f %12.4f %12.4f  %s' % (f['ncalls'],
+            f['tottime'] * 1e3, f['cumtime'] * 1e3, f['function']))
+
+    return '\n'.join(lines) + '\n'
+
+
+def format_collapsed(profile):
+    """
+    Returns the C{collapsed} stacks of a L{Profiler.run} result in the format
+    read by C{flamegraph.pl}: one C{frame;frame;frame count} line per stack.
+    """
+    return ''.join(['%s %d\n' % (stack, n)
+        for stack, n in sorted(profile.get('collapsed', {}).iteritems())])
@@ -0,0 +1,287 @@
+"""
+Parses and builds AMF remoting packets (the envelope that Flash Remoting
+requests and responses travel in).
+
+A packet is::
+
+    version     u16
+    headers     u16 count, then for each: name (u16 length + UTF-8),
+                must_understand (u8), length (u32) and an AMF0 value
+    messages    u16 count, then for each: target and response (u16 length +
+                UTF-8 each), length (u32) and an AMF0 value
+
+The parser only walks the envelope. Header and message values are recorded
+as offsets into the original data, so routing a packet never copies (or
+decodes) a body; L{Packet.get_value} returns a zero-copy view when one is
+needed.
+"""
+
+import struct
+
+__all__ = ['RemotingError', 'Header', 'Message', 'Packet', 'parse',
+    'encode_packet', 'encode_arguments', 'get_arguments']
+
+
+#: The length recorded for a value when the encoder did not know it.
+UNKNOWN_LENGTH = 0xffffffff
+
+
+class RemotingError(Exception):
+    """
+    The data is not a valid remoting packet.
+    """
+
+
+def _view(data, offset, length):
+    if isinstance(data, memoryview):
+        return data[offset:offset + length]
+
+    try:
+        return buffer(data, offset, length)
+    except NameError:
+        return memoryview(data)[offset:offset + length]
+
+
+def _copy(data, start, end):
+    """
+    Returns C{data[start:end]} as a C{str}. Slicing a C{memoryview} returns
+    another C{memoryview}.
+    """
+    ret = data[start:end]
+
+    if isinstance(ret, memoryview):
+        return ret.tobytes()
+
+    return ret
+
+
+class Header(object):
+    """
+    @ivar name: The name of the header.
+    @ivar must_understand: Whether the receiver must process the header.
+    @ivar offset: The offset of the (encoded) value in the packet data.
+    @ivar length: The length of the value.
+    """
+
+    __slots__ = ('name', 'must_understand', 'offset', 'length')
+
+    def __init__(self, name, must_understand, offset, length):
+        self.name = name
+        self.must_understand = must_understand
+        self.offset = offset
+        self.length = length
+
+    def __repr__(self):
+        return '<%s %r must_understand=%r %d bytes>' % (
+            self.__class__.__name__, self.name, self.must_understand,
+            self.length)
+
+
+class Message(object):
+    """
+    @ivar target: The service (request) or response URI (C{/1/onResult})
+        that the message is for.
+    @ivar response: The URI that a response should be sent to.
+    @ivar offset: The offset of the (encoded) value in the packet data.
+    @ivar length: The length of the value.
+    """
+
+    __slots__ = ('target', 'response', 'offset', 'length')
+
+    def __init__(self, target, response, offset, length):
+        self.target = target
+        self.response = response
+        self.offset = offset
+        self.length = length
+
+    def __repr__(self):
+        return '<%s %r response=%r %d bytes>' % (self.__class__.__name__,
+            self.target, self.response, self.length)
+
+
+class Packet(object):
+    """
+    A parsed remoting packet.
+
+    @ivar data: The raw packet data.
+    @ivar version: The AMF version of the client (0 or 3).
+    @ivar headers: A list of L{Header}s.
+    @ivar messages: A list of L{Message}s.
+    """
+
+    def __init__(self, data, version, headers, messages):
+        self.data = data
+        self.version = version
+        self.headers = headers
+        self.messages = messages
+
+    def __repr__(self):
+        return '<%s version=%d headers=%r messages=%r>' % (
+            self.__class__.__name__, self.version, self.headers,
+            self.messages)
+
+    def get_value(self, item):
+        """
+        Returns a zero-copy view of the encoded value of the L{Header} or
+        L{Message} C{item}.
+        """
+        return _view(self.data, item.offset, item.length)
+
+    def get_bytes(self, item):
+        """
+        Returns a copy of the encoded value of C{item} as a C{str}.
+        """
+        return _copy(self.data, item.offset, item.offset + item.length)
+
+
+def _read_string(data, offset):
+    l, = struct.unpack_from('!H', data, offset)
+    offset += 2
+
+    if offset + l > len(data):
+        raise RemotingError('String at offset %d overruns the packet' % (
+            offset - 2,))
+
+    return _copy(data, offset, offset + l).decode('utf-8'), offset + l
+
+
+def _read_length(data, offset, last):
+    """
+    Returns the length of the value at C{offset} and the offset after it. An
+    unknown length can only be resolved for the C{last} value in the packet.
+    """
+    l, = struct.unpack_from('!L', data, offset)
+    offset += 4
+
+    if l == UNKNOWN_LENGTH:
+        if not last:
+            raise RemotingError('Value at offset %d has an unknown length' % (
+                offset,))
+
+        l = len(data) - offset
+
+    if offset + l > len(data):
+        raise RemotingError('Value at offset %d overruns the packet' % (
+            offset,))
+
+    return l, offset
+
+
+def parse(data):
+    """
+    Parses the envelope of the remoting packet C{data} (a C{str}, C{buffer}
+    or C{memoryview}).
+
+    @rtype: L{Packet}
+    @raise RemotingError: C{data} is not a valid packet.
+    """
+    try:
+        version, count = struct.unpack_from('!HH', data, 0)
+        offset = 4
+
+        headers = []
+
+        for i in xrange(count):
+            name, offset = _read_string(data, offset)
+            must_understand = data[offset] != '\x00'
+            length, offset = _read_length(data, offset + 1, False)
+
+            headers.append(Header(name, must_understand, offset, length))
+            offset += length
+
+        count, = struct.unpack_from('!H', data, offset)
+        offset += 2
+
+        messages = []
+
+        for i in xrange(count):
+            target, offset = _read_string(data, offset)
+            response, offset = _read_string(data, offset)
+            length, offset = _read_length(data, offset, i == count - 1)
+
+            messages.append(Message(target, response, offset, length))
+            offset += length
+    except (struct.error, IndexError):
+        raise RemotingError('Truncated remoting packet')
+
+    if version not in (0, 3):
+        raise RemotingError('Unknown AMF version %r' % (version,))
+
+    return Packet(data, version, headers, messages)
+
+
+def _write_string(s):
+    if isinstance(s, unicode):
+        s = s.encode('utf-8')
+
+    return struct.pack('!H', len(s)) + s
+
+
+def encode_packet(version, headers=(), messages=()):
+    """
+    Builds a remoting packet.
+
+    @param version: The AMF version (0 or 3).
+    @param headers: A list of C{(name, must_understand, value)} where
+        C{value} is an encoded AMF0 value.
+    @param messages: A list of C{(target, response, value)} where C{value} is
+        an encoded AMF0 value (see L{encode_arguments} for requests).
+    @return: The packet as a C{str}.
+    """
+    parts = [struct.pack('!HH', version, len(headers))]
+
+    for name, must_understand, value in headers:
+        parts.append(_write_string(name))
+        parts.append(struct.pack('!BL', bool(must_understand), len(value)))
+        parts.append(value)
+
+    parts.append(struct.pack('!H', len(messages)))
+
+    for target, response, value in messages:
+        parts.append(_write_string(target))
+        parts.append(_write_string(response))
+        parts.append(struct.pack('!L', len(value)))
+        parts.append(value)
+
+    return ''.join(parts)
+
+
+def encode_arguments(values, amf3):
+    """
+    Wraps encoded values as the arguments of a request the way the Flash
+    Player does: an AMF0 strict array, switching to AMF3 for each value if
+    C{amf3} is set.
+
+    @param values: A list of encoded (AMF0 or AMF3) values.
+    """
+    prefix = '\x11' if amf3 else ''
+
+    return '\x0a' + struct.pack('!L', len(values)) + ''.join(
+        [prefix + v for v in values])
+
+
+def get_arguments(data, offset, length):
+    """
+    Finds the first request argument in the message value at C{offset}
+    without decoding it (see L{encode_arguments}). The argument is assumed to
+    be the last (normally the only) one, so it runs to the end of the value.
+
+    @return: A tuple of the number of arguments, the offset and length of the
+        first argument and whether it is AMF3.
+    @raise RemotingError: The value is not an argument array.
+    """
+    end = offset + length
+
+    if length < 5 or data[offset] != '\x0a':
+        raise RemotingError('Message value at offset %d is not an argument '
+            'array' % (offset,))
+
+    count, = struct.unpack_from('!L', data, offset + 1)
+    offset += 5
+
+    amf3 = offset < end and data[offset] == '\x11'
+
+    if amf3:
+        offset += 1
+
+    return count, offset, end - offset, amf3
@@ -0,0 +1,259 @@
+"""
+Renders C{mark.py} results as a static HTML report with inline SVG charts.
+"""
+
+import math
+import cgi
+import time
+
+__all__ = ['merge', 'render']
+
+
+colours = ('#1f77b4', '#d62728', '#2ca02c', '#ff7f0e', '#9467bd',
+    '#8c564b', '#e377c2', '#7f7f7f', '#bcbd22', '#17becf')
+
+
+def merge(*data):
+    """
+    Merges several result C{dict}s (as pickled by C{mark.py}) into one.
+    Cells present in more than one are taken from the last.
+    """
+    ret = {}
+
+    for d in data:
+        for type in ('decode', 'encode'):
+            for b, encodings in d.get(type, {}).iteritems():
+                for encoding, sizes in encodings.iteritems():
+                    for size, packages in sizes.iteritems():
+                        ret.setdefault(type, {}).setdefault(b, {}).setdefault(
+                            encoding, {}).setdefault(size, {}).update(packages)
+
+    return ret
+
+
+def get_stats(result, size):
+    """
+    Returns a C{dict} of C{median}, C{objects_per_sec} and C{mb_per_sec} for
+    C{result}. Results from before repeated trials (a plain number of
+    seconds) are understood too.
+    """
+    if result is None:
+        return None
+
+    if isinstance(result, (int, long, float)):
+        return {
+            'median': result,
+            'objects_per_sec': size / result if result else None,
+            'mb_per_sec': None,
+        }
+
+    return result
+
+
+def _log_range(values):
+    lo = math.floor(math.log10(min(values)))
+    hi = math.ceil(math.log10(max(values)))
+
+    if hi == lo:
+        hi += 1
+
+    return lo, hi
+
+
+def svg_loglog(series, width=560, height=340, x_label='objects',
+        y_label='seconds'):
+    """
+    Returns an SVG chart of C{series} on log-log axes.
+
+    @param series: A list of C{(label, [(x, y), ...])}.
+    """
+    points = [p for label, s in series for p in s if p[0] > 0 and p[1] > 0]
+
+    if not points:
+        return ''
+
+    left, right, top, bottom = 60, 130, 10, 40
+    pw, ph = width - left - right, height - top - bottom
+
+    x0, x1 = _log_range([p[0] for p in points])
+    y0, y1 = _log_range([p[1] for p in points])
+
+    def sx(x):
+        return left + (math.log10(x) - x0) / (x1 - x0) * pw
+
+    def sy(y):
+        return top + ph - (math.log10(y) - y0) / (y1 - y0) * ph
+
+    out = ['<svg xmlns="http://www.w3.org/2000/svg" width="%d" height="%d" '
+        'font-family="sans-serif" font-size="11">' % (width, height)]
+
+    out.append('<rect x="%d" y="%d" width="%d" height="%d" fill="none" '
+        'stroke="#999"/>' % (left, top, pw, ph))
+
+    for e in xrange(int(x0), int(x1) + 1):
+        x = sx(10 ** e)
+        out.append('<line x1="%.1f" y1="%d" x2="%.1f" y2="%d" stroke="#eee"/>'
+            % (x, top, x, top + ph))
+        out.append('<text x="%.1f" y="%d" text-anchor="middle">1e%d</text>' % (
+            x, top + ph + 15, e))
+
+    for e in xrange(int(y0), int(y1) + 1):
+        y = sy(10 ** e)
+        out.append('<line x1="%d" y1="%.1f" x2="%d" y2="%.1f" stroke="#eee"/>'
+            % (left, y, left + pw, y))
+        out.append('<text x="%d" y="%.1f" text-anchor="end">1e%d</text>' % (
+            left - 5, y + 4, e))
+
+    out.append('<text x="%d" y="%d" text-anchor="middle">%s</text>' % (
+        left + pw / 2, height - 5, cgi.escape(x_label)))
+    out.append('<text x="12" y="%d" text-anchor="middle" '
+        'transform="rotate(-90 12 %d)">%s</text>' % (top + ph / 2,
+        top + ph / 2, cgi.escape(y_label)))
+
+    for i, (label, s) in enumerate(series):
+        colour = colours[i % len(colours)]
+        s = sorted([p for p in s if p[0] > 0 and p[1] > 0])
+
+        if not s:
+            continue
+
+        out.append('<polyline fill="none" stroke="%s" stroke-width="2" '
+            'points="%s"/>' % (colour, ' '.join(['%.1f,%.1f' % (sx(x), sy(y))
+            for x, y in s])))
+
+        for x, y in s:
+            out.append('<circle cx="%.1f" cy="%.1f" r="3" fill="%s"/>' % (
+                sx(x), sy(y), colour))
+
+        ly = top + 15 + i * 16
+        out.append('<rect x="%d" y="%d" width="10" height="10" fill="%s"/>' % (
+            left + pw + 10, ly - 9, colour))
+        out.append('<text x="%d" y="%d">%s</text>' % (left + pw + 25, ly,
+            cgi.escape(label)))
+
+    out.append('</svg>')
+
+    return '\n'.join(out)
+
+
+def _fmt(value, fmt):
+    if value is None:
+        return '-'
+
+    return fmt % (value,)
+
+
+def render_table(sizes, baseline=None):
+    """
+    Returns an HTML table of median time, objects/sec, MB/s and the speed-up
+    against C{baseline} for each size and package.
+    """
+    names = sorted(set([p for s in sizes.itervalues() for p in s]))
+
+    out = ['<table><tr><th>size</th>']
+
+    for p in names:
+        cols = 4 if baseline and p != baseline else 3
+        out.append('<th colspan="%d">%s</th>' % (cols, cgi.escape(p)))
+
+    out.append('</tr><tr><th></th>')
+
+    for p in names:
+        out.append('<th>ms</th><th>objects/s</th><th>MB/s</th>')
+
+        if baseline and p != baseline:
+            out.append('<th>vs %s</th>' % (cgi.escape(baseline),))
+
+    out.append('</tr>')
+
+    for size in sorted(sizes):
+        row = sizes[size]
+        base = get_stats(row.get(baseline), size) if baseline else None
+
+        out.append('<tr><td>%d</td>' % (size,))
+
+        for p in names:
+            r = get_stats(row.get(p), size)
+
+            wrong = r is not None and r.get('verified') is False
+
+            if r is None:
+                out.append('<td colspan="3" class="err">failed</td>')
+            else:
+                attrs = ''
+
+                if wrong:
+                    attrs = ' class="wrong" title="unverified output"'
+
+                out.append('<td%s>%s</td><td%s>%s</td><td%s>%s</td>' % (
+                    attrs, _fmt(r['median'] * 1e3, '%.3f'),
+                    attrs, _fmt(r.get('objects_per_sec'), '%.0f'),
+                    attrs, _fmt(r.get('mb_per_sec'), '%.2f')))
+
+            if baseline and p != baseline:
+                if r is None or base is None or not r['median'] or wrong:
+                    out.append('<td>-</td>')
+                else:
+                    ratio = base['median'] / r['median']
+                    out.append('<td class="%s">%.2fx</td>' % (
+                        'fast' if ratio >= 1 else 'slow', ratio))
+
+        out.append('</tr>')
+
+    out.append('</table>')
+
+    return ''.join(out)
+
+
+style = """
+body { font-family: sans-serif; margin: 2em; color: #222; }
+h2 { border-bottom: 1px solid #ccc; }
+table { border-collapse: collapse; margin: 1em 0 2em 0; font-size: 12px; }
+td, th { border: 1px solid #ddd; padding: 3px 6px; text-align: right; }
+td.fast { color: #2ca02c; } td.slow { color: #d62728; }
+td.err { color: #999; text-align: center; }
+td.wrong { color: #999; text-decoration: line-through; }
+"""
+
+
+def render(data, baseline=None, title='AMFBench report'):
+    """
+    Returns the HTML report for C{data}.
+
+    @param baseline: The package that speed-up ratios are relative to.
+    """
+    out = ['<!DOCTYPE html><html><head><meta charset="utf-8"><title>%s'
+        '</title><style>%s</style></head><body><h1>%s</h1>' % (
+        cgi.escape(title), style, cgi.escape(title))]
+
+    out.append('<p>Generated %s. Times are medians.%s Struck out timings '
+        'are from codecs whose output failed verification (mark.py '
+        '--verify).</p>' % (time.strftime('%Y-%m-%d %H:%M:%S'), baseline and
+        ' Speed-up is relative to <b>%s</b> (higher is faster).' % (
+            cgi.escape(baseline),) or ''))
+
+    for type in ('decode', 'encode'):
+        for b in sorted(data.get(type, {})):
+            for encoding in sorted(data[type][b]):
+                sizes = data[type][b][encoding]
+                series = {}
+
+                for size, packages in sizes.iteritems():
+                    for p, r in packages.iteritems():
+                        r = get_stats(r, size)
+
+                        if r is not None:
+                            if r.get('verified') is False:
+                                p = '%s (unverified)' % (p,)
+
+                            series.setdefault(p, []).append(
+                                (size, r['median']))
+
+                out.append('<h2>%s %s AMF%d</h2>' % (type,
+                    cgi.escape(b), encoding))
+                out.append(svg_loglog(sorted(series.items())))
+                out.append(render_table(sizes, baseline))
+
+    out.append('</body></html>')
+
+    return '\n'.join(out)
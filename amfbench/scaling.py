@@ -0,0 +1,229 @@
+"""
+Fits the cost of each codec against payload size.
+
+A codec whose cost is proportional to C{size ** k} shows up as a straight line
+of slope C{k} on a log-log plot. L{fit} estimates C{k} by least squares and
+L{find_knees} looks for sizes where the local slope changes abruptly, which is
+typically where a reference table or buffer stops fitting in a cache.
+"""
+
+import math
+
+__all__ = ['geometric_sizes', 'fit', 'fit_linear', 'find_knees', 'analyse']
+
+
+#: Exponents above C{1 + superlinear_tolerance} are flagged as super-linear.
+superlinear_tolerance = 0.15
+
+#: A change in local slope of at least this much is reported as a knee.
+knee_threshold = 0.3
+
+#: The keys of a result's C{memory} stats (see L{amfbench.memory.measure})
+#: that L{analyse} fits against size, in order of preference. Without
+#: tracemalloc there is no heap peak, and C{retained_bytes} (the size of the
+#: object graph each call returns) is used before the RSS growth.
+memory_measures = ('peak_bytes', 'allocated_bytes', 'retained_bytes',
+    'rss_delta')
+
+
+def geometric_sizes(start, stop, per_decade=1):
+    """
+    Returns a geometric series of integer sizes from C{start} to C{stop}
+    (inclusive) with C{per_decade} points for every factor of 10.
+    """
+    if start < 1 or stop < start:
+        raise ValueError('Invalid range %r:%r' % (start, stop))
+
+    if per_decade < 1:
+        raise ValueError('per_decade must be >= 1 (got %r)' % (per_decade,))
+
+    ret = []
+    steps = int(round(math.log10(float(stop) / start) * per_decade))
+
+    for i in xrange(steps + 1):
+        n = int(round(start * 10 ** (float(i) / per_decade)))
+
+        # rounding steps to a whole number can take the last point past stop
+        if n > stop:
+            break
+
+        if n not in ret:
+            ret.append(n)
+
+    if ret[-1] != stop:
+        ret.append(stop)
+
+    return ret
+
+
+def _log_points(sizes, values):
+    return [(math.log(s), math.log(v)) for s, v in zip(sizes, values)
+        if s > 0 and v is not None and v > 0]
+
+
+def fit(sizes, values):
+    """
+    Fits C{values = coefficient * sizes ** exponent}.
+
+    @return: A C{dict} with the C{exponent}, C{coefficient} and C{r2} of the
+        fit, or C{None} if there are fewer than two usable points.
+    """
+    points = _log_points(sizes, values)
+    n = len(points)
+
+    if n < 2:
+        return None
+
+    mx = sum([x for x, y in points]) / n
+    my = sum([y for x, y in points]) / n
+
+    sxx = sum([(x - mx) ** 2 for x, y in points])
+    sxy = sum([(x - mx) * (y - my) for x, y in points])
+    syy = sum([(y - my) ** 2 for x, y in points])
+
+    if not sxx:
+        return None
+
+    exponent = sxy / sxx
+    intercept = my - exponent * mx
+
+    if syy:
+        r2 = (sxy * sxy) / (sxx * syy)
+    else:
+        r2 = 1.0
+
+    return {
+        'exponent': exponent,
+        'coefficient': math.exp(intercept),
+        'r2': r2,
+        'superlinear': exponent > 1 + superlinear_tolerance,
+    }
+
+
+def fit_linear(xs, ys):
+    """
+    Fits C{ys = intercept + slope * xs} by least squares, e.g. the time per
+    message against the number of objects in it, where the C{intercept} is
+    the fixed cost of a message and the C{slope} the cost of each object.
+
+    @return: A C{dict} with the C{intercept}, C{slope} and C{r2} of the fit,
+        or C{None} if there are fewer than two distinct C{xs}.
+    """
+    points = [(float(x), float(y)) for x, y in zip(xs, ys) if y is not None]
+    n = len(points)
+
+    if n < 2:
+        return None
+
+    mx = sum([x for x, y in points]) / n
+    my = sum([y for x, y in points]) / n
+
+    sxx = sum([(x - mx) ** 2 for x, y in points])
+    sxy = sum([(x - mx) * (y - my) for x, y in points])
+    syy = sum([(y - my) ** 2 for x, y in points])
+
+    if not sxx:
+        return None
+
+    slope = sxy / sxx
+
+    if syy:
+        r2 = (sxy * sxy) / (sxx * syy)
+    else:
+        r2 = 1.0
+
+    return {
+        'intercept': my - slope * mx,
+        'slope': slope,
+        'r2': r2,
+    }
+
+
+def find_knees(sizes, values, threshold=None):
+    """
+    Returns the sizes at which the log-log slope increases by at least
+    C{threshold} compared to the previous segment.
+    """
+    if threshold is None:
+        threshold = knee_threshold
+
+    points = sorted(_log_points(sizes, values))
+    slopes = []
+
+    for (x0, y0), (x1, y1) in zip(points, points[1:]):
+        slopes.append(((y1 - y0) / (x1 - x0), x0))
+
+    ret = []
+
+    for (prev, _), (slope, x) in zip(slopes, slopes[1:]):
+        if slope - prev >= threshold:
+            ret.append(int(round(math.exp(x))))
+
+    return ret
+
+
+def _get_memory(result):
+    """
+    Returns the first of L{memory_measures} recorded for C{result}, as a tuple
+    of the key and the value, or C{(None, None)}.
+    """
+    mem = result.get('memory') or {}
+
+    for key in memory_measures:
+        if mem.get(key) is not None:
+            return key, mem[key]
+
+    return None, None
+
+
+def analyse(results):
+    """
+    Fits time (the median) and memory (the first of L{memory_measures} that
+    was recorded) against size for every codec in C{results}. The key that
+    memory was fitted on is given as C{memory_measure}. The C{memory} fit is
+    C{None} when there were fewer than two positive values, which is usual
+    for C{rss_delta} since freed memory is rarely returned to the OS.
+
+    @param results: A C{dict} of C{builder -> encoding -> size -> package ->
+        result}, as produced by C{mark.bench}.
+    @return: A C{dict} of C{builder -> encoding -> package -> analysis}.
+    """
+    ret = {}
+
+    for b, encodings in results.iteritems():
+        for encoding, sizes in encodings.iteritems():
+            series = {}
+
+            for size, packages in sizes.iteritems():
+                for package, result in packages.iteritems():
+                    if result is None:
+                        continue
+
+                    s = series.setdefault(package, ([], [], [], set()))
+                    key, value = _get_memory(result)
+
+                    s[0].append(size)
+                    s[1].append(result['median'])
+                    s[2].append(value)
+
+                    if key is not None:
+                        s[3].add(key)
+
+            r = ret.setdefault(b, {}).setdefault(encoding, {})
+
+            for package, (n, times, mem, keys) in series.iteritems():
+                measure = None
+
+                if keys:
+                    measure = min(keys, key=memory_measures.index)
+
+                r[package] = {
+                    'sizes': sorted(n),
+                    'time': fit(n, times),
+                    'time_knees': find_knees(n, times),
+                    'memory': fit(n, mem),
+                    'memory_measure': measure,
+                    'memory_knees': find_knees(n, mem),
+                }
+
+    return ret
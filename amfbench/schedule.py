@@ -0,0 +1,247 @@
+"""
+Schedules benchmark trials so that the order they run in does not favour any
+codec.
+
+Run in a fixed order, whichever codec goes first gets a cool CPU, an
+unfragmented heap and the full turbo frequency. L{order} instead splits every
+cell into trials and runs them in rounds, each round in a (seeded) random
+order, and L{merge} combines the trials of a cell again. The process can be
+pinned to chosen CPUs with L{set_affinity} and L{snapshot} records the CPU
+frequency governor, clock and load around each trial, so that runs on a
+shared host can be checked for interference.
+
+C{os.sched_setaffinity} only exists from Python 3.3. On Linux it is called
+through C{ctypes} otherwise.
+"""
+
+import os
+import random
+
+from amfbench import timer
+
+__all__ = ['parse_cpus', 'get_affinity', 'set_affinity', 'snapshot', 'order',
+    'merge']
+
+
+def parse_cpus(spec):
+    """
+    Returns a sorted list of CPU numbers from a string such as C{0,2-3}.
+
+    @raise ValueError: C{spec} is not valid.
+    """
+    ret = set()
+
+    for part in spec.split(','):
+        start, sep, stop = part.strip().partition('-')
+
+        try:
+            start = int(start)
+            stop = int(stop) if sep else start
+        except ValueError:
+            raise ValueError('%r is not a valid list of CPUs' % (spec,))
+
+        if start < 0 or stop < start:
+            raise ValueError('%r is not a valid list of CPUs' % (spec,))
+
+        ret.update(xrange(start, stop + 1))
+
+    return sorted(ret)
+
+
+_libc = None
+
+#: The number of CPUs in the C{cpu_set_t} passed to libc.
+_setsize = 1024
+
+
+def _get_libc():
+    global _libc
+
+    if _libc is None:
+        import ctypes
+        import ctypes.util
+
+        name = ctypes.util.find_library('c')
+
+        if name is None:
+            raise OSError('libc not found')
+
+        _libc = ctypes.CDLL(name, use_errno=True)
+
+    return _libc
+
+
+def _cpu_set():
+    import ctypes
+
+    bits = ctypes.sizeof(ctypes.c_ulong) * 8
+
+    return (ctypes.c_ulong * (_setsize // bits))(), bits
+
+
+def get_affinity():
+    """
+    Returns a sorted list of the CPUs that this process may run on, or
+    C{None} if that cannot be determined.
+    """
+    if hasattr(os, 'sched_getaffinity'):
+        return sorted(os.sched_getaffinity(0))
+
+    try:
+        libc = _get_libc()
+    except (OSError, ImportError):
+        return None
+
+    import ctypes
+
+    mask, bits = _cpu_set()
+
+    if libc.sched_getaffinity(0, ctypes.sizeof(mask), mask) != 0:
+        return None
+
+    return [i for i in xrange(_setsize) if mask[i // bits] & (1 << (i % bits))]
+
+
+def set_affinity(cpus):
+    """
+    Pins this process (and any children it starts afterwards) to C{cpus}.
+
+    @raise OSError: The affinity could not be set.
+    """
+    if hasattr(os, 'sched_setaffinity'):
+        os.sched_setaffinity(0, cpus)
+
+        return
+
+    try:
+        libc = _get_libc()
+    except ImportError:
+        raise OSError('CPU affinity is not supported here')
+
+    if not hasattr(libc, 'sched_setaffinity'):
+        raise OSError('CPU affinity is not supported here')
+
+    import ctypes
+
+    mask, bits = _cpu_set()
+
+    for cpu in cpus:
+        if cpu >= _setsize:
+            raise OSError('CPU %d is out of range' % (cpu,))
+
+        mask[cpu // bits] |= 1 << (cpu % bits)
+
+    if libc.sched_setaffinity(0, ctypes.sizeof(mask), mask) != 0:
+        e = ctypes.get_errno()
+
+        raise OSError(e, os.strerror(e))
+
+
+def _read(path):
+    try:
+        f = open(path, 'rb')
+    except IOError:
+        return None
+
+    try:
+        return f.read().strip()
+    except IOError:
+        return None
+    finally:
+        f.close()
+
+
+def snapshot(cpus=None):
+    """
+    Records the state of the machine.
+
+    @param cpus: The CPUs to report on. Defaults to L{get_affinity}.
+    @return: A C{dict} of the C{load} (1, 5 and 15 minute load averages) and,
+        for each CPU, its frequency C{governor} and current C{frequency} in
+        MHz. Anything that cannot be read is C{None}.
+    """
+    try:
+        load = os.getloadavg()
+    except (AttributeError, OSError):
+        load = None
+
+    if cpus is None:
+        cpus = get_affinity() or []
+
+    governor = {}
+    frequency = {}
+
+    for cpu in cpus:
+        base = '/sys/devices/system/cpu/cpu%d/cpufreq/' % (cpu,)
+
+        governor[cpu] = _read(base + 'scaling_governor')
+        freq = _read(base + 'scaling_cur_freq')
+
+        try:
+            frequency[cpu] = int(freq) / 1000.0
+        except (TypeError, ValueError):
+            frequency[cpu] = None
+
+    return {
+        'time': timer.clock(),
+        'load': load,
+        'governor': governor,
+        'frequency': frequency,
+    }
+
+
+def order(tasks, trials=1, seed=None):
+    """
+    Returns the order to run C{tasks} in: C{trials} rounds, each of which
+    runs every task once. Within a round the tasks are shuffled if C{seed} is
+    not C{None}.
+
+    @return: A list of C{(trial, task)}.
+    """
+    rng = random.Random(seed) if seed is not None else None
+    ret = []
+
+    for trial in xrange(trials):
+        r = list(tasks)
+
+        if rng is not None:
+            rng.shuffle(r)
+
+        ret.extend([(trial, task) for task in r])
+
+    return ret
+
+
+def merge(results):
+    """
+    Combines the results of the trials of a cell. The samples of every trial
+    are summarised together (see L{timer.summarise}) and the other keys are
+    taken from the first trial. The C{median}, C{slot} and C{environment} of
+    each trial are kept under C{trials}.
+
+    @return: The merged result, or C{None} if any trial failed.
+    """
+    if not results or None in results:
+        return None
+
+    first = results[0]
+    samples = []
+
+    for r in results:
+        samples.extend(r['samples'])
+
+    ret = dict(first)
+    ret.update(timer.summarise(samples, first['objects'], first['bytes'],
+        first.get('warmups')))
+
+    ret['trials'] = [{
+        'median': r['median'],
+        'iterations': r['iterations'],
+        'slot': r.pop('slot', None),
+        'environment': r.pop('environment', None),
+    } for r in results]
+
+    ret.pop('slot', None)
+    ret.pop('environment', None)
+
+    return ret
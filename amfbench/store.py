@@ -0,0 +1,393 @@
+"""
+A local SQLite store of benchmark runs.
+
+Every run records the environment it was produced in (git revision, Python
+version, host CPU) and every cell records the codec package and version, so
+that two runs can be compared with L{compare}.
+"""
+
+import os.path
+import sys
+import math
+import time
+import random
+import socket
+import platform
+import sqlite3
+
+try:
+    import json
+except ImportError:
+    import simplejson as json
+
+__all__ = ['get_environment', 'connect', 'save_run', 'list_runs',
+    'load_run', 'mann_whitney', 'bootstrap_ratio', 'compare']
+
+
+#: The default location of the store.
+default_path = os.path.abspath(os.path.join(
+    os.path.dirname(__file__), '..', 'var', 'results.db'))
+
+schema = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    created REAL,
+    git_revision TEXT,
+    python_version TEXT,
+    host_cpu TEXT,
+    hostname TEXT,
+    platform TEXT,
+    argv TEXT
+);
+
+CREATE TABLE IF NOT EXISTS results (
+    run_id INTEGER REFERENCES runs(id),
+    type TEXT,
+    builder TEXT,
+    encoding INTEGER,
+    size INTEGER,
+    package TEXT,
+    version TEXT,
+    median REAL,
+    p99 REAL,
+    mean REAL,
+    stddev REAL,
+    min REAL,
+    iterations INTEGER,
+    samples TEXT,
+    stats TEXT
+);
+
+CREATE INDEX IF NOT EXISTS results_cell ON results (
+    builder, size, encoding, package);
+"""
+
+
+def get_git_revision():
+    """
+    Returns the git revision of the AMFBench checkout, or C{None}.
+    """
+    import subprocess
+
+    try:
+        p = subprocess.Popen(['git', 'rev-parse', 'HEAD'],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        out, err = p.communicate()
+    except OSError:
+        return None
+
+    if p.returncode != 0:
+        return None
+
+    return out.strip()
+
+
+def get_cpu():
+    """
+    Returns a description of the host CPU.
+    """
+    try:
+        f = open('/proc/cpuinfo', 'rb')
+    except IOError:
+        return platform.processor() or platform.machine()
+
+    try:
+        for line in f:
+            if line.startswith('model name'):
+                return line.split(':', 1)[1].strip()
+    finally:
+        f.close()
+
+    return platform.processor() or platform.machine()
+
+
+def get_environment():
+    """
+    Returns a C{dict} describing the environment that a run is produced in.
+    """
+    return {
+        'git_revision': get_git_revision(),
+        'python_version': platform.python_version(),
+        'host_cpu': get_cpu(),
+        'hostname': socket.gethostname(),
+        'platform': platform.platform(),
+        'argv': ' '.join(sys.argv),
+    }
+
+
+def connect(path=None):
+    """
+    Opens (creating if necessary) the store at C{path}.
+    """
+    if path is None:
+        path = default_path
+
+    dn = os.path.dirname(os.path.abspath(path))
+
+    if not os.path.isdir(dn):
+        os.makedirs(dn)
+
+    db = sqlite3.connect(path)
+    db.executescript(schema)
+
+    return db
+
+
+def save_run(db, results, env=None):
+    """
+    Saves C{results} (the C{{decode/encode: {builder: {encoding: {size:
+    {package: result}}}}}} structure produced by C{mark.py}) as a new run.
+
+    If C{results} has an C{imports} key (see L{imports.measure}), the import
+    time of each codec is saved as an C{import} cell of that codec and the
+    interpreter startup time as a C{startup} cell, with no builder, encoding
+    or size.
+
+    @return: The id of the new run.
+    """
+    if env is None:
+        env = get_environment()
+
+    cur = db.execute('INSERT INTO runs (created, git_revision, '
+        'python_version, host_cpu, hostname, platform, argv) '
+        'VALUES (?, ?, ?, ?, ?, ?, ?)', (time.time(), env['git_revision'],
+        env['python_version'], env['host_cpu'], env['hostname'],
+        env['platform'], env['argv']))
+
+    run_id = cur.lastrowid
+    rows = []
+
+    for type in ('decode', 'encode'):
+        for b, encodings in results.get(type, {}).iteritems():
+            for encoding, sizes in encodings.iteritems():
+                for size, packages in sizes.iteritems():
+                    for package, r in packages.iteritems():
+                        if r is None:
+                            rows.append((run_id, type, b, encoding, size,
+                                package, None, None, None, None, None, None,
+                                None, None, None))
+
+                            continue
+
+                        rows.append((run_id, type, b, encoding, size, package,
+                            r.get('version'), r['median'], r['p99'],
+                            r['mean'], r['stddev'], r['min'],
+                            r['iterations'], json.dumps(r['samples']),
+                            json.dumps(r)))
+
+    imports = results.get('imports')
+
+    if imports:
+        cells = [('startup', 'python', None, imports['startup'])]
+
+        for name, r in imports['codecs'].iteritems():
+            if r is None:
+                cells.append(('import', name, None, None))
+            else:
+                cells.append(('import', name, r['version'], r['total']))
+
+        for type, package, version, r in cells:
+            if r is None:
+                rows.append((run_id, type, None, None, None, package, None,
+                    None, None, None, None, None, None, None, None))
+
+                continue
+
+            rows.append((run_id, type, None, None, None, package, version,
+                r['median'], r['p99'], r['mean'], r['stddev'], r['min'],
+                r['iterations'], json.dumps(r['samples']), json.dumps(r)))
+
+    db.executemany('INSERT INTO results VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, '
+        '?, ?, ?, ?, ?, ?)', rows)
+    db.commit()
+
+    return run_id
+
+
+def list_runs(db):
+    """
+    Returns a list of C{dict}s describing each run, oldest first.
+    """
+    cur = db.execute('SELECT id, created, git_revision, python_version, '
+        'host_cpu, hostname, platform, argv FROM runs ORDER BY id')
+    keys = [d[0] for d in cur.description]
+
+    return [dict(zip(keys, row)) for row in cur]
+
+
+def load_run(db, run_id):
+    """
+    Returns a C{dict} of C{(type, builder, encoding, size, package) ->
+    result row} for C{run_id}.
+    """
+    cur = db.execute('SELECT type, builder, encoding, size, package, '
+        'version, median, p99, samples FROM results WHERE run_id = ?',
+        (run_id,))
+
+    ret = {}
+
+    for row in cur:
+        type, b, encoding, size, package, version, median, p99, samples = row
+
+        ret[(type, b, encoding, size, package)] = {
+            'version': version,
+            'median': median,
+            'p99': p99,
+            'samples': json.loads(samples) if samples else None,
+        }
+
+    return ret
+
+
+def mann_whitney(a, b):
+    """
+    Two sided Mann-Whitney U test (normal approximation with tie
+    correction).
+
+    @return: The p-value that C{a} and C{b} come from the same distribution.
+    """
+    n1, n2 = len(a), len(b)
+
+    if not n1 or not n2:
+        return None
+
+    combined = sorted([(x, 0) for x in a] + [(x, 1) for x in b])
+    ranks = [0.0] * len(combined)
+    ties = 0.0
+    i = 0
+
+    while i < len(combined):
+        j = i
+
+        while j + 1 < len(combined) and combined[j + 1][0] == combined[i][0]:
+            j += 1
+
+        rank = (i + j) / 2.0 + 1
+
+        for k in xrange(i, j + 1):
+            ranks[k] = rank
+
+        t = j - i + 1
+        ties += t ** 3 - t
+        i = j + 1
+
+    r1 = sum([r for r, (x, g) in zip(ranks, combined) if g == 0])
+    u = r1 - n1 * (n1 + 1) / 2.0
+    n = n1 + n2
+
+    var = n1 * n2 / 12.0 * ((n + 1) - ties / (n * (n - 1)))
+
+    if var <= 0:
+        return 1.0
+
+    z = (u - n1 * n2 / 2.0) / math.sqrt(var)
+
+    return math.erfc(abs(z) / math.sqrt(2))
+
+
+def _median(samples):
+    s = sorted(samples)
+    n = len(s)
+
+    if n % 2:
+        return s[n // 2]
+
+    return (s[n // 2 - 1] + s[n // 2]) / 2.0
+
+
+def bootstrap_ratio(a, b, confidence=0.95, resamples=2000, seed=None):
+    """
+    Estimates a confidence interval for C{median(a) / median(b)} by
+    resampling C{a} and C{b} (with replacement) C{resamples} times.
+
+    @return: A tuple of the ratio and the lower and upper bounds of the
+        C{confidence} interval, or C{None} if either list is empty or has a
+        zero median.
+    """
+    if not a or not b or not _median(b):
+        return None
+
+    rng = random.Random(seed)
+    ratios = []
+
+    for i in xrange(resamples):
+        mb = _median([rng.choice(b) for x in b])
+
+        if not mb:
+            continue
+
+        ratios.append(_median([rng.choice(a) for x in a]) / mb)
+
+    if not ratios:
+        return None
+
+    ratios.sort()
+    tail = (1 - confidence) / 2.0
+    n = len(ratios)
+
+    low = ratios[int(math.floor(tail * (n - 1)))]
+    high = ratios[int(math.ceil((1 - tail) * (n - 1)))]
+
+    return _median(a) / _median(b), low, high
+
+
+def compare(base, new, threshold=0.05, alpha=0.05):
+    """
+    Compares two runs loaded by L{load_run}.
+
+    A cell has regressed if its median or p99 has grown by more than
+    C{threshold} (a fraction) and the difference in its samples is
+    significant at C{alpha}. A cell that worked in C{base} has also regressed
+    if its codec now fails (C{failed}) or it is not in C{new} at all
+    (C{missing}).
+
+    @return: A list of C{dict}s, one per cell in C{base}.
+    """
+    ret = []
+
+    for key in sorted(base):
+        a, b = base[key], new.get(key)
+
+        if a['median'] is None:
+            continue
+
+        if b is None or b['median'] is None:
+            ret.append({
+                'cell': key,
+                'base': a,
+                'new': b,
+                'median_ratio': None,
+                'p99_ratio': None,
+                'p_value': None,
+                'regressed': ['missing' if b is None else 'failed'],
+            })
+
+            continue
+
+        p = mann_whitney(a['samples'] or [], b['samples'] or [])
+        significant = p is not None and p < alpha
+
+        median_ratio = b['median'] / a['median'] if a['median'] else None
+        p99_ratio = b['p99'] / a['p99'] if a['p99'] else None
+
+        regressed = []
+
+        if significant:
+            if median_ratio is not None and median_ratio > 1 + threshold:
+                regressed.append('median')
+
+            if p99_ratio is not None and p99_ratio > 1 + threshold:
+                regressed.append('p99')
+
+        ret.append({
+            'cell': key,
+            'base': a,
+            'new': b,
+            'median_ratio': median_ratio,
+            'p99_ratio': p99_ratio,
+            'p_value': p,
+            'regressed': regressed,
+        })
+
+    return ret
@@ -0,0 +1,218 @@
+"""
+Repeated trial timing of codec operations.
+
+A single call to a codec is rarely long enough to produce a meaningful number
+so the operation is run a number of times (after some warmup calls) and the
+resulting samples are summarised.
+"""
+
+import math
+import time
+
+__all__ = ['clock', 'Policy', 'run', 'percentile', 'summarise']
+
+
+def _get_clock():
+    """
+    Returns the highest resolution monotonic clock that is available.
+
+    Python < 3.3 does not expose a monotonic clock so we try to go straight to
+    C{clock_gettime(CLOCK_MONOTONIC)} before falling back to
+    L{timeit.default_timer}.
+    """
+    for attr in ('perf_counter', 'monotonic'):
+        func = getattr(time, attr, None)
+
+        if func is not None:
+            return func
+
+    try:
+        import ctypes
+        import ctypes.util
+
+        class timespec(ctypes.Structure):
+            _fields_ = [('tv_sec', ctypes.c_long), ('tv_nsec', ctypes.c_long)]
+
+        lib = ctypes.CDLL(ctypes.util.find_library('rt') or
+            ctypes.util.find_library('c'), use_errno=True)
+        clock_gettime = lib.clock_gettime
+        clock_gettime.argtypes = [ctypes.c_int, ctypes.POINTER(timespec)]
+
+        CLOCK_MONOTONIC = 1
+        ts = timespec()
+
+        if clock_gettime(CLOCK_MONOTONIC, ctypes.pointer(ts)) != 0:
+            raise OSError(ctypes.get_errno())
+    except Exception:
+        import timeit
+
+        return timeit.default_timer
+
+    def monotonic():
+        clock_gettime(CLOCK_MONOTONIC, ctypes.pointer(ts))
+
+        return ts.tv_sec + ts.tv_nsec * 1e-9
+
+    return monotonic
+
+
+clock = _get_clock()
+
+
+class Policy(object):
+    """
+    Determines how many times an operation is run in order to time it.
+
+    At least C{iterations} samples are taken. If C{min_time} is set, sampling
+    continues until that many seconds have been measured or C{max_iterations}
+    samples have been taken, whichever comes first.
+
+    @ivar warmup: The number of calls made before measuring. These are
+        excluded from the samples but reported separately.
+    @ivar iterations: The minimum number of timed calls.
+    @ivar min_time: The minimum number of seconds to spend measuring.
+    @ivar max_iterations: The upper bound on timed calls when C{min_time} is
+        set.
+    """
+
+    def __init__(self, warmup=1, iterations=5, min_time=0.0,
+            max_iterations=1000):
+        if warmup < 0:
+            raise ValueError('warmup must be >= 0 (got %r)' % (warmup,))
+
+        if iterations < 1:
+            raise ValueError('iterations must be >= 1 (got %r)' % (
+                iterations,))
+
+        self.warmup = warmup
+        self.iterations = iterations
+        self.min_time = min_time
+        self.max_iterations = max(max_iterations, iterations)
+
+    def __repr__(self):
+        return '<%s warmup=%r iterations=%r min_time=%r max_iterations=%r>' % (
+            self.__class__.__name__, self.warmup, self.iterations,
+            self.min_time, self.max_iterations)
+
+
+#: Used when no policy is supplied.
+default_policy = Policy()
+
+
+def run(policy, func, *args):
+    """
+    Calls C{func(*args)} according to C{policy}, timing each call.
+
+    Any exception raised by C{func} is propagated.
+
+    @return: A tuple containing the list of samples (in seconds), the return
+        value of the last call to C{func} and the list of warmup timings.
+    """
+    if policy is None:
+        policy = default_policy
+
+    ret = None
+    warmups = []
+
+    for i in xrange(policy.warmup):
+        start = clock()
+        ret = func(*args)
+        warmups.append(clock() - start)
+
+    samples = []
+    elapsed = 0.0
+
+    while True:
+        start = clock()
+        ret = func(*args)
+        sample = clock() - start
+
+        samples.append(sample)
+        elapsed += sample
+
+        if len(samples) < policy.iterations:
+            continue
+
+        if elapsed >= policy.min_time or len(samples) >= policy.max_iterations:
+            break
+
+    return samples, ret, warmups
+
+
+def percentile(samples, pct):
+    """
+    Returns the C{pct} percentile of C{samples}, interpolating linearly
+    between the closest ranks.
+
+    @param samples: A sorted list of numbers.
+    @param pct: A number between 0 and 100.
+    """
+    if not samples:
+        return None
+
+    k = (len(samples) - 1) * (pct / 100.0)
+    f = int(math.floor(k))
+    c = int(math.ceil(k))
+
+    if f == c:
+        return samples[f]
+
+    return samples[f] + (samples[c] - samples[f]) * (k - f)
+
+
+def summarise(samples, objects=None, bytes=None, warmups=None):
+    """
+    Produces summary statistics for a list of timing samples.
+
+    @param samples: The list of timings (in seconds).
+    @param objects: The number of objects processed in each sample. Used to
+        calculate C{objects_per_sec}.
+    @param bytes: The number of bytes processed in each sample. Used to
+        calculate C{mb_per_sec} (1 MB = 2**20 bytes).
+    @param warmups: The list of warmup timings, if any. The first call made
+        (cold caches) is reported as C{first_call} and its excess over the
+        steady state median as C{cold_penalty}.
+    @return: A C{dict} of statistics. C{objects_per_sec} and C{mb_per_sec} are
+        derived from the median.
+    """
+    s = sorted(samples)
+    n = len(s)
+
+    mean = sum(s) / n
+
+    if n > 1:
+        stddev = math.sqrt(sum([(x - mean) ** 2 for x in s]) / (n - 1))
+    else:
+        stddev = 0.0
+
+    median = percentile(s, 50)
+
+    ret = {
+        'samples': list(samples),
+        'iterations': n,
+        'min': s[0],
+        'max': s[-1],
+        'median': median,
+        'mean': mean,
+        'p95': percentile(s, 95),
+        'p99': percentile(s, 99),
+        'stddev': stddev,
+        'objects': objects,
+        'bytes': bytes,
+        'objects_per_sec': None,
+        'mb_per_sec': None,
+    }
+
+    if warmups is not None:
+        ret['warmups'] = list(warmups)
+        ret['first_call'] = (warmups or samples)[0]
+        ret['cold_penalty'] = ret['first_call'] - median
+
+    if median > 0:
+        if objects is not None:
+            ret['objects_per_sec'] = objects / median
+
+        if bytes is not None:
+            ret['mb_per_sec'] = bytes / median / (1024.0 * 1024.0)
+
+    return ret
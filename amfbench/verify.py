@@ -0,0 +1,224 @@
+"""
+Checks that a codec actually produces the right object graph.
+
+A codec that returns the wrong data quickly would otherwise top the chart.
+The decoded graph is compared with the one the builder made, including
+object identity, so a codec that loses (or invents) references fails even
+if the values are equal.
+"""
+
+import datetime
+
+from amfbench import builder
+from amfbench import archive as _archive
+
+__all__ = ['compare', 'check']
+
+
+def _text(value):
+    if isinstance(value, str):
+        return value.decode('utf-8')
+
+    return value
+
+
+def _is_list(value):
+    return isinstance(value, (list, tuple))
+
+
+def _get_bytes(value):
+    """
+    Returns the contents of a decoded ByteArray (C{pyamf.amf3.ByteArray},
+    C{amfast.class_def.as_types.AsByteArray} or C{bytearray}).
+    """
+    if hasattr(value, 'getvalue'):
+        return value.getvalue()
+
+    if hasattr(value, 'bytes'):
+        return str(value.bytes)
+
+    if isinstance(value, (str, bytearray)):
+        return str(value)
+
+    return None
+
+
+def _format_path(path):
+    return ''.join(path) or '<root>'
+
+
+def compare(expected, actual):
+    """
+    Compares the object graph C{actual} with C{expected}.
+
+    Values are compared the way AMF sees them: C{str} and C{unicode} are the
+    same, all numbers are compared by value (AMF0 only has doubles) and any
+    C{dict} or C{list} subclass (e.g. C{pyamf.ASObject}) will do. Builder
+    objects must come back as the same class.
+
+    Each container in C{expected} must map to exactly one container in
+    C{actual} and vice versa, so references that are dropped or introduced
+    are caught too.
+
+    @return: A description of the first difference found or C{None} if the
+        graphs are the same.
+    """
+    seen = {}
+    seen_actual = {}
+    stack = [((), expected, actual)]
+
+    while stack:
+        path, e, a = stack.pop()
+
+        if e is None or isinstance(e, (bool, int, long, float, basestring)):
+            if isinstance(e, bool) != isinstance(a, bool):
+                return '%s: expected %r, got %r' % (_format_path(path), e, a)
+
+            if _text(e) != _text(a):
+                return '%s: expected %r, got %r' % (_format_path(path), e, a)
+
+            continue
+
+        if isinstance(e, datetime.datetime):
+            # immutable and never referenced in AMF0, so compare by value
+            if e != a:
+                return '%s: expected %r, got %r' % (_format_path(path), e, a)
+
+            continue
+
+        if id(e) in seen:
+            if seen[id(e)] is not a:
+                return '%s: reference lost (a copy was decoded)' % (
+                    _format_path(path),)
+
+            continue
+
+        if id(a) in seen_actual:
+            return '%s: unexpected reference to %s' % (_format_path(path),
+                seen_actual[id(a)])
+
+        seen[id(e)] = a
+        seen_actual[id(a)] = _format_path(path)
+
+        if isinstance(e, dict):
+            if not isinstance(a, dict):
+                return '%s: expected a dict, got %r' % (_format_path(path),
+                    type(a))
+
+            items = dict([(_text(k), v) for k, v in a.iteritems()])
+        elif _is_list(e):
+            if not _is_list(a):
+                return '%s: expected a list, got %r' % (_format_path(path),
+                    type(a))
+
+            if len(e) != len(a):
+                return '%s: expected %d items, got %d' % (_format_path(path),
+                    len(e), len(a))
+
+            for i in xrange(len(e) - 1, -1, -1):
+                stack.append((path + ('[%d]' % (i,),), e[i], a[i]))
+
+            continue
+        elif isinstance(e, builder.BaseObject):
+            if a.__class__ is not e.__class__:
+                return '%s: expected %s, got %r' % (_format_path(path),
+                    e.__class__.__name__, type(a))
+
+            items = dict([(_text(k), v) for k, v in a.__dict__.iteritems()])
+            e = e.__dict__
+        elif isinstance(e, bytearray):
+            if _get_bytes(a) != str(e):
+                return '%s: expected a ByteArray of %d bytes, got %r' % (
+                    _format_path(path), len(e), type(a))
+
+            continue
+        else:
+            if e != a:
+                return '%s: expected %r, got %r' % (_format_path(path), e, a)
+
+            continue
+
+        keys = dict([(_text(k), k) for k in e])
+        missing = sorted(set(keys) - set(items))
+        extra = sorted(set(items) - set(keys))
+
+        if missing:
+            return '%s: missing %s' % (_format_path(path),
+                ', '.join(map(repr, missing)))
+
+        if extra:
+            return '%s: unexpected %s' % (_format_path(path),
+                ', '.join(map(repr, extra)))
+
+        for k in sorted(keys, reverse=True):
+            stack.append((path + ('.%s' % (k,),), e[keys[k]], items[k]))
+
+    return None
+
+
+def _read_blob(name, size, encoding, archive=None, params=None):
+    import amfbench
+
+    if archive:
+        return _archive.open_archive(archive).get_bytes(
+            builder.label(name, params), size, encoding)
+
+    f = open(amfbench.get_blob_filename(name, size, encoding, params), 'rb')
+
+    try:
+        return f.read()
+    finally:
+        f.close()
+
+
+def check(codec, type, name, size, encoding, archive=None, cache=None,
+        params=None):
+    """
+    Verifies one benchmark cell.
+
+    For C{decode} the blob is decoded and compared with the builder's graph,
+    then the decoded graph is re-encoded and decoded again. For C{encode} the
+    builder's graph is encoded and decoded by C{codec}.
+
+    @param codec: A L{codec.ICodec} that has been C{setUp}.
+    @param archive: See L{amfbench.decode}.
+    @param cache: See L{amfbench.encode}.
+    @param params: See L{amfbench.encode}.
+    @return: A C{dict} of C{ok} and C{error} (a description of the first
+        problem, or C{None}).
+    """
+    amf3 = encoding != 0
+    params = params or {}
+
+    if cache is not None:
+        expected = cache.get(name, size, **params)
+    else:
+        expected = builder.build(name, size, **params)
+
+    stage = None
+
+    try:
+        if type == 'decode':
+            stage = 'decode'
+            decoded = codec.decode(_read_blob(name, size, encoding, archive,
+                params), amf3)
+            error = compare(expected, decoded)
+
+            if error is None:
+                stage = 're-encode'
+                error = compare(expected, codec.decode(
+                    codec.encode(decoded, amf3), amf3))
+        else:
+            stage = 'encode'
+            error = compare(expected, codec.decode(
+                codec.encode(expected, amf3), amf3))
+    except Exception, e:
+        error = '%s: %s' % (e.__class__.__name__, e)
+
+    if error is not None:
+        error = '%s: %s' % (stage, error)
+
+    return {
+        'ok': error is None,
+        'error': error,
+    }
@@ -0,0 +1,233 @@
+"""
+Wire size of encoded payloads and the cost of compressing them.
+
+A smaller encoding (or a compressed one) can win end to end on a slow link
+even if it takes longer to encode. L{Compression} records the size and the
+compress and decompress times of each encoded blob for a set of compressors
+and levels, and L{model} combines them with the codec timings into a modelled
+latency (encode, compress, transfer, decompress, decode) at each bandwidth.
+
+C{lzma} is part of the standard library from Python 3.3. Older interpreters
+use C{backports.lzma} if it is installed and otherwise skip it.
+"""
+
+import zlib
+import bz2
+
+try:
+    import lzma
+except ImportError:
+    try:
+        from backports import lzma
+    except ImportError:
+        lzma = None
+
+from amfbench import timer
+
+__all__ = ['compressors', 'default_levels', 'get_schemes', 'get_label',
+    'Compression', 'latency', 'model']
+
+
+def _lzma_compress(data, level):
+    return lzma.compress(data, preset=level)
+
+
+def _get_compressors():
+    ret = {
+        'zlib': (zlib.compress, zlib.decompress),
+        'bz2': (bz2.compress, bz2.decompress),
+    }
+
+    if lzma is not None:
+        ret['lzma'] = (_lzma_compress, lzma.decompress)
+
+    return ret
+
+
+#: The available compressors, name -> C{(compress(data, level),
+#: decompress(data))}.
+compressors = _get_compressors()
+
+#: The levels measured for each compressor when none are given.
+default_levels = {
+    'zlib': (1, 6, 9),
+    'bz2': (1, 9),
+    'lzma': (0, 6),
+}
+
+#: The name of the uncompressed scheme in L{model}.
+uncompressed = 'none'
+
+
+def get_schemes(specs):
+    """
+    Returns a sorted list of C{(compressor, level)} from strings such as
+    C{zlib}, C{zlib:1,9} or C{all} (every available compressor at its
+    L{default_levels}).
+
+    @raise ValueError: A spec names an unknown or unavailable compressor, or
+        an invalid level.
+    """
+    ret = set()
+
+    for spec in specs:
+        name, sep, levels = spec.partition(':')
+
+        if name == 'all' and not levels:
+            for name in compressors:
+                ret.update([(name, l) for l in default_levels[name]])
+
+            continue
+
+        if name not in default_levels:
+            raise ValueError('Unknown compressor %r (choose from %r)' % (name,
+                sorted(default_levels)))
+
+        if name not in compressors:
+            raise ValueError('%s is not available in this interpreter' % (
+                name,))
+
+        try:
+            levels = [int(l) for l in levels.split(',') if l] or \
+                default_levels[name]
+        except ValueError:
+            raise ValueError('%r is not a valid list of levels' % (levels,))
+
+        for l in levels:
+            if not 0 <= l <= 9 or (name == 'bz2' and l < 1):
+                raise ValueError('Invalid %s level %r' % (name, l))
+
+            ret.add((name, l))
+
+    return sorted(ret)
+
+
+def get_label(name, level):
+    """
+    Returns the label of a scheme, e.g. C{zlib-1}.
+    """
+    return '%s-%d' % (name, level)
+
+
+class Compression(object):
+    """
+    Measures how well encoded blobs compress.
+
+    @ivar schemes: A list of C{(compressor, level)} (see L{get_schemes}).
+    @ivar policy: The L{timer.Policy} for timing each compress and
+        decompress.
+    """
+
+    def __init__(self, schemes, policy=None):
+        for name, level in schemes:
+            if name not in compressors:
+                raise ValueError('%s is not available' % (name,))
+
+        self.schemes = list(schemes)
+        self.policy = policy or timer.Policy(warmup=1, iterations=3)
+
+    def time(self, func, *args):
+        """
+        Returns the median seconds taken by C{func(*args)} under L{policy}.
+        """
+        samples, ret, warmups = timer.run(self.policy, func, *args)
+
+        return timer.summarise(samples)['median']
+
+    def run(self, bytes, objects=None):
+        """
+        Compresses and decompresses C{bytes} with each of the L{schemes}.
+
+        @param objects: The number of objects encoded in C{bytes}.
+        @return: A C{dict} of scheme label (see L{get_label}) -> C{dict} of the
+            compressed C{bytes}, C{bytes_per_object}, C{ratio} (original /
+            compressed) and the median C{compress} and C{decompress} times.
+        """
+        ret = {}
+
+        for name, level in self.schemes:
+            compress, decompress = compressors[name]
+
+            data = compress(bytes, level)
+
+            c = self.time(compress, bytes, level)
+            d = self.time(decompress, data)
+
+            ret[get_label(name, level)] = {
+                'bytes': len(data),
+                'bytes_per_object': float(len(data)) / objects
+                    if objects else None,
+                'ratio': float(len(bytes)) / len(data) if data else None,
+                'compress': c,
+                'decompress': d,
+            }
+
+        return ret
+
+
+def latency(bytes, bandwidth, encode=0.0, decode=0.0, compress=0.0,
+        decompress=0.0):
+    """
+    Returns the modelled seconds to send a payload: the codec and compressor
+    times plus C{bytes} over a link of C{bandwidth} bytes per second.
+    """
+    return encode + compress + float(bytes) / bandwidth + decompress + decode
+
+
+def model(decode_results, encode_results, bandwidths):
+    """
+    Models the end to end latency of every cell that has both an encode and a
+    decode time, uncompressed (L{uncompressed}) and with each compression
+    scheme that was measured. The decode time is the median of the decode
+    benchmark or, for codecs that cannot decode the reference blobs (e.g.
+    cPickle), the C{decode_time} of the codec's own output.
+
+    @param decode_results: C{builder -> encoding -> size -> package ->
+        result}, as produced by C{mark.bench}.
+    @param encode_results: The same for encoding, with the C{compression}
+        and C{decode_time} recorded by C{amfbench.encode}.
+    @param bandwidths: A list of link speeds in Mbit/s.
+    @return: A C{dict} of C{builder -> encoding -> size -> package ->
+        bandwidth -> scheme -> seconds}.
+    """
+    ret = {}
+
+    for b, encodings in encode_results.iteritems():
+        for encoding, sizes in encodings.iteritems():
+            for size, packages in sizes.iteritems():
+                for package, enc in packages.iteritems():
+                    if enc is None:
+                        continue
+
+                    try:
+                        dec = decode_results[b][encoding][size][package]
+                    except KeyError:
+                        dec = None
+
+                    if dec is not None:
+                        dec = dec['median']
+                    else:
+                        dec = enc.get('decode_time')
+
+                    if dec is None:
+                        continue
+
+                    schemes = {uncompressed: (enc['bytes'], 0.0, 0.0)}
+
+                    for label, c in enc.get('compression', {}).iteritems():
+                        schemes[label] = (c['bytes'], c['compress'],
+                            c['decompress'])
+
+                    r = {}
+
+                    for mbit in bandwidths:
+                        bandwidth = mbit * 1000000 / 8.0
+
+                        r[mbit] = dict([(label, latency(n, bandwidth,
+                            enc['median'], dec, c, d))
+                                for label, (n, c, d) in schemes.iteritems()])
+
+                    ret.setdefault(b, {}).setdefault(encoding, {}).setdefault(
+                        size, {})[package] = r
+
+    return ret
@@ -0,0 +1,331 @@
+#!/usr/bin/env python
+"""
+Measures the fixed cost of each codec call by encoding and decoding many small
+payloads instead of one big one.
+
+For each builder C{--messages} independent payloads of each C{--size} are
+sent three ways:
+
+ - C{calls}: one codec call per payload, as a server handling single RPCs
+   does.
+ - C{packet}: all of the payloads as the messages of one remoting packet
+   (see L{amfbench.remoting}), as a client that batches its calls sends them.
+   Each message body is still a codec call of its own.
+ - C{payload}: all of the payloads in one list, encoded or decoded in a single
+   call.
+
+The time per message is fitted against the number of objects in each message
+(see L{scaling.fit_linear}). The intercept is the fixed cost of a message
+(building C{EncoderContext}/C{DecoderContext}s, streams and so on) and the
+slope the cost of each object, so comparing the intercepts of C{calls} and
+C{payload} shows what batching on the client would save.
+"""
+
+import sys
+from optparse import OptionParser
+
+from amfbench import codec, builder, timer, scaling, remoting
+
+
+#: The ways of sending the messages.
+modes = ('calls', 'packet', 'payload')
+
+
+def encode_calls(c, payloads, amf3):
+    return [c.encode(p, amf3) for p in payloads]
+
+
+def decode_calls(c, blobs, amf3):
+    return [c.decode(b, amf3) for b in blobs]
+
+
+def encode_packet(c, payloads, amf3):
+    """
+    Encodes C{payloads} as the messages of one request packet.
+    """
+    version = 3 if amf3 else 0
+
+    return remoting.encode_packet(version, (), [('batch', '/%d' % (i + 1,),
+        remoting.encode_arguments([c.encode(p, amf3)], amf3))
+            for i, p in enumerate(payloads)])
+
+
+def decode_packet(c, data, amf3):
+    """
+    Parses the packet C{data} and decodes the argument of every message.
+    """
+    packet = remoting.parse(data)
+    ret = []
+
+    for m in packet.messages:
+        count, offset, length, amf3 = remoting.get_arguments(data, m.offset,
+            m.length)
+
+        ret.append(c.decode(data[offset:offset + length], amf3))
+
+    return ret
+
+
+def encode_payload(c, payloads, amf3):
+    return c.encode(payloads, amf3)
+
+
+def decode_payload(c, blob, amf3):
+    return c.decode(blob, amf3)
+
+
+_funcs = {
+    'calls': (encode_calls, decode_calls),
+    'packet': (encode_packet, decode_packet),
+    'payload': (encode_payload, decode_payload),
+}
+
+
+def _size(data):
+    if isinstance(data, list):
+        return sum([len(d) for d in data])
+
+    return len(data)
+
+
+def bench(c, mode, payloads, size, amf3, policy=None):
+    """
+    Times encoding and decoding C{payloads} (each of C{size} objects) with the
+    codec C{c} in the C{mode}.
+
+    @return: A C{dict} of C{encode} and C{decode} to L{timer.summarise}
+        results, each with the C{per_message} median added, or C{None} if the
+        codec failed.
+    """
+    encode, decode = _funcs[mode]
+    messages = len(payloads)
+    objects = size * messages
+
+    c.setUp()
+
+    try:
+        samples, data, warmups = timer.run(policy, encode, c, payloads, amf3)
+        ret = {'encode': timer.summarise(samples, objects, _size(data),
+            warmups)}
+
+        samples, x, warmups = timer.run(policy, decode, c, data, amf3)
+        ret['decode'] = timer.summarise(samples, objects, _size(data),
+            warmups)
+    except Exception:
+        return None
+    finally:
+        c.tearDown()
+
+    for stats in ret.itervalues():
+        stats['messages'] = messages
+        stats['per_message'] = stats['median'] / messages
+
+    return ret
+
+
+def fit(results, sizes):
+    """
+    Fits the time per message against C{sizes} for every cell of C{results}
+    (C{{mode: {builder: {encoding: {size: {package: result}}}}}}).
+
+    @return: C{{op: {mode: {builder: {encoding: {package: fit}}}}}} where each
+        fit is a C{dict} of C{fixed} (seconds per message), C{per_object}
+        (seconds) and C{r2}, or C{None} if there are not enough sizes.
+    """
+    ret = {}
+
+    for mode, builders in results.iteritems():
+        for b, encodings in builders.iteritems():
+            for encoding, by_size in encodings.iteritems():
+                packages = set()
+
+                for r in by_size.itervalues():
+                    packages.update(r)
+
+                for package in packages:
+                    for op in ('encode', 'decode'):
+                        xs, ys = [], []
+
+                        for size in sizes:
+                            r = by_size.get(size, {}).get(package)
+
+                            if r is not None:
+                                xs.append(size)
+                                ys.append(r[op]['per_message'])
+
+                        f = scaling.fit_linear(xs, ys)
+
+                        if f is not None:
+                            f = {
+                                'fixed': f['intercept'],
+                                'per_object': f['slope'],
+                                'r2': f['r2'],
+                            }
+
+                        ret.setdefault(op, {}).setdefault(mode, {}).setdefault(
+                            b, {}).setdefault(encoding, {})[package] = f
+
+    return ret
+
+
+def parse_args(*args):
+    """
+    Parse and validate command line arguments.
+    """
+    parser = OptionParser(usage='%prog [options] [builder ...]',
+        description='Compares many small codec calls with batched messages '
+        'and one large payload, and reports the fixed cost per message and '
+        'the cost per object. Defaults to all builders.')
+
+    impl = codec.get_available_implementations()
+    amf_encodings = ('0', '3')
+
+    parser.add_option('-s', '--size', action='append', dest='sizes',
+        type='int', help='Number of objects in each message. May be supplied '
+        'multiple times; at least two sizes are needed to separate the fixed '
+        'cost from the cost per object. Default is 1, 10 and 50')
+    parser.add_option('-m', '--messages', dest='messages', type='int',
+        default=1000, help='Number of messages. Default is %default')
+    parser.add_option('--mode', action='append', dest='modes',
+        choices=modes, help='How to send the messages. Choices are %r. '
+        'Defaults to all.' % (modes,))
+    parser.add_option('-p', '--param', action='append', dest='params',
+        default=None, metavar='BUILDER.KEY=VALUE', help='Set a parameter of a '
+        'builder, e.g. nested.depth=10. May be supplied multiple times')
+    parser.add_option('-e', '--encoding', action='append', dest='encodings',
+        choices=amf_encodings, help='AMF version/s. Choices are %r. Defaults '
+        'to all.' % (amf_encodings,))
+    parser.add_option('-i', '--implementation', action='append', dest='impl',
+        help='Codec to use. Choices are %r, or NAME:VARIANT for one of the '
+        'variants of a codec and NAME:all for the codec and every one of its '
+        'variants. Defaults to all that can be imported.' % (impl,))
+    parser.add_option('-n', '--iterations', dest='iterations', type='int',
+        default=5, help='Minimum number of timed calls. Default is %default')
+    parser.add_option('-w', '--warmup', dest='warmup', type='int', default=1,
+        help='Number of untimed calls first. Default is %default')
+    parser.add_option('-o', '--out', action='store', dest='output',
+        default=None, help='Also write a pickle of the results here')
+
+    options, args = parser.parse_args()
+
+    if not args:
+        args = builder.builders
+    else:
+        for a in args:
+            if a not in builder.builders:
+                parser.error("%s is not a valid builder, choose from %r" % (
+                    a, builder.builders))
+
+    try:
+        options.params = builder.parse_params(options.params)
+    except ValueError, e:
+        parser.error(str(e))
+
+    if options.sizes is None:
+        options.sizes = [1, 10, 50]
+
+    options.sizes = sorted(set(options.sizes))
+
+    if options.sizes[0] < 1:
+        parser.error('Sizes must be >= 1')
+
+    if options.messages < 1:
+        parser.error('Need >= 1 messages')
+
+    if options.modes is None:
+        options.modes = modes
+
+    if options.encodings is None:
+        options.encodings = amf_encodings
+
+    options.encodings = map(int, options.encodings)
+
+    try:
+        options.impl, skipped = codec.resolve_implementations(options.impl)
+    except NameError, e:
+        parser.error('%s, choose from %r' % (e, impl))
+
+    try:
+        options.policy = timer.Policy(warmup=options.warmup,
+            iterations=options.iterations)
+    except ValueError, e:
+        parser.error(str(e))
+
+    return options, args
+
+
+def main(*args):
+    options, args = parse_args(*args)
+
+    codecs = [codec.get_implementation(name) for name in options.impl]
+
+    results = {}
+
+    print '%-10s %3s %6s %6s  %-10s %-8s %14s %14s' % ('builder', 'amf',
+        'msgs', 'size', 'package', 'mode', 'encode(us/msg)',
+        'decode(us/msg)')
+
+    for b in args:
+        params = options.params.get(b, {})
+        label = builder.label(b, params)
+
+        for size in options.sizes:
+            payloads = [builder.build(b, size, **params)
+                for i in xrange(options.messages)]
+
+            for encoding in options.encodings:
+                for mode in options.modes:
+                    for c in codecs:
+                        r = bench(c, mode, payloads, size, encoding == 3,
+                            options.policy)
+
+                        results.setdefault(mode, {}).setdefault(label,
+                            {}).setdefault(encoding, {}).setdefault(size,
+                            {})[c.package] = r
+
+                        if r is None:
+                            times = ('failed', 'failed')
+                        else:
+                            times = ['%.3f' % (r[op]['per_message'] * 1e6,)
+                                for op in ('encode', 'decode')]
+
+                        print '%-10s %3d %6d %6d  %-10s %-8s %14s %14s' % (
+                            label, encoding, options.messages, size,
+                            c.package, mode, times[0], times[1])
+
+            del payloads
+
+    fits = fit(results, options.sizes)
+
+    print
+    print '%-10s %3s  %-10s %-6s %-8s %16s %16s %6s' % ('builder', 'amf',
+        'package', 'op', 'mode', 'fixed(us/msg)', 'per object(us)', 'r2')
+
+    for b in args:
+        label = builder.label(b, options.params.get(b))
+
+        for encoding in options.encodings:
+            for c in codecs:
+                for op in ('encode', 'decode'):
+                    for mode in options.modes:
+                        f = fits.get(op, {}).get(mode, {}).get(label,
+                            {}).get(encoding, {}).get(c.package)
+
+                        if f is None:
+                            continue
+
+                        print '%-10s %3d  %-10s %-6s %-8s %16.3f %16.3f ' \
+                            '%6.3f' % (label, encoding, c.package, op, mode,
+                            f['fixed'] * 1e6, f['per_object'] * 1e6, f['r2'])
+
+    if options.output:
+        import cPickle as pickle
+
+        f = open(options.output, 'wb')
+        pickle.dump({'messages': options.messages, 'sizes': options.sizes,
+            'results': results, 'fit': fits}, f, pickle.HIGHEST_PROTOCOL)
+        f.close()
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:])
@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+"""
+Compares two runs in the AMFBench results store (see C{mark.py --store}) and
+exits non-zero if any codec has regressed.
+"""
+
+import sys
+from optparse import OptionParser
+
+from amfbench import store
+
+
+def parse_args(*args):
+    """
+    Parse and validate command line arguments.
+    """
+    parser = OptionParser(usage='%prog [options] [BASE_RUN [NEW_RUN]]',
+        description='Compares two benchmark runs. Defaults to the last two '
+        'runs in the store. Exits with status 1 if a median or p99 has '
+        'regressed past --threshold, or a cell of the base run failed or is '
+        'missing in the new run.')
+
+    parser.add_option('--db', dest='db', default=store.default_path,
+        help='The results store. Default is %default')
+    parser.add_option('-t', '--threshold', dest='threshold', type='float',
+        default=5.0, help='Percentage slowdown that counts as a regression. '
+        'Default is %default')
+    parser.add_option('-a', '--alpha', dest='alpha', type='float',
+        default=0.05, help='Significance level of the Mann-Whitney U test. '
+        'Default is %default')
+    parser.add_option('-l', '--list', dest='list', action='store_true',
+        default=False, help='List the runs in the store and exit')
+    parser.add_option('-q', '--quiet', dest='quiet', action='store_true',
+        default=False, help='Only output regressions')
+
+    options, args = parser.parse_args()
+
+    if len(args) > 2:
+        parser.error('Supply at most two runs')
+
+    try:
+        options.runs = map(int, args)
+    except ValueError:
+        parser.error('Runs are referred to by their numeric id')
+
+    return options, args
+
+
+def main(*args):
+    options, args = parse_args(*args)
+
+    db = store.connect(options.db)
+    runs = store.list_runs(db)
+
+    if options.list:
+        for r in runs:
+            print '%4d %s %s py%s %s' % (r['id'], r['git_revision'] and
+                r['git_revision'][:10], r['hostname'], r['python_version'],
+                r['host_cpu'])
+
+        return 0
+
+    ids = [r['id'] for r in runs]
+    wanted = options.runs
+
+    if len(wanted) < 2:
+        if len(ids) < 2:
+            sys.stderr.write('Need at least two runs to compare\n')
+
+            return 2
+
+        if not wanted:
+            wanted = ids[-2:]
+        else:
+            wanted = [wanted[0], ids[-1]]
+
+    for run_id in wanted:
+        if run_id not in ids:
+            sys.stderr.write('Unknown run %r\n' % (run_id,))
+
+            return 2
+
+    results = store.compare(store.load_run(db, wanted[0]),
+        store.load_run(db, wanted[1]), options.threshold / 100.0,
+        options.alpha)
+
+    regressions = 0
+
+    print 'run %d -> run %d' % tuple(wanted)
+
+    for r in results:
+        type, b, encoding, size, package = r['cell']
+
+        if r['regressed']:
+            regressions += 1
+            status = 'REGRESSED (%s)' % (', '.join(r['regressed']),)
+        elif options.quiet:
+            continue
+        else:
+            status = 'ok'
+
+        if b is None:
+            # an import or startup cell
+            cell = '%-7s %-24s %-10s' % (type, '', package)
+        else:
+            cell = '%-7s %-10s amf%d %8d %-10s' % (type, b, encoding, size,
+                package)
+
+        print '%s median x%.3f p99 x%.3f p=%.4f %s' % (cell,
+            r['median_ratio'] or 0, r['p99_ratio'] or 0,
+            r['p_value'] if r['p_value'] is not None else 1, status)
+
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(*sys.argv[1:]))
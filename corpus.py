@@ -0,0 +1,159 @@
+#!/usr/bin/env python
+"""
+Generates the decoding corpus (C{var/[builder]-[num].amf[version]}) directly
+from L{amfbench.builder}, without needing a Flash Player and C{server.py}.
+
+The blobs are streamed to disk by L{amfbench.write_blob} so that multi-million
+object payloads do not need the whole encoded buffer in memory. With
+C{--archive} they are packed into a single memory-mapped corpus instead (see
+L{amfbench.archive}).
+"""
+
+import sys
+import os
+from optparse import OptionParser
+
+import amfbench
+from amfbench import builder, archive
+
+
+#: The sizes that C{flex/DecodingGenerator.swf} generates.
+default_sizes = (1000, 2000, 5000, 10000, 20000, 50000)
+
+
+def parse_args(*args):
+    """
+    Parse and validate command line arguments.
+    """
+    parser = OptionParser(usage='%prog [options] [builder ...]',
+        description='Writes AMF blobs for the decoding benchmarks into %s. '
+        'Defaults to all builders.' % (amfbench.base_path,))
+
+    amf_encodings = ('0', '3')
+
+    parser.add_option('-s', '--size', action='append', dest='sizes',
+        type='int', help='Number of objects for the builder to generate. '
+        'May be supplied multiple times. Defaults to %r' % (default_sizes,))
+    parser.add_option('-e', '--encoding', action='append', dest='encodings',
+        choices=amf_encodings, help='AMF version/s to generate. '
+        'Choices are %r. Defaults to all.' % (amf_encodings,))
+    parser.add_option('-p', '--param', action='append', dest='params',
+        default=None, metavar='BUILDER.KEY=VALUE', help='Set a parameter of a '
+        'builder, e.g. nested.depth=10. Blobs of a builder with a parameter '
+        'that is not its default are named BUILDER[KEY=VALUE]-[num]. May be '
+        'supplied multiple times')
+    parser.add_option('-f', '--force', action='store_true', dest='force',
+        default=False, help='Overwrite blobs that already exist')
+    parser.add_option('-a', '--archive', dest='archive', metavar='PACK',
+        help='Append the blobs to the corpus archive PACK (and its PACK.idx '
+        'manifest) rather than writing separate files')
+    parser.add_option('--verify', action='store_true', dest='verify',
+        default=False, help='Check the checksum of every blob in --archive '
+        'and exit')
+    parser.add_option('-v', '--verbose', action='store_true', dest='verbose',
+        default=False, help='Output helpful comments to stderr')
+
+    options, args = parser.parse_args()
+
+    if options.verify and not options.archive:
+        parser.error('--verify requires --archive')
+
+    if not args:
+        args = builder.builders
+    else:
+        for a in args:
+            if a not in builder.builders:
+                parser.error("%s is not a valid builder, choose from %r" % (
+                    a, builder.builders))
+
+    try:
+        options.params = builder.parse_params(options.params)
+    except ValueError, e:
+        parser.error(str(e))
+
+    if options.sizes is None:
+        options.sizes = list(default_sizes)
+
+    for s in options.sizes:
+        if s < 0:
+            parser.error('%r is not a valid size' % (s,))
+
+    if options.encodings is None:
+        options.encodings = amf_encodings
+
+    options.encodings = map(int, options.encodings)
+
+    return options, args
+
+
+def write_archive(options, args):
+    """
+    Streams the requested blobs into the corpus archive.
+    """
+    writer = archive.ArchiveWriter(options.archive)
+
+    try:
+        for b in args:
+            params = options.params.get(b)
+            label = builder.label(b, params)
+
+            for size in options.sizes:
+                for encoding in options.encodings:
+                    if (label, size, encoding) in writer and \
+                            not options.force:
+                        if options.verbose:
+                            sys.stderr.write('skipping %s-%d.amf%d\n' % (
+                                label, size, encoding))
+
+                        continue
+
+                    e = amfbench.pack_blob(writer, b, size, encoding, params)
+
+                    if options.verbose:
+                        sys.stderr.write('packed %s-%d.amf%d (%d bytes at %d)'
+                            '\n' % (label, size, encoding, e['length'],
+                            e['offset']))
+    finally:
+        writer.close()
+
+
+def verify_archive(options):
+    bad = archive.Archive(options.archive).verify()
+
+    for key in bad:
+        sys.stderr.write('checksum mismatch: %s-%d.amf%d\n' % key)
+
+    return 1 if bad else 0
+
+
+def main(*args):
+    options, args = parse_args(*args)
+
+    if options.verify:
+        return verify_archive(options)
+
+    if options.archive:
+        return write_archive(options, args)
+
+    for b in args:
+        params = options.params.get(b)
+
+        for size in options.sizes:
+            for encoding in options.encodings:
+                fn = amfbench.get_blob_filename(b, size, encoding, params)
+
+                if os.path.exists(fn) and not options.force:
+                    if options.verbose:
+                        sys.stderr.write('skipping %s\n' % (fn,))
+
+                    continue
+
+                amfbench.write_blob(b, size, encoding, params)
+
+                if options.verbose:
+                    sys.stderr.write('wrote %s (%d bytes)\n' % (
+                        fn, os.path.getsize(fn)))
+
+
+if __name__ == '__main__':
+    sys.exit(main(*sys.argv[1:]))
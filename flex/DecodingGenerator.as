@@ -20,7 +20,8 @@ package {
     public var encoding:int = 0;
 
     public var encodings:Array = [ObjectEncoding.AMF0, ObjectEncoding.AMF3];
-    public var operations:Array = ['simple', 'complex', 'static', 'reference'];
+    public var operations:Array = ['simple', 'complex', 'static', 'reference',
+        'dates', 'binary', 'text', 'vectors', 'sparse', 'nested'];
     public var numbers:Array = [1000, 2000, 5000, 10000, 20000, 50000];
 
     public function DecodingGenerator():void
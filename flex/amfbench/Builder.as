@@ -1,7 +1,37 @@
 package amfbench
 {
+    import flash.utils.ByteArray;
+
     public class Builder
     {
+        // Midnight on the 1st of January 2011 (UTC)
+        public static const EPOCH:Number = Date.UTC(2011, 0, 1);
+
+        public static const PARAGRAPH:String = 'Lorem ipsum dolor sit amet, ' +
+            'ƒøø bår bäz. Ελληνικά, Русский и 日本語のテキスト — “quoted” ' +
+            'text… ';
+
+        // xorshift32, as amfbench.builder._xorshift
+        private static function xorshift(seed:int, count:int):Array
+        {
+            var ret:Array = [];
+            var x:uint = uint(seed * 2654435761 + 1);
+
+            if (x == 0)
+                x = 1;
+
+            for (var i:int = 0; i < count; i++)
+            {
+                x ^= x << 13;
+                x ^= x >>> 17;
+                x ^= x << 5;
+
+                ret.push(x);
+            }
+
+            return ret;
+        }
+
         public static function simple(num:int):Array
         {
             var ret:Array = [];
@@ -81,10 +111,168 @@ package amfbench
             return ret;
         }
 
-        public static function build(name:String, num:int):Array
+        public static function dates(num:int):Array
+        {
+            var ret:Array = [];
+
+            for (var i:int = 0; i < num; i++)
+            {
+                var obj:Object = new Object();
+                var created:Date = new Date(EPOCH + i * 7 * 60000 + i % 1000);
+
+                obj.id = i;
+                obj.created = created;
+                obj.modified = new Date(created.time + 86400000 +
+                    (i % 60) * 1000);
+                obj.expires = new Date(EPOCH + (365 + i % 365) * 86400000);
+
+                ret.push(obj);
+            }
+
+            return ret;
+        }
+
+        public static function binary(num:int, length:int=1024):Array
+        {
+            var ret:Array = [];
+            var words:int = (length + 3) / 4;
+
+            for (var i:int = 0; i < num; i++)
+            {
+                var obj:Object = new Object();
+                var data:ByteArray = new ByteArray();
+
+                for each (var x:uint in xorshift(i, words))
+                    data.writeUnsignedInt(x);
+
+                data.length = length;
+
+                obj.name = 'attachment-' + i + '.bin';
+                obj.size = length;
+                obj.data = data;
+
+                ret.push(obj);
+            }
+
+            return ret;
+        }
+
+        public static function text(num:int, length:int=1000):Array
+        {
+            var ret:Array = [];
+            var repeat:String = '';
+
+            while (repeat.length <= length)
+                repeat += PARAGRAPH;
+
+            for (var i:int = 0; i < num; i++)
+            {
+                var obj:Object = new Object();
+
+                obj.id = i;
+                obj.title = 'Document ' + i;
+                obj.body = (i + ': ' + repeat).substr(0, length);
+
+                ret.push(obj);
+            }
+
+            return ret;
+        }
+
+        public static function vectors(num:int, length:int=100):Array
+        {
+            var ret:Array = [];
+
+            for (var i:int = 0; i < num; i++)
+            {
+                var obj:Object = new Object();
+
+                // Arrays rather than Vector.<int>/Vector.<Number>, which the
+                // Python codecs cannot decode
+                obj.id = i;
+                obj.ints = [];
+                obj.floats = [];
+
+                for (var j:int = 0; j < length; j++)
+                {
+                    obj.ints.push((i * 31 + j * 17) % 2000000 - 1000000);
+                    obj.floats.push(i * 0.5 + j * 0.25);
+                }
+
+                ret.push(obj);
+            }
+
+            return ret;
+        }
+
+        public static function sparse(num:int, width:int=1000,
+            fanout:int=50):Array
+        {
+            var ret:Array = [];
+
+            for (var i:int = 0; i < num; i++)
+            {
+                var obj:Object = new Object();
+
+                for each (var x:uint in xorshift(i, fanout))
+                {
+                    var k:uint = x % width;
+
+                    if (k % 3 == 0)
+                        obj['field' + k] = x & 0xffff;
+                    else if (k % 3 == 1)
+                        obj['field' + k] = 'value ' + (x & 0xff);
+                    else
+                        obj['field' + k] = (x & 1) == 1;
+                }
+
+                ret.push(obj);
+            }
+
+            return ret;
+        }
+
+        private static function node(level:int, depth:int,
+            fanout:int):SomeClass
         {
-            var f:Function;
+            var obj:SomeClass = new SomeClass();
+
+            obj.level = level;
+            obj.name = 'node';
+            obj.children = [];
+
+            if (level + 1 < depth)
+            {
+                for (var i:int = 0; i < fanout; i++)
+                    obj.children.push(node(level + 1, depth, fanout));
+            }
+
+            return obj;
+        }
 
+        public static function nested(num:int, depth:int=50,
+            fanout:int=1):Array
+        {
+            var ret:Array = [];
+
+            for (var i:int = 0; i < num; i++)
+                ret.push(node(0, depth, fanout));
+
+            return ret;
+        }
+
+        private static function param(params:Object, key:String,
+            value:int):int
+        {
+            if (params != null && params.hasOwnProperty(key))
+                return params[key];
+
+            return value;
+        }
+
+        public static function build(name:String, num:int,
+            params:Object=null):Array
+        {
             if (name == 'simple')
                 return simple(num);
             if (name == 'complex')
@@ -93,6 +281,20 @@ package amfbench
                 return _static(num);
             if (name == 'reference')
                 return reference(num);
+            if (name == 'dates')
+                return dates(num);
+            if (name == 'binary')
+                return binary(num, param(params, 'length', 1024));
+            if (name == 'text')
+                return text(num, param(params, 'length', 1000));
+            if (name == 'vectors')
+                return vectors(num, param(params, 'length', 100));
+            if (name == 'sparse')
+                return sparse(num, param(params, 'width', 1000),
+                    param(params, 'fanout', 50));
+            if (name == 'nested')
+                return nested(num, param(params, 'depth', 50),
+                    param(params, 'fanout', 1));
 
             throw new Error('Unknown build name');
         }
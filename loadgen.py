@@ -0,0 +1,289 @@
+#!/usr/bin/env python
+"""
+Drives the C{server.py} gateway with Flash Remoting requests.
+
+Each request is a valid AMF0/AMF3 remoting envelope calling the
+C{[builder]-[size]} service method (the format that
+L{server.DecodingGeneratorGateway.strip_envelope} expects) with the payload
+from L{amfbench.builder}. Requests are fired from C{--concurrency} threads,
+optionally paced to a target rate, and the latencies are reported as an
+HDR style histogram.
+"""
+
+import sys
+import time
+import threading
+import httplib
+import urlparse
+from optparse import OptionParser
+
+from amfbench import builder, amf, timer, remoting
+from amfbench.histogram import Histogram
+
+
+def build_request(builder_name, size, amf_version, uid='/1', params=None):
+    """
+    Returns a remoting envelope with a single body calling C{[label]-[size]}
+    (see L{builder.label}) with the builder's payload as the only argument,
+    encoded the way the Flash Player does.
+    """
+    payload = builder.build(builder_name, size, **(params or {}))
+    amf3 = amf_version == 3
+
+    body = remoting.encode_arguments([amf.dumps(payload, amf3)], amf3)
+
+    return remoting.encode_packet(amf_version, messages=[('%s-%d' % (
+        builder.label(builder_name, params), size), uid, body)])
+
+
+def parse_timing_header(value):
+    """
+    Parses the C{X-AMFBench-Timing} header returned by
+    L{server.CodecGateway}.
+    """
+    ret = {}
+
+    for part in value.split(','):
+        k, _, v = part.partition('=')
+
+        try:
+            ret[k] = float(v)
+        except ValueError:
+            continue
+
+    return ret
+
+
+class LoadGenerator(object):
+    """
+    Fires C{request} at C{url} from C{concurrency} threads.
+
+    If C{rate} is set, request C{n} is scheduled for C{start + n / rate} and
+    its latency is measured from that intended time, so that a stalled server
+    is not hidden by the clients backing off (coordinated omission).
+
+    @ivar histogram: The L{Histogram} of request latencies.
+    @ivar phases: A C{dict} of server phase -> L{Histogram}, populated from
+        the C{X-AMFBench-Timing} header.
+    """
+
+    def __init__(self, url, request, concurrency=1, rate=None,
+            requests=None, duration=None):
+        self.url = urlparse.urlsplit(url)
+        self.request = request
+        self.concurrency = concurrency
+        self.rate = rate
+        self.requests = requests
+        self.duration = duration
+
+        self.histogram = Histogram()
+        self.phases = {}
+        self.errors = 0
+        self.completed = 0
+
+        self.lock = threading.Lock()
+        self.issued = 0
+
+    def next_ticket(self):
+        """
+        Returns the time at which the next request should be sent or C{None}
+        when the run is over.
+        """
+        self.lock.acquire()
+
+        try:
+            n = self.issued
+
+            if self.requests is not None and n >= self.requests:
+                return None
+
+            if self.duration is not None and \
+                    timer.clock() - self.start >= self.duration:
+                return None
+
+            self.issued += 1
+        finally:
+            self.lock.release()
+
+        if self.rate:
+            return self.start + n / self.rate
+
+        return timer.clock()
+
+    def send(self):
+        """
+        Sends one request and returns the response status and headers.
+        """
+        conn = httplib.HTTPConnection(self.url.hostname, self.url.port or 80)
+
+        try:
+            conn.request('POST', self.url.path or '/', self.request, {
+                'Content-Type': 'application/x-amf',
+            })
+
+            response = conn.getresponse()
+            response.read()
+
+            return response.status, response.getheader('X-AMFBench-Timing')
+        finally:
+            conn.close()
+
+    def worker(self):
+        while True:
+            due = self.next_ticket()
+
+            if due is None:
+                return
+
+            wait = due - timer.clock()
+
+            if wait > 0:
+                time.sleep(wait)
+
+            try:
+                status, timing = self.send()
+            except Exception:
+                status, timing = None, None
+
+            latency = timer.clock() - due
+
+            self.lock.acquire()
+
+            try:
+                if status != 200:
+                    self.errors += 1
+
+                    continue
+
+                self.completed += 1
+                self.histogram.record(latency)
+
+                if timing:
+                    for k, v in parse_timing_header(timing).iteritems():
+                        h = self.phases.setdefault(k, Histogram())
+                        h.record(v)
+            finally:
+                self.lock.release()
+
+    def run(self):
+        """
+        Runs the load test to completion.
+
+        @return: A C{dict} of results.
+        """
+        threads = [threading.Thread(target=self.worker)
+            for i in xrange(self.concurrency)]
+
+        self.start = timer.clock()
+
+        for t in threads:
+            t.daemon = True
+            t.start()
+
+        for t in threads:
+            while t.is_alive():
+                t.join(0.1)
+
+        elapsed = timer.clock() - self.start
+
+        return {
+            'elapsed': elapsed,
+            'completed': self.completed,
+            'errors': self.errors,
+            'throughput': self.completed / elapsed if elapsed else None,
+            'latency': self.histogram.summary(),
+            'phases': dict([(k, h.summary())
+                for k, h in self.phases.iteritems()]),
+        }
+
+
+def parse_args(*args):
+    """
+    Parse and validate command line arguments.
+    """
+    parser = OptionParser(usage='%prog [options] builder',
+        description='Load generator for the server.py gateway. Run server.py '
+        'with --gateway codec to measure a full request path.')
+
+    parser.add_option('--url', dest='url', default='http://127.0.0.1:8080/gw',
+        help='The gateway url. Default is %default')
+    parser.add_option('-s', '--size', dest='size', type='int', default=1000,
+        help='Number of objects in each request. Default is %default')
+    parser.add_option('-e', '--encoding', dest='encoding', default='3',
+        choices=('0', '3'), help='AMF version of the requests. '
+        'Default is %default')
+    parser.add_option('-p', '--param', action='append', dest='params',
+        default=None, metavar='BUILDER.KEY=VALUE', help='Set a parameter of '
+        'the builder, e.g. nested.depth=10. May be supplied multiple times')
+    parser.add_option('-c', '--concurrency', dest='concurrency', type='int',
+        default=1, help='Number of concurrent clients. Default is %default')
+    parser.add_option('-r', '--rate', dest='rate', type='float', default=None,
+        help='Target requests per second across all clients. Default is as '
+        'fast as possible')
+    parser.add_option('-n', '--requests', dest='requests', type='int',
+        default=None, help='Total number of requests to send')
+    parser.add_option('-d', '--duration', dest='duration', type='float',
+        default=None, help='Number of seconds to run for. Default is 10 '
+        'unless --requests is given')
+    parser.add_option('-o', '--out', action='store', dest='output',
+        default=None, help='Also write a pickle of the results here')
+
+    options, args = parser.parse_args()
+
+    if len(args) != 1 or args[0] not in builder.builders:
+        parser.error('Supply one builder, choose from %r' % (
+            builder.builders,))
+
+    try:
+        options.params = builder.parse_params(options.params)
+    except ValueError, e:
+        parser.error(str(e))
+
+    if options.concurrency < 1:
+        parser.error('concurrency must be >= 1 (got %r)' % (
+            options.concurrency,))
+
+    if options.rate is not None and options.rate <= 0:
+        parser.error('rate must be > 0 (got %r)' % (options.rate,))
+
+    if options.requests is None and options.duration is None:
+        options.duration = 10.0
+
+    options.encoding = int(options.encoding)
+
+    return options, args
+
+
+def main(*args):
+    options, args = parse_args(*args)
+
+    request = build_request(args[0], options.size, options.encoding,
+        params=options.params.get(args[0]))
+
+    gen = LoadGenerator(options.url, request, options.concurrency,
+        options.rate, options.requests, options.duration)
+
+    results = gen.run()
+
+    print '%d requests in %.2fs (%d errors), %.1f req/s' % (
+        results['completed'], results['elapsed'], results['errors'],
+        results['throughput'] or 0)
+    print
+    print gen.histogram.format()
+
+    for k in sorted(gen.phases):
+        h = gen.phases[k]
+
+        print '%-8s mean %.3fms p99 %.3fms' % (k, h.mean() * 1e3,
+            h.percentile(99) * 1e3)
+
+    if options.output:
+        import cPickle as pickle
+
+        f = open(options.output, 'wb')
+        pickle.dump(results, f, pickle.HIGHEST_PROTOCOL)
+        f.close()
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:])
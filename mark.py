@@ -10,16 +10,62 @@ same payload.
 """
 
 import sys
+import os
 import os.path
+import random
 from optparse import OptionParser, OptionGroup
 
 import amfbench
-from amfbench import codec, builder
+from amfbench import codec, builder, timer, scaling, store, report, imports
+from amfbench import archive, verify, cache, profiler, gcstats, wire
+from amfbench import schedule, memory
 
 
 __version__ = (0, 1)
 version = '.'.join(map(str, __version__))
 
+root = os.path.dirname(os.path.abspath(__file__))
+
+#: Runs one cell (see L{run_cell}) in a fresh interpreter for C{--jobs}. The
+#: cell and its keyword arguments are read from stdin and the result is
+#: written to stdout, both pickled.
+cell_script = r"""
+import sys
+sys.path.insert(0, sys.argv[1])
+
+import cPickle as pickle
+
+import mark
+
+out = sys.stdout
+# keep anything the codec prints out of the result
+sys.stdout = sys.stderr
+
+cell, kwargs = pickle.load(sys.stdin)
+pickle.dump(mark.run_cell(cell, kwargs), out, pickle.HIGHEST_PROTOCOL)
+"""
+
+#: Runs L{codec.resolve_implementations} in a fresh interpreter for
+#: C{--jobs}, so that the codecs are never imported by the process the cells
+#: are run from.
+resolve_script = r"""
+import sys
+sys.path.insert(0, sys.argv[1])
+
+import cPickle as pickle
+
+from amfbench import codec
+
+names = pickle.load(sys.stdin)
+
+try:
+    ret = codec.resolve_implementations(names) + (None,)
+except NameError, e:
+    ret = (None, None, str(e))
+
+pickle.dump(ret, sys.stdout, pickle.HIGHEST_PROTOCOL)
+"""
+
 
 class NullStream(object):
     """
@@ -42,6 +88,29 @@ class Logger(object):
         self.stream.write(msg + '\n')
 
 
+def _resolve_in_child(names=None):
+    """
+    Like L{codec.resolve_implementations} but in a fresh interpreter.
+    """
+    import subprocess
+    import cPickle as pickle
+
+    p = subprocess.Popen([sys.executable, '-c', resolve_script, root],
+        stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+    out, err = p.communicate(pickle.dumps(names, pickle.HIGHEST_PROTOCOL))
+
+    if p.returncode != 0:
+        raise RuntimeError('Resolving the codecs failed (exit status %d)' % (
+            p.returncode,))
+
+    ret, skipped, error = pickle.loads(out)
+
+    if error is not None:
+        raise NameError(error)
+
+    return ret, skipped
+
+
 def parse_args(*args):
     """
     Parse and validate command line arguments.
@@ -50,7 +119,8 @@ def parse_args(*args):
         description='Benchmark utility for Python AMF implementations. '
         'Will produce a pickle of timings for the various benchmark types. '
         'To run the decoding benchmarks, make sure you have built the '
-        'requisite binaries (Run server.py and browse to localhost:8080).')
+        'requisite binaries (Run corpus.py, or run server.py and browse to '
+        'localhost:8080).')
 
     impl = codec.get_available_implementations()
     amf_encodings = ('0', '3')
@@ -59,14 +129,30 @@ def parse_args(*args):
         choices=amf_encodings, help='AMF version/s to benchmark. '
         'Choices are %r. Defaults to all.' % (amf_encodings,))
     parser.add_option('-i', '--implementation', action='append', dest='impl',
-        choices=impl,
-        help='Python AMF implementation to benchmark. Choices are %r. '
-            'Defaults to all.' % (impl,))
+        help='Python AMF implementation to benchmark. Choices are %r, or '
+            'NAME:VARIANT for one of the variants of a codec (e.g. '
+            'cpickle:highest) and NAME:all for the codec and every one of '
+            'its variants. Defaults to all that can be imported.' % (impl,))
+    parser.add_option('-p', '--param', action='append', dest='params',
+        default=None, metavar='BUILDER.KEY=VALUE', help='Set a parameter of a '
+        'builder, e.g. nested.depth=10 (see amfbench.builder.parameters). May '
+        'be supplied multiple times. Blobs and results of a builder with a '
+        'parameter that is not its default are labelled BUILDER[KEY=VALUE]')
     parser.add_option('-v', '--verbose', action='store_true', dest='verbose',
         default=False, help='Output helpful comments to stderr')
     parser.add_option('-o', '--out', action='store', dest='output',
         default=None, help='Where to write the pickle of benchmark results. '
         'Default is stdout')
+    parser.add_option('--store', action='store', dest='store', default=None,
+        metavar='DB', help='Also save the results as a new run in this '
+        'SQLite store (see compare.py). Use "default" for %s' % (
+            store.default_path,))
+    parser.add_option('--report', action='store', dest='report',
+        default=None, metavar='HTML', help='Also write an HTML report of the '
+        'results here (see report.py)')
+    parser.add_option('--baseline', action='store', dest='baseline',
+        default=None, help='Package that the --report speed-up ratios are '
+        'relative to')
 
     advanced = OptionGroup(parser, "Advanced options")
 
@@ -74,9 +160,138 @@ def parse_args(*args):
         action='store_true', help='Only benchmark decoding')
     advanced.add_option('--only-encode', dest='only_encode',
         action='store_true', help='Only benchmark encoding')
+    advanced.add_option('-j', '--jobs', dest='jobs', type='int', default=None,
+        help='Run each benchmark (and each of its --trials) in a freshly '
+        'executed interpreter, JOBS at a time, so that the setUp and first '
+        'call recorded are the first the codec has made. Its import is not '
+        'part of either (see --imports). Supply 0 to use one interpreter per '
+        'CPU. Default is to run everything in this process, where only the '
+        'first benchmark of each codec starts cold')
+    advanced.add_option('--memory', dest='memory', action='store_true',
+        default=False, help='Also record heap and RSS usage of each codec '
+        'call. The heap needs tracemalloc; without it the size of the '
+        'returned object graph is recorded as retained_bytes instead')
+    advanced.add_option('--imports', dest='imports', type='int',
+        default=None, metavar='N', help='Also measure interpreter startup '
+        'and the import time and memory of each codec, in N fresh '
+        'interpreters. They are saved with --store as import and startup '
+        'cells')
+    advanced.add_option('--chunk-size', dest='chunk_size', type='int',
+        default=None, help='Feed the decoders their input in chunks of this '
+        'many bytes and record the time to the first decoded object. Codecs '
+        'that can stream are also timed on the elements of each payload as '
+        'separate top-level values, recorded under the stream key')
+    advanced.add_option('--bandwidth', dest='bandwidth', type='float',
+        default=None, help='Pace the chunks of --chunk-size to simulate a '
+        'link of this many Mbit/s')
+    advanced.add_option('--archive', dest='archive', default=None,
+        metavar='PACK', help='Decode blobs from the memory-mapped corpus '
+        'archive PACK (see corpus.py --archive) instead of var/. AmFast and '
+        'PyAMF are given each blob as a copied str, which is outside the '
+        'timings')
+    advanced.add_option('--cache-size', dest='cache_size', type='float',
+        default=0, metavar='MB', help='Build each payload once and keep the '
+        'most recently used ones, up to this many MB, for the encoding '
+        'benchmarks of every codec. Default is to build the payload in every '
+        'benchmark. With --jobs each benchmark starts with an empty cache')
+    advanced.add_option('--freeze', dest='freeze', action='store_true',
+        default=False, help='Move cached payloads out of the way of the '
+        'cyclic garbage collector (gc.freeze, or a full collection where '
+        'that is not available) so that timings only include the codec. '
+        'Requires --cache-size')
+    advanced.add_option('--profile', dest='profile', default=None,
+        metavar='DIR', help='Also profile each codec call (untimed) and '
+        'write a table of the hottest functions for every cell to DIR, plus '
+        'collapsed stacks for flamegraph.pl with --sample-interval')
+    advanced.add_option('--profile-top', dest='profile_top', type='int',
+        default=25, metavar='N', help='Number of functions in each --profile '
+        'table. Default is %default')
+    advanced.add_option('--sample-interval', dest='sample_interval',
+        type='float', default=None, metavar='MS', help='Also run the '
+        'sampling profiler with --profile, taking a stack every MS '
+        'milliseconds of CPU time')
+    advanced.add_option('--verify', dest='verify', action='store_true',
+        default=False, help='Check that each codec produces the same object '
+        'graph as the builder (see --verify-sample). Timings of codecs that '
+        'fail are marked as unverified')
+    advanced.add_option('--verify-sample', dest='verify_sample', type='int',
+        default=1, metavar='N', help='Verify the N smallest sizes of each '
+        'builder, encoding and codec. Default is %default')
+    advanced.add_option('--compress', dest='compress', action='append',
+        default=None, metavar='SCHEME', help='Also record the size and the '
+        'compress and decompress times of each encoded blob (and the time to '
+        'decode it again) with SCHEME: zlib, bz2 or lzma (if available) with '
+        'optional levels, e.g. zlib:1,6,9, or all. May be supplied multiple '
+        'times')
+    advanced.add_option('--link', dest='links', action='append',
+        type='float', default=None, metavar='MBIT', help='Model the end to '
+        'end latency (encode, compress, transfer, decompress, decode) of '
+        'each cell over a link of MBIT Mbit/s, reported on stderr. May be '
+        'supplied multiple times')
 
     parser.add_option_group(advanced)
 
+    timing = OptionGroup(parser, "Timing options")
+
+    timing.add_option('-n', '--iterations', dest='iterations', type='int',
+        default=timer.default_policy.iterations,
+        help='Minimum number of timed calls per benchmark. Default is %default')
+    timing.add_option('-w', '--warmup', dest='warmup', type='int',
+        default=timer.default_policy.warmup,
+        help='Number of untimed calls made before measuring. '
+        'Default is %default')
+    timing.add_option('--min-time', dest='min_time', type='float',
+        default=timer.default_policy.min_time,
+        help='Keep measuring until this many seconds have been spent in the '
+        'codec (bounded by --max-iterations). Default is %default')
+    timing.add_option('--max-iterations', dest='max_iterations', type='int',
+        default=timer.default_policy.max_iterations,
+        help='Upper bound on timed calls when --min-time is used. '
+        'Default is %default')
+
+    timing.add_option('--gc', dest='gc', action='append', default=None,
+        metavar='POLICY', help='Garbage collector policy while timing: '
+        'enabled, disabled (off for the timed calls, collected afterwards) or '
+        'tuned:T0[,T1[,T2]] (gc.set_threshold). May be supplied multiple '
+        'times to compare policies, in which case the results of each are '
+        'labelled PACKAGE[gc=POLICY]. Default is enabled')
+
+    parser.add_option_group(timing)
+
+    scheduling = OptionGroup(parser, "Scheduling options")
+
+    scheduling.add_option('--trials', dest='trials', type='int', default=1,
+        help='Split each benchmark into this many trials, run in rounds so '
+        'that the trials of different codecs are interleaved. The samples of '
+        'all trials are combined. Default is %default')
+    scheduling.add_option('--shuffle', dest='shuffle', action='store_true',
+        default=False, help='Run the decode and encode benchmarks of every '
+        'codec in a random order (within each round of --trials). The seed is '
+        'logged and recorded in the results')
+    scheduling.add_option('--seed', dest='seed', type='int', default=None,
+        help='Seed for --shuffle, to repeat the order of an earlier run. '
+        'Implies --shuffle')
+    scheduling.add_option('--cpus', dest='cpus', default=None,
+        metavar='LIST', help='Pin the benchmarks to these CPUs, e.g. 2 or '
+        '0,2-3. The frequency governor, clock and load of the CPUs are '
+        'recorded around every trial')
+
+    parser.add_option_group(scheduling)
+
+    sweep = OptionGroup(parser, "Scaling options")
+
+    sweep.add_option('--sweep', dest='sweep', default=None,
+        metavar='MIN:MAX', help='Benchmark a geometric series of sizes from '
+        'MIN to MAX (e.g. 10:10000000) instead of the blobs in var/. Missing '
+        'decode blobs are generated. The fitted exponents and knee points of '
+        'the time and memory of each codec are reported on stderr. Implies '
+        '--memory')
+    sweep.add_option('--sweep-steps', dest='sweep_steps', type='int',
+        default=2, help='Number of sizes per factor of 10. '
+        'Default is %default')
+
+    parser.add_option_group(sweep)
+
     options, args = parser.parse_args()
 
     if not args:
@@ -87,6 +302,11 @@ def parse_args(*args):
                 parser.error("%s is not a valid builder, choose from %r" % (
                     a, builder.builders))
 
+    try:
+        options.params = builder.parse_params(options.params)
+    except ValueError, e:
+        parser.error(str(e))
+
     amf_encodings = tuple(map(int, amf_encodings))
 
     if options.encodings is None:
@@ -98,69 +318,669 @@ def parse_args(*args):
             except ValueError:
                 parser.error('%r is not a valid AMF version' % (e,))
 
-    if options.impl is None:
-        options.impl = impl
-    else:
-        for a in options.impl:
-            if a not in impl:
-                parser.error("%s is not a valid implementation, choose "
-                    "from %r" % (a, impl))
-
     if not options.verbose:
         options.logger = Logger(NullStream())
     else:
         options.logger = Logger(sys.stderr)
 
+    if options.jobs is not None and options.jobs < 0:
+        parser.error('jobs must be >= 0 (got %r)' % (options.jobs,))
+
+    # the codecs are imported to check them, which the --jobs workers must
+    # not inherit
+    resolve = codec.resolve_implementations
+
+    if options.jobs is not None:
+        resolve = _resolve_in_child
+
+    try:
+        options.impl, skipped = resolve(options.impl)
+    except NameError, e:
+        parser.error('%s, choose from %r' % (e, impl))
+
+    for e in skipped:
+        options.logger.log('skipping %s' % (e,))
+
     if options.only_decode and options.only_encode:
         parser.error('Conflicting values: only-decode and only-encode. Please '
             'choose one (or neither)')
 
+    if options.imports is not None and options.imports < 1:
+        parser.error('imports must be >= 1 (got %r)' % (options.imports,))
+
+    if options.chunk_size is not None and options.chunk_size < 1:
+        parser.error('chunk-size must be >= 1 (got %r)' % (
+            options.chunk_size,))
+
+    if options.bandwidth is not None:
+        if not options.chunk_size:
+            parser.error('--bandwidth requires --chunk-size')
+
+        # Mbit/s -> bytes/s
+        options.bandwidth = options.bandwidth * 1000000 / 8
+
+    options.sizes = None
+
+    if options.sweep:
+        if options.sweep_steps < 1:
+            parser.error('--sweep-steps must be >= 1')
+
+        try:
+            start, stop = [int(float(x)) for x in options.sweep.split(':')]
+            options.sizes = scaling.geometric_sizes(start, stop,
+                options.sweep_steps)
+        except ValueError:
+            parser.error('%r is not a valid sweep, use MIN:MAX' % (
+                options.sweep,))
+
+        # the memory fit needs memory figures
+        options.memory = True
+
+    if options.memory and memory.tracemalloc is None:
+        sys.stderr.write('tracemalloc is not available: the heap will not be '
+            'measured, only the RSS and the size of the object graph each '
+            'call returns (retained_bytes)\n')
+
+    if options.cache_size < 0:
+        parser.error('cache-size must be >= 0 (got %r)' % (
+            options.cache_size,))
+
+    options.cache = None
+
+    if options.cache_size:
+        options.cache = cache.PayloadCache(
+            int(options.cache_size * 1024 * 1024), options.freeze)
+    elif options.freeze:
+        parser.error('--freeze requires --cache-size')
+
+    options.profiler = None
+
+    if options.profile:
+        if options.profile_top < 1:
+            parser.error('profile-top must be >= 1 (got %r)' % (
+                options.profile_top,))
+
+        if options.sample_interval is not None and \
+                options.sample_interval <= 0:
+            parser.error('sample-interval must be > 0 (got %r)' % (
+                options.sample_interval,))
+
+        options.profiler = profiler.Profiler(options.profile_top,
+            options.sample_interval and options.sample_interval / 1000.0)
+    elif options.sample_interval is not None:
+        parser.error('--sample-interval requires --profile')
+
+    if options.verify_sample < 1:
+        parser.error('verify-sample must be >= 1 (got %r)' % (
+            options.verify_sample,))
+
+    options.compression = None
+
+    if options.compress:
+        try:
+            options.compression = wire.Compression(
+                wire.get_schemes(options.compress))
+        except ValueError, e:
+            parser.error(str(e))
+
+    if options.links:
+        for mbit in options.links:
+            if mbit <= 0:
+                parser.error('link must be > 0 (got %r)' % (mbit,))
+
+        if options.only_decode or options.only_encode:
+            parser.error('--link needs both encode and decode results')
+
+    if options.trials < 1:
+        parser.error('trials must be >= 1 (got %r)' % (options.trials,))
+
+    if options.seed is None and options.shuffle:
+        options.seed = random.SystemRandom().randrange(1 << 32)
+
+    if options.cpus is not None:
+        try:
+            options.cpus = schedule.parse_cpus(options.cpus)
+            schedule.set_affinity(options.cpus)
+        except (ValueError, OSError), e:
+            parser.error('Cannot pin to CPUs %r: %s' % (options.cpus, e))
+
+    try:
+        options.gc_policies = [gcstats.get_policy(p)
+            for p in options.gc or ['enabled']]
+    except ValueError, e:
+        parser.error(str(e))
+
+    try:
+        options.policy = timer.Policy(warmup=options.warmup,
+            iterations=options.iterations, min_time=options.min_time,
+            max_iterations=options.max_iterations)
+    except ValueError, e:
+        parser.error(str(e))
+
     return options, args
 
 
-def _bench(options, args, type):
-    binaries = amfbench.get_blobs()
-    results = {}
+#: The sizes to encode for a builder that has no decode blobs to take the
+#: sizes from.
+encode_sizes = (10, 100, 1000)
+
+
+def get_label(options, b):
+    """
+    Returns the name that the blobs and results of builder C{b} are filed
+    under, given the C{--param}s (see L{builder.label}).
+    """
+    return builder.label(b, options.params.get(b))
+
+
+def get_cells(options, args, type):
+    """
+    Returns a list of the individual benchmarks (cells) that make up the
+    matrix for C{type}. Each cell is a tuple of C{(type, builder, encoding,
+    size, implementation)}.
+
+    Cells that share a payload are next to each other so that it only needs
+    to be built (or cached) once. Decode cells are skipped for a builder and
+    encoding that has no blobs.
+    """
+    cells = []
+
+    if options.sizes is None:
+        if options.archive:
+            binaries = archive.open_archive(options.archive).get_blobs()
+        else:
+            binaries = amfbench.get_blobs()
 
     for b in args:
-        s = results.setdefault(b, {})
+        label = get_label(options, b)
+        payloads = []
 
         for encoding in options.encodings:
-            n = binaries[b][encoding]
-            t = s.setdefault(encoding, {})
+            if options.sizes is not None:
+                sizes = options.sizes
+            else:
+                sizes = binaries.get(label, {}).get(encoding)
+
+            if not sizes and type == 'encode':
+                options.logger.log('no blobs for %s amf%d, encoding sizes '
+                    '%r' % (label, encoding, encode_sizes))
+
+                sizes = encode_sizes
+            elif not sizes:
+                sys.stderr.write('No blobs for %s amf%d, not decoding it '
+                    '(see corpus.py)\n' % (label, encoding))
+
+                continue
+
+            payloads.extend([(size, encoding) for size in sizes])
+
+        for size, encoding in sorted(payloads):
+            for c in options.impl:
+                cells.append((type, b, encoding, size, c))
+
+    return cells
+
+
+def prepare_blobs(options, args):
+    """
+    Generates any decode blobs needed by a sweep that are not in C{var/} (or
+    the corpus archive).
+    """
+    if options.archive:
+        writer = archive.ArchiveWriter(options.archive)
+
+        try:
+            for b in args:
+                label = get_label(options, b)
+
+                for encoding in options.encodings:
+                    for size in options.sizes:
+                        if (label, size, encoding) in writer:
+                            continue
+
+                        options.logger.log('packing %s-%d.amf%d' % (label,
+                            size, encoding))
+
+                        amfbench.pack_blob(writer, b, size, encoding,
+                            options.params.get(b))
+        finally:
+            writer.close()
+
+        return
+
+    for b in args:
+        params = options.params.get(b)
+
+        for encoding in options.encodings:
+            for size in options.sizes:
+                fn = amfbench.get_blob_filename(b, size, encoding, params)
+
+                if os.path.exists(fn):
+                    continue
+
+                options.logger.log('generating %s' % (fn,))
+
+                amfbench.write_blob(b, size, encoding, params)
+
+
+def get_bench_kwargs(options, type):
+    """
+    Returns the keyword arguments passed to L{amfbench.encode} and
+    L{amfbench.decode} for each cell, bar the builder C{params} (see
+    L{_bench}).
+    """
+    kwargs = {
+        'policy': options.policy,
+        'measure_memory': options.memory,
+        'profile': options.profiler,
+    }
+
+    if type == 'decode':
+        kwargs['chunk_size'] = options.chunk_size
+        kwargs['bandwidth'] = options.bandwidth
+        kwargs['archive'] = options.archive
+    else:
+        kwargs['cache'] = options.cache
+        kwargs['compression'] = options.compression
+
+    return kwargs
+
+
+def run_cell(cell, kwargs):
+    """
+    Runs a single benchmark cell. The codec's C{setUp} and C{tearDown} are
+    timed as their own phases and recorded under the C{setup} and
+    C{teardown} keys of the result, and a L{schedule.snapshot} of the
+    machine taken before and after is recorded under C{environment}.
+
+    The codec is imported before C{setUp} is timed, and instances are reused
+    within a process, so C{setup} and the C{first_call} of the result are
+    only cold in the first cell of each codec run by an interpreter (every
+    cell with C{--jobs}).
+
+    @param kwargs: See L{get_bench_kwargs}.
+
+    @return: A tuple containing C{cell}, the codec package name and the result
+        of the benchmark.
+    """
+    type, b, encoding, size, c = cell
+
+    package = codec.get_implementation(c)
+
+    before = schedule.snapshot()
+
+    start = timer.clock()
+    package.setUp()
+    setup = timer.clock() - start
+
+    func = getattr(amfbench, type)
+
+    try:
+        result = func(package, b, size, encoding, **kwargs)
+    finally:
+        start = timer.clock()
+        package.tearDown()
+        teardown = timer.clock() - start
+
+    if result is not None:
+        result['version'] = package.version
+        result['setup'] = setup
+        result['teardown'] = teardown
+        result['environment'] = {
+            'before': before,
+            'after': schedule.snapshot(),
+        }
+
+    return cell, package.package, result
 
-            for size in n:
-                r = t.setdefault(size, {})
 
-                for c in options.impl:
-                    package = codec.get_implementation(c)
+def _exec_cell(args):
+    """
+    Runs a cell in a fresh interpreter (see L{cell_script}).
+    """
+    import subprocess
+    import cPickle as pickle
+
+    slot, cell, kwargs = args
+
+    p = subprocess.Popen([sys.executable, '-c', cell_script, root],
+        stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+    out, err = p.communicate(pickle.dumps((cell, kwargs),
+        pickle.HIGHEST_PROTOCOL))
+
+    if p.returncode != 0:
+        raise RuntimeError('%s %s-%d.amf%d with %s failed (exit status %d)' % (
+            cell[0], cell[1], cell[3], cell[2], cell[4], p.returncode))
+
+    return (slot,) + pickle.loads(out)
+
+
+def _describe(options, trial, cell, kwargs):
+    msg = '%s %s-%d.amf%d with %s' % (cell[0], get_label(options, cell[1]),
+        cell[3], cell[2], cell[4])
+
+    if len(options.gc_policies) > 1:
+        msg += ' [gc=%s]' % (kwargs['gc_policy'],)
+
+    if options.trials > 1:
+        msg += ' (trial %d)' % (trial + 1,)
+
+    return msg
+
+
+def _run_cells(options, tasks):
+    """
+    Generates the results of C{tasks}, a list of C{(trial, (cell, kwargs))}
+    in the order to run them (see L{schedule.order}), as C{(slot, cell,
+    package, result)} where C{slot} is the index of the task. If
+    C{options.jobs} is set, each cell is run in a freshly executed
+    interpreter (see L{cell_script}), C{options.jobs} at a time, so that
+    codecs cannot contaminate each other. Nothing is inherited from this
+    process, which may have imported the codecs to verify them (see
+    L{verify_cells}).
+    """
+    if options.jobs is None:
+        for slot, (trial, (cell, kwargs)) in enumerate(tasks):
+            options.logger.log(_describe(options, trial, cell, kwargs))
+
+            yield (slot,) + run_cell(cell, kwargs)
+
+        return
+
+    import multiprocessing
+    from multiprocessing.pool import ThreadPool
+
+    jobs = options.jobs or multiprocessing.cpu_count()
+
+    # the threads only wait on the interpreters that run the cells
+    pool = ThreadPool(jobs)
+
+    try:
+        it = pool.imap_unordered(_exec_cell, [(slot, cell, kwargs)
+            for slot, (trial, (cell, kwargs)) in enumerate(tasks)], 1)
+
+        for ret in it:
+            slot = ret[0]
+            trial, (cell, kwargs) = tasks[slot]
+
+            options.logger.log(_describe(options, trial, cell, kwargs))
+
+            yield ret
+
+        pool.close()
+    except:
+        pool.terminate()
+
+        raise
+    finally:
+        pool.join()
+
+
+def get_sample(options, cells):
+    """
+    Returns the cells to verify: the C{options.verify_sample} smallest sizes
+    of each builder, encoding and implementation.
+    """
+    groups = {}
 
-                    package.setUp()
+    for cell in cells:
+        type, b, encoding, size, c = cell
 
-                    func = getattr(amfbench, type)
+        groups.setdefault((b, encoding, c), []).append(cell)
+
+    ret = []
+
+    for group in groups.itervalues():
+        group.sort(key=lambda cell: cell[3])
+        ret.extend(group[:options.verify_sample])
+
+    return ret
+
+
+def verify_cells(options, cells):
+    """
+    Runs L{verify.check} (untimed) for each cell.
+
+    @return: A C{dict} of C{(builder, encoding, implementation)} -> a C{dict}
+        of size -> check result.
+    """
+    ret = {}
+
+    for cell in cells:
+        type, b, encoding, size, c = cell
+
+        options.logger.log('verifying %s %s-%d.amf%d with %s' % (
+            type, get_label(options, b), size, encoding, c))
+
+        package = codec.get_implementation(c)
+        package.setUp()
+
+        try:
+            r = verify.check(package, type, b, size, encoding, options.archive,
+                options.cache, options.params.get(b))
+        finally:
+            package.tearDown()
+
+        ret.setdefault((b, encoding, c), {})[size] = r
+
+    return ret
+
+
+def apply_verification(options, type, cells, results, packages):
+    """
+    Verifies a sample of C{cells} (see L{get_sample}) and marks the
+    C{results} of every codec that failed as unverified.
+
+    @param packages: A C{dict} of implementation -> the set of package labels
+        its results are recorded under.
+    """
+    checks = verify_cells(options, get_sample(options, cells))
+
+    for (b, encoding, c), sizes in checks.iteritems():
+        label = get_label(options, b)
+        ok = all([r['ok'] for r in sizes.itervalues()])
+
+        if not ok:
+            for size, r in sorted(sizes.iteritems()):
+                if not r['ok']:
+                    sys.stderr.write('%s %s-%d.amf%d with %s is WRONG: '
+                        '%s\n' % (type, label, size, encoding, c, r['error']))
+
+        for size, packages_results in results[label][encoding].iteritems():
+            for package in packages[c]:
+                result = packages_results.get(package)
+
+                if result is None:
+                    continue
+
+                result['verified'] = ok
+
+                if size in sizes:
+                    result['verification'] = sizes[size]
+
+
+def _bench(options, args, types):
+    """
+    Runs the benchmarks of each of C{types} (C{decode} and/or C{encode}),
+    every cell C{options.trials} times in the order given by
+    L{schedule.order}, and merges the trials of each cell (see
+    L{schedule.merge}).
+
+    The C{--param}s of each builder are passed on with its cells, and its
+    results are filed under L{get_label}.
+
+    @return: A C{dict} of type -> builder -> encoding -> size -> package ->
+        result.
+    """
+    results = dict([(type, {}) for type in types])
+    cells = {}
+    tasks = []
 
-                    r[package.package] = func(package, b, size, encoding)
+    for type in types:
+        cells[type] = get_cells(options, args, type)
+        kwargs = get_bench_kwargs(options, type)
 
-                    package.tearDown()
+        for gc_policy in options.gc_policies:
+            k = {}
+
+            for b in args:
+                k[b] = dict(kwargs, gc_policy=gc_policy,
+                    params=options.params.get(b))
+
+            tasks.extend([(cell, k[cell[1]]) for cell in cells[type]])
+
+    tasks = schedule.order(tasks, options.trials, options.seed)
+
+    if options.profiler is not None:
+        # profile each cell once, in its first trial
+        tasks = [(trial, (cell, dict(kwargs, profile=None) if trial else
+            kwargs)) for trial, (cell, kwargs) in tasks]
+
+    trials = {}
+    packages = {}
+
+    for slot, cell, package, result in _run_cells(options, tasks):
+        trial, (cell, kwargs) = tasks[slot]
+        type, b, encoding, size, c = cell
+
+        if len(options.gc_policies) > 1:
+            package = '%s[gc=%s]' % (package, kwargs['gc_policy'])
+
+        if result is not None:
+            result['slot'] = slot
+
+        label = get_label(options, b)
+
+        trials.setdefault((type, label, encoding, size, package), {})[
+            trial] = result
+        packages.setdefault(c, set()).add(package)
+
+        if options.profile and result is not None and trial == 0:
+            write_profile(options.profile, (type, label, encoding, size, c),
+                package, result['profile'])
+
+    for (type, b, encoding, size, package), r in trials.iteritems():
+        results[type].setdefault(b, {}).setdefault(encoding, {}).setdefault(
+            size, {})[package] = schedule.merge([r[t] for t in sorted(r)])
+
+    if options.verify:
+        for type in types:
+            apply_verification(options, type, cells[type], results[type],
+                packages)
 
     return results
 
 
-def bench_encoding(options, args):
-    if options.only_decode:
-        return {}
+def write_profile(path, cell, package, profile):
+    """
+    Writes the L{profiler.format_table} (C{.txt}) and, if sampled,
+    L{profiler.format_collapsed} (C{.collapsed}) files for a cell to the
+    directory C{path}.
+    """
+    type, b, encoding, size, c = cell
+
+    if not os.path.isdir(path):
+        os.makedirs(path)
 
-    return _bench(options, args, 'encode')
+    fn = os.path.join(path, '%s-%s-%d.amf%d-%s' % (type, b, size, encoding,
+        package))
 
+    f = open(fn + '.txt', 'wb')
+    f.write(profiler.format_table(profile))
+    f.close()
+
+    if 'collapsed' in profile:
+        f = open(fn + '.collapsed', 'wb')
+        f.write(profiler.format_collapsed(profile))
+        f.close()
+
+
+def bench(options, args):
+    """
+    Runs the decoding and encoding benchmarks (unless C{--only-encode} or
+    C{--only-decode}) together, so that they can be interleaved.
+
+    @return: A tuple of the decode and encode results.
+    """
+    types = []
+
+    if not options.only_encode:
+        if options.sizes is not None:
+            prepare_blobs(options, args)
+
+        types.append('decode')
+
+    if not options.only_decode:
+        types.append('encode')
+
+    results = _bench(options, args, types)
+
+    return results.get('decode', {}), results.get('encode', {})
+
+
+def write_scaling(stream, analysis):
+    """
+    Writes a summary of the L{scaling.analyse} results to C{stream}.
+    """
+    def fmt(f):
+        if f is None:
+            return '%8s' % ('-',)
 
-def bench_decoding(options, args):
-    if options.only_encode:
-        return {}
+        return '%8.3f%s' % (f['exponent'], '!' if f['superlinear'] else ' ')
 
-    return _bench(options, args, 'decode')
+    stream.write('%-7s %-10s %4s %-12s %9s %9s %-15s  %s\n' % ('type',
+        'builder', 'amf', 'package', 'time^k', 'mem^k', 'mem measure',
+        'knees'))
 
+    for type in sorted(analysis):
+        for b in sorted(analysis[type]):
+            for encoding in sorted(analysis[type][b]):
+                r = analysis[type][b][encoding]
 
-def write_pickle(options, decode_results, encode_results):
+                for package in sorted(r):
+                    a = r[package]
+
+                    stream.write('%-7s %-10s %4d %-12s %s %s %-15s  %s\n' % (
+                        type, b, encoding, package, fmt(a['time']),
+                        fmt(a['memory']), a.get('memory_measure') or '-',
+                        ','.join(map(str, sorted(set(a['time_knees'] +
+                            a['memory_knees'])))) or '-'))
+
+    stream.write('(! = super-linear, exponent > %.2f; mem^k - = no memory '
+        'fit, too few positive values of the measure)\n' % (
+        1 + scaling.superlinear_tolerance,))
+
+
+def write_latency(stream, latency):
+    """
+    Writes a summary of the L{wire.model} results to C{stream}: for every
+    cell and link, the uncompressed latency and the fastest compression
+    scheme of each package, fastest first.
+    """
+    stream.write('%-10s %10s %8s  %4s %-12s %12s %12s  %s\n' % ('builder',
+        'size', 'Mbit/s', 'amf', 'package', 'none(ms)', 'best(ms)', 'scheme'))
+
+    rows = {}
+
+    for b, encodings in latency.iteritems():
+        for encoding, sizes in encodings.iteritems():
+            for size, packages in sizes.iteritems():
+                for package, links in packages.iteritems():
+                    for mbit, schemes in links.iteritems():
+                        best = min(schemes, key=schemes.get)
+
+                        rows.setdefault((b, size, mbit), []).append((
+                            schemes[best], encoding, package,
+                            schemes[wire.uncompressed], best))
+
+    for (b, size, mbit), r in sorted(rows.iteritems()):
+        for best, encoding, package, none, scheme in sorted(r):
+            stream.write('%-10s %10d %8g  %4d %-12s %12.4f %12.4f  %s\n' % (b,
+                size, mbit, encoding, package, none * 1e3, best * 1e3,
+                scheme))
+
+
+def write_pickle(options, decode_results, encode_results, **extra):
     import cPickle as pickle
 
     f = None
@@ -171,19 +991,82 @@ def write_pickle(options, decode_results, encode_results):
     else:
         f = sys.stdout
 
-    pickle.dump({
+    data = {
         'decode': decode_results,
         'encode': encode_results
-    }, f, pickle.HIGHEST_PROTOCOL)
+    }
+
+    data.update(extra)
+
+    pickle.dump(data, f, pickle.HIGHEST_PROTOCOL)
 
 
 def main(*args):
     options, args = parse_args(*args)
 
-    decode_results = bench_decoding(options, args)
-    encode_results = bench_encoding(options, args)
+    if options.seed is not None:
+        options.logger.log('shuffling with seed %d' % (options.seed,))
+
+    extra = {
+        'schedule': {
+            'trials': options.trials,
+            'seed': options.seed,
+            'cpus': schedule.get_affinity(),
+            'environment': schedule.snapshot(),
+        },
+    }
+
+    decode_results, encode_results = bench(options, args)
+
+    if options.cache is not None and options.jobs is None:
+        c = options.cache
+
+        options.logger.log('payload cache: %d hits, %d misses, %d evictions, '
+            '%.1f MB held' % (c.hits, c.misses, c.evictions,
+            c.size / (1024.0 * 1024.0)))
+
+    if options.imports:
+        options.logger.log('measuring imports')
+
+        extra['imports'] = imports.measure(options.impl, options.imports)
+
+    if options.sizes is not None:
+        extra['scaling'] = {
+            'decode': scaling.analyse(decode_results),
+            'encode': scaling.analyse(encode_results),
+        }
+
+        write_scaling(sys.stderr, extra['scaling'])
+
+    if options.links:
+        extra['latency'] = wire.model(decode_results, encode_results,
+            options.links)
+
+        write_latency(sys.stderr, extra['latency'])
+
+    if options.store:
+        db = store.connect(None if options.store == 'default' else
+            options.store)
+
+        run_id = store.save_run(db, {
+            'decode': decode_results,
+            'encode': encode_results,
+            'imports': extra.get('imports'),
+        })
+
+        options.logger.log('saved run %d to %s' % (run_id, options.store))
+
+    if options.report:
+        f = open(options.report, 'wb')
+
+        f.write(report.render({
+            'decode': decode_results,
+            'encode': encode_results
+        }, options.baseline))
+
+        f.close()
 
-    write_pickle(options, decode_results, encode_results)
+    write_pickle(options, decode_results, encode_results, **extra)
 
 
 if __name__ == '__main__':
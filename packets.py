@@ -0,0 +1,216 @@
+#!/usr/bin/env python
+"""
+Benchmarks the remoting envelope: how long it takes to route a packet (parse
+the envelope and find the service for each message, see
+L{amfbench.remoting}) compared with decoding the whole packet (every header
+and message body) with each codec.
+
+Packets look like those sent by a Flex client, with C{--headers} headers and
+C{--messages} batched messages that each carry the builder's payload.
+"""
+
+import sys
+from optparse import OptionParser
+
+from amfbench import codec, builder, timer, amf, remoting
+
+
+def build_packet(builder_name, size, amf_version, headers=2, messages=3,
+        params=None):
+    """
+    Returns a request packet with C{headers} headers and C{messages}
+    messages calling C{[label]-[size]} (see L{builder.label}).
+    """
+    payload = builder.build(builder_name, size, **(params or {}))
+    amf3 = amf_version == 3
+
+    body = remoting.encode_arguments([amf.dumps(payload, amf3)], amf3)
+    target = '%s-%d' % (builder.label(builder_name, params), size)
+
+    return remoting.encode_packet(amf_version,
+        [('header%d' % (i,), i == 0, amf.dumps({'id': i, 'token': 'x' * 32},
+            False)) for i in xrange(headers)],
+        [(target, '/%d' % (i + 1,), body) for i in xrange(messages)])
+
+
+def route(data, services):
+    """
+    Parses the envelope of C{data} and looks up the service for each message,
+    without decoding anything.
+
+    @return: A list of C{(service, message)}.
+    """
+    packet = remoting.parse(data)
+
+    return [(services.get(m.target), m) for m in packet.messages]
+
+
+def decode_packet(c, data):
+    """
+    Parses C{data} and decodes every header and message value with the codec
+    C{c}.
+
+    @return: A tuple of the decoded header values and message values.
+    """
+    packet = remoting.parse(data)
+
+    headers = [c.decode(packet.get_bytes(h), False) for h in packet.headers]
+    messages = [c.decode(packet.get_bytes(m), False)
+        for m in packet.messages]
+
+    return headers, messages
+
+
+def bench_envelope(data, objects, policy=None):
+    """
+    Times L{route} for C{data}.
+
+    @return: See L{timer.summarise}.
+    """
+    packet = remoting.parse(data)
+    services = dict([(m.target, None) for m in packet.messages])
+
+    samples, ret, warmups = timer.run(policy, route, data, services)
+
+    return timer.summarise(samples, objects, len(data), warmups)
+
+
+def bench_packet(c, data, objects, policy=None):
+    """
+    Times L{decode_packet} for C{data} with the codec C{c}.
+
+    @return: See L{timer.summarise}, or C{None} if the codec failed.
+    """
+    c.setUp()
+
+    try:
+        samples, ret, warmups = timer.run(policy, decode_packet, c, data)
+    except Exception:
+        return None
+    finally:
+        c.tearDown()
+
+    return timer.summarise(samples, objects, len(data), warmups)
+
+
+def parse_args(*args):
+    """
+    Parse and validate command line arguments.
+    """
+    parser = OptionParser(usage='%prog [options] [builder ...]',
+        description='Compares routing remoting packets by envelope alone '
+        'with fully decoding them. Defaults to all builders.')
+
+    impl = codec.get_available_implementations()
+    amf_encodings = ('0', '3')
+
+    parser.add_option('-s', '--size', action='append', dest='sizes',
+        type='int', help='Number of objects in each message. May be supplied '
+        'multiple times. Default is 100')
+    parser.add_option('-p', '--param', action='append', dest='params',
+        default=None, metavar='BUILDER.KEY=VALUE', help='Set a parameter of a '
+        'builder, e.g. nested.depth=10. May be supplied multiple times')
+    parser.add_option('-e', '--encoding', action='append', dest='encodings',
+        choices=amf_encodings, help='AMF version/s of the packets. '
+        'Choices are %r. Defaults to all.' % (amf_encodings,))
+    parser.add_option('-i', '--implementation', action='append', dest='impl',
+        help='Codec to decode with. Choices are %r, or NAME:VARIANT for one '
+        'of the variants of a codec and NAME:all for the codec and every one '
+        'of its variants. Defaults to all that can be imported.' % (impl,))
+    parser.add_option('--headers', dest='headers', type='int', default=2,
+        help='Number of headers in each packet. Default is %default')
+    parser.add_option('--messages', dest='messages', type='int', default=3,
+        help='Number of messages in each packet. Default is %default')
+    parser.add_option('-n', '--iterations', dest='iterations', type='int',
+        default=5, help='Minimum number of timed calls. Default is %default')
+    parser.add_option('-w', '--warmup', dest='warmup', type='int', default=1,
+        help='Number of untimed calls first. Default is %default')
+    parser.add_option('-o', '--out', action='store', dest='output',
+        default=None, help='Also write a pickle of the results here')
+
+    options, args = parser.parse_args()
+
+    if not args:
+        args = builder.builders
+    else:
+        for a in args:
+            if a not in builder.builders:
+                parser.error("%s is not a valid builder, choose from %r" % (
+                    a, builder.builders))
+
+    try:
+        options.params = builder.parse_params(options.params)
+    except ValueError, e:
+        parser.error(str(e))
+
+    if options.sizes is None:
+        options.sizes = [100]
+
+    if options.encodings is None:
+        options.encodings = amf_encodings
+
+    options.encodings = map(int, options.encodings)
+
+    try:
+        options.impl, skipped = codec.resolve_implementations(options.impl)
+    except NameError, e:
+        parser.error('%s, choose from %r' % (e, impl))
+
+    if options.headers < 0 or options.messages < 1:
+        parser.error('Packets need >= 0 headers and >= 1 messages')
+
+    try:
+        options.policy = timer.Policy(warmup=options.warmup,
+            iterations=options.iterations)
+    except ValueError, e:
+        parser.error(str(e))
+
+    return options, args
+
+
+def main(*args):
+    options, args = parse_args(*args)
+
+    codecs = [codec.get_implementation(name) for name in options.impl]
+
+    results = {'envelope': {}, 'packet': {}}
+
+    print '%-10s %3s %8s %9s  %-10s %10s %10s' % ('builder', 'amf', 'size',
+        'bytes', 'package', 'route(ms)', 'decode(ms)')
+
+    for b in args:
+        params = options.params.get(b)
+        label = builder.label(b, params)
+
+        for encoding in options.encodings:
+            for size in options.sizes:
+                data = build_packet(b, size, encoding, options.headers,
+                    options.messages, params)
+                objects = size * options.messages
+
+                env = bench_envelope(data, objects, options.policy)
+
+                results['envelope'].setdefault(label, {}).setdefault(encoding,
+                    {})[size] = env
+
+                for c in codecs:
+                    r = bench_packet(c, data, objects, options.policy)
+
+                    results['packet'].setdefault(label, {}).setdefault(
+                        encoding, {}).setdefault(size, {})[c.package] = r
+
+                    print '%-10s %3d %8d %9d  %-10s %10.4f %10s' % (label,
+                        encoding, size, len(data), c.package,
+                        env['median'] * 1e3, r and '%.4f' % (
+                            r['median'] * 1e3,) or 'failed')
+
+    if options.output:
+        import cPickle as pickle
+
+        f = open(options.output, 'wb')
+        pickle.dump(results, f, pickle.HIGHEST_PROTOCOL)
+        f.close()
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:])
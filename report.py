@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+"""
+Turns one or more C{mark.py} result pickles into a static HTML report with
+log-log time vs size charts and throughput tables.
+"""
+
+import sys
+import cPickle as pickle
+from optparse import OptionParser
+
+from amfbench import report
+
+
+def parse_args(*args):
+    """
+    Parse and validate command line arguments.
+    """
+    parser = OptionParser(usage='%prog [options] RESULTS [RESULTS ...]',
+        description='Renders mark.py result pickles as HTML. When several '
+        'files are given, later files take precedence for the same cell.')
+
+    parser.add_option('-o', '--out', dest='output', default=None,
+        help='Where to write the report. Default is stdout')
+    parser.add_option('-b', '--baseline', dest='baseline', default=None,
+        help='Package that speed-up ratios are relative to (e.g. pyamf)')
+    parser.add_option('-t', '--title', dest='title',
+        default='AMFBench report', help='Title of the report')
+
+    options, args = parser.parse_args()
+
+    if not args:
+        parser.error('Supply at least one result file')
+
+    return options, args
+
+
+def main(*args):
+    options, args = parse_args(*args)
+
+    data = []
+
+    for fn in args:
+        f = open(fn, 'rb')
+
+        try:
+            data.append(pickle.load(f))
+        finally:
+            f.close()
+
+    html = report.render(report.merge(*data), options.baseline, options.title)
+
+    if options.output:
+        f = open(options.output, 'wb')
+    else:
+        f = sys.stdout
+
+    f.write(html)
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:])
@@ -1,16 +1,30 @@
 """
 Provides a simple AMF remoting gateway that will strip the remoting wrapper and
 dump the raw payload. Use in conjunction with C{amfbench/flex/main.swf}
+
+With C{--gateway codec} the gateway instead decodes the request with one of
+the L{amfbench.codec} implementations, calls a trivial service and encodes a
+real response, so that the whole request path can be measured.
 """
 
+import os
 import os.path
 import sys
 import logging
 from optparse import OptionParser
-import struct
 import mimetypes
+import socket
+import signal
+import threading
+import Queue
+import urllib
+import asyncore
+import asynchat
+from cStringIO import StringIO
+from wsgiref import simple_server
 
 import amfbench
+from amfbench import codec, timer, remoting
 
 
 class BaseMiddleware(object):
@@ -21,6 +35,15 @@ class BaseMiddleware(object):
     def __init__(self, app):
         self.app = app
 
+    def close(self):
+        """
+        Called when the server shuts down. Passed on to the wrapped app.
+        """
+        close = getattr(self.app, 'close', None)
+
+        if close is not None:
+            close()
+
 
 class CrossdomainMiddleware(BaseMiddleware):
     """
@@ -90,45 +113,35 @@ class DecodingGeneratorGateway(BaseMiddleware):
 
     @staticmethod
     def strip_envelope(bytes):
-        amf_version = struct.unpack('!H', bytes[:2])[0]
-
-        assert bytes[2:6] == '\x00\x00\x00\x01'
-        l = struct.unpack('!H', bytes[6:8])[0]
-
-        service_method = bytes[8:l+8]
-        bytes = bytes[l+8:]
+        """
+        Returns the builder name, size, AMF version, response URI and
+        payload of the first message of the remoting packet C{bytes}.
+        Headers and any other messages are ignored.
+        """
+        packet = remoting.parse(bytes)
 
-        l = struct.unpack('!H', bytes[0:2])[0]
-        uid = bytes[2:l+2]
+        if not packet.messages:
+            raise remoting.RemotingError('Packet contains no messages')
 
-        bytes = bytes[l+2:]
+        message = packet.messages[0]
+        count, offset, length, amf3 = remoting.get_arguments(bytes,
+            message.offset, message.length)
 
-        if amf_version == 0:
-            boundary = '\n\x00\x00\x00\x01'
-        elif amf_version == 3:
-            boundary = '\x00\x00\x00\x01\x11'
-        else:
-            raise RuntimeError('Unknown AMF type')
-
-        bytes = bytes[bytes.find(boundary) + len(boundary):]
-
-        builder_name, size = service_method.split('-')
+        builder_name, size = message.target.rsplit('-', 1)
 
-        return builder_name, size, amf_version, uid, bytes
+        return (builder_name, size, packet.version, message.response,
+            bytes[offset:offset + length])
 
     @staticmethod
-    def generate_response(uid):
-        # return an empty success response
-        ret = '\x00\x00\x00\x00\x00\x01'
-
-        s = '%s/onResult' % (uid,)
-
-        ret += struct.pack('!H', len(s))
-        ret += s
+    def generate_response(uid, body='\x05', amf_version=0):
+        """
+        Builds a remoting envelope containing a single success response.
 
-        ret += '\x00\x04null\x00\x00\x00\x00\x05'
-
-        return ret
+        @param body: The encoded response value. Defaults to AMF0 C{null}.
+            AMF3 values must be prefixed with the AMF3 switch marker.
+        """
+        return remoting.encode_packet(amf_version,
+            messages=[('%s/onResult' % (uid,), 'null', body)])
 
     def __call__(self, environ, start_response):
         if environ['PATH_INFO'] != self.url:
@@ -172,17 +185,157 @@ class DecodingGeneratorGateway(BaseMiddleware):
         return [ret]
 
 
+def echo(payload):
+    return payload
+
+
+def reverse(payload):
+    return payload[::-1]
+
+
+#: The services that L{CodecGateway} can dispatch to.
+services = {
+    'echo': echo,
+    'reverse': reverse,
+}
+
+
+class CodecGateway(DecodingGeneratorGateway):
+    """
+    Accepts Flash Remoting requests, decodes the body with an
+    L{amfbench.codec} implementation, passes the result through C{service}
+    and responds with the encoded return value.
+
+    The time spent in each phase of the request is returned in the
+    C{X-AMFBench-Timing} header.
+
+    @ivar codec: The L{amfbench.codec.ICodec} instance.
+    @ivar service: A callable that accepts the decoded payload and returns the
+        response payload.
+    """
+
+    phases = ('parse', 'decode', 'dispatch', 'encode')
+
+    def __init__(self, app, codec, service):
+        DecodingGeneratorGateway.__init__(self, app)
+
+        self.codec = codec
+        self.service = service
+
+        self.codec.setUp()
+
+    def close(self):
+        self.codec.tearDown()
+
+        DecodingGeneratorGateway.close(self)
+
+    def handle(self, bytes):
+        """
+        Processes the raw request C{bytes}.
+
+        @return: A tuple containing the raw response and a list of the time
+            taken by each of L{phases}.
+        """
+        clock = timer.clock
+        t0 = clock()
+
+        builder_name, size, amf_version, uid, bytes = self.strip_envelope(
+            bytes)
+        amf3 = amf_version == 3
+
+        t1 = clock()
+
+        payload = self.codec.decode(bytes, amf3)
+
+        t2 = clock()
+
+        payload = self.service(payload)
+
+        t3 = clock()
+
+        body = self.codec.encode(payload, amf3)
+
+        if amf3:
+            body = '\x11' + body
+
+        ret = self.generate_response(uid, body, amf_version)
+
+        t4 = clock()
+
+        return ret, [t1 - t0, t2 - t1, t3 - t2, t4 - t3]
+
+    def __call__(self, environ, start_response):
+        if environ['PATH_INFO'] != self.url:
+            return self.app(environ, start_response)
+
+        if environ.get('REQUEST_METHOD', 'GET') == 'GET':
+            start_response('400 Bad Request', [])
+
+            return ['This gateway only accepts POST requests']
+
+        bytes = environ['wsgi.input'].read(int(environ['CONTENT_LENGTH']))
+
+        try:
+            ret, timings = self.handle(bytes)
+        except Exception, e:
+            logging.exception('Error handling request')
+
+            start_response('500 Internal Server Error', [
+                ('Content-Type', 'text/plain')
+            ])
+
+            return ['%s: %s' % (e.__class__.__name__, e)]
+
+        start_response('200 OK', [
+            ('Content-Length', str(len(ret))),
+            ('Content-Type', 'application/x-amf'),
+            ('X-AMFBench-Timing', ','.join(['%s=%.9f' % x
+                for x in zip(self.phases, timings)]))
+        ])
+
+        return [ret]
+
+
 def build_argparse():
     parser = OptionParser()
 
+    impl = codec.get_available_implementations()
+
     parser.add_option("--iface", default='127.0.0.1', dest='iface',
         help='The network interface to bind to. Supply 0.0.0.0 for all')
     parser.add_option("--port", default=8080, type='int', dest='port',
         help='The port to bind to.')
+    parser.add_option("--gateway", default='dump', dest='gateway',
+        choices=('dump', 'codec'), help='dump: write request bodies to var/ '
+        'for the decoding benchmarks (default). codec: decode and respond '
+        'using --codec')
+    parser.add_option("--codec", default='pyamf', dest='codec',
+        help='The codec used by --gateway codec. Choices are %r, or '
+        'NAME:VARIANT for one of the variants of a codec (e.g. '
+        'amfast:nocollections). Default is %%default' % (impl,))
+    parser.add_option("--service", default='echo', dest='service',
+        choices=sorted(services), help='The service called by --gateway '
+        'codec. Choices are %r. Default is %%default' % (sorted(services),))
+    parser.add_option("--backend", default='simple', dest='backend',
+        choices=backends, help='simple: one request at a time (default). '
+        'threaded: a pool of --workers threads. prefork: --workers processes. '
+        'async: an event loop per process (--workers processes)')
+    parser.add_option("--workers", default=4, type='int', dest='workers',
+        help='Number of worker threads/processes. Default is %default')
 
     return parser
 
 
+class QuietWSGIRequestHandler(simple_server.WSGIRequestHandler):
+    """
+    Does not log every request; the concurrent backends are meant to be put
+    under load.
+    """
+
+    def log_request(self, *args, **kwargs):
+        pass
+
+
 class Redirector(BaseMiddleware):
     """
     Redirects from one url to another
@@ -208,7 +361,19 @@ class Redirector(BaseMiddleware):
 def parse_options():
     parser = build_argparse()
 
-    return parser.parse_args()
+    options, args = parser.parse_args()
+
+    if options.workers < 1:
+        parser.error('workers must be >= 1 (got %r)' % (options.workers,))
+
+    if options.gateway == 'codec':
+        try:
+            codec.get_implementation(options.codec)
+        except NameError, e:
+            parser.error('%s, choose from %r' % (e,
+                codec.get_available_implementations()))
+
+    return options, args
 
 
 def get_app(options):
@@ -220,26 +385,260 @@ def get_app(options):
     app = four_oh_four
     app = Redirector(app, '/', '/flex/DecodingGenerator.swf')
     app = CrossdomainMiddleware(app)
-    app = DecodingGeneratorGateway(app)
+
+    if getattr(options, 'gateway', 'dump') == 'codec':
+        app = CodecGateway(app, codec.get_implementation(options.codec),
+            services[options.service])
+    else:
+        app = DecodingGeneratorGateway(app)
+
     app = ServeStatic(app, 'flex', '/flex/')
 
     return app
 
 
-def run_server(options):
-    from wsgiref import simple_server
+class ThreadPoolWSGIServer(simple_server.WSGIServer):
+    """
+    A WSGI server that hands each accepted connection to one of a fixed pool
+    of worker threads.
+    """
+
+    def __init__(self, server_address, handler_class, workers):
+        simple_server.WSGIServer.__init__(self, server_address, handler_class)
+
+        self.requests = Queue.Queue()
+
+        for i in xrange(workers):
+            t = threading.Thread(target=self.process_requests)
+            t.daemon = True
+
+            t.start()
+
+    def process_request(self, request, client_address):
+        self.requests.put((request, client_address))
+
+    def process_requests(self):
+        while True:
+            request, client_address = self.requests.get()
+
+            try:
+                self.finish_request(request, client_address)
+            except Exception:
+                self.handle_error(request, client_address)
+
+            self.shutdown_request(request)
+
+
+class AsyncWSGIChannel(asynchat.async_chat):
+    """
+    Reads a single HTTP request, calls the WSGI application and writes the
+    response before closing the connection.
+    """
+
+    def __init__(self, sock, client_address, server):
+        asynchat.async_chat.__init__(self, sock)
+
+        self.client_address = client_address
+        self.server = server
+        self.buffer = []
+        self.environ = None
 
-    httpd = simple_server.WSGIServer(
-        (options.iface, options.port),
-        simple_server.WSGIRequestHandler,
-    )
+        self.set_terminator('\r\n\r\n')
 
-    httpd.set_app(get_app(options))
+    def collect_incoming_data(self, data):
+        self.buffer.append(data)
+
+    def found_terminator(self):
+        data = ''.join(self.buffer)
+        self.buffer = []
+
+        if self.environ is not None:
+            self.handle_request(data)
+
+            return
+
+        self.environ = self.get_environ(data)
+
+        l = int(self.environ.get('CONTENT_LENGTH') or 0)
+
+        if l:
+            self.set_terminator(l)
+        else:
+            self.handle_request('')
+
+    def get_environ(self, data):
+        lines = data.split('\r\n')
+        method, path, protocol = lines[0].split(' ', 2)
+        path, _, query = path.partition('?')
+
+        environ = {
+            'REQUEST_METHOD': method,
+            'PATH_INFO': urllib.unquote(path),
+            'QUERY_STRING': query,
+            'SERVER_NAME': self.server.server_name,
+            'SERVER_PORT': str(self.server.server_port),
+            'SERVER_PROTOCOL': protocol,
+            'REMOTE_ADDR': self.client_address[0],
+            'SCRIPT_NAME': '',
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': 'http',
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': False,
+            'wsgi.multiprocess': True,
+            'wsgi.run_once': False,
+        }
+
+        for line in lines[1:]:
+            key, _, value = line.partition(':')
+            key = key.strip().upper().replace('-', '_')
+            value = value.strip()
+
+            if key in ('CONTENT_LENGTH', 'CONTENT_TYPE'):
+                environ[key] = value
+            else:
+                environ['HTTP_' + key] = value
+
+        return environ
+
+    def handle_request(self, body):
+        environ = self.environ
+        environ['wsgi.input'] = StringIO(body)
+
+        response = []
+
+        def start_response(status, headers, exc_info=None):
+            response[:] = [status, headers]
+
+        try:
+            data = ''.join(self.server.app(environ, start_response))
+        except Exception:
+            logging.exception('Error handling request')
+
+            response[:] = ['500 Internal Server Error', []]
+            data = ''
+
+        status, headers = response
+
+        head = ['HTTP/1.0 %s' % (status,)]
+        head.extend(['%s: %s' % h for h in headers])
+
+        if 'content-length' not in [h[0].lower() for h in headers]:
+            head.append('Content-Length: %d' % (len(data),))
+
+        head.append('Connection: close')
+
+        self.push('\r\n'.join(head) + '\r\n\r\n' + data)
+        self.close_when_done()
+
+
+class AsyncWSGIServer(asyncore.dispatcher):
+    """
+    A single threaded, event driven WSGI server.
+    """
+
+    def __init__(self, server_address, app):
+        asyncore.dispatcher.__init__(self)
+
+        self.app = app
+
+        self.create_socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.set_reuse_addr()
+        self.bind(server_address)
+        self.listen(128)
+
+        self.server_name, self.server_port = self.socket.getsockname()[:2]
+
+    def handle_accept(self):
+        pair = self.accept()
+
+        if pair is None:
+            return
+
+        AsyncWSGIChannel(pair[0], pair[1], self)
+
+    def serve_forever(self):
+        asyncore.loop(use_poll=True)
+
+
+def fork_workers(workers, func):
+    """
+    Forks C{workers} child processes that each call C{func}, then waits for
+    them all to exit.
+    """
+    children = []
+
+    for i in xrange(workers):
+        pid = os.fork()
+
+        if pid == 0:
+            try:
+                func()
+            except KeyboardInterrupt:
+                pass
+
+            os._exit(0)
+
+        children.append(pid)
 
     try:
-        httpd.serve_forever()
+        for pid in children:
+            os.waitpid(pid, 0)
     except KeyboardInterrupt:
-        pass
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except OSError:
+                pass
+
+
+#: The available server backends.
+backends = ('simple', 'threaded', 'prefork', 'async')
+
+
+def make_server(options, app):
+    """
+    Builds the server for C{options.backend}.
+    """
+    address = (options.iface, options.port)
+    backend = getattr(options, 'backend', 'simple')
+
+    if backend == 'async':
+        return AsyncWSGIServer(address, app)
+
+    if backend == 'threaded':
+        httpd = ThreadPoolWSGIServer(address, QuietWSGIRequestHandler,
+            options.workers)
+    elif backend in ('simple', 'prefork'):
+        httpd = simple_server.WSGIServer(address,
+            simple_server.WSGIRequestHandler if backend == 'simple' else
+            QuietWSGIRequestHandler)
+    else:
+        raise ValueError('Unknown backend %r' % (backend,))
+
+    httpd.set_app(app)
+
+    return httpd
+
+
+def run_server(options):
+    app = get_app(options)
+    httpd = make_server(options, app)
+    backend = getattr(options, 'backend', 'simple')
+
+    try:
+        if backend == 'prefork' or (backend == 'async' and
+                options.workers > 1):
+            fork_workers(options.workers, httpd.serve_forever)
+
+            return
+
+        try:
+            httpd.serve_forever()
+        except KeyboardInterrupt:
+            pass
+    finally:
+        # the workers exit without this, their copy of the app is discarded
+        app.close()
 
 
 if __name__ == '__main__':